@@ -3,7 +3,9 @@
 # - Depends: per le dipendenze tra funzioni
 # - HTTPException: per gestire gli errori HTTP
 # - status: costanti per i codici di stato HTTP
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 
 # Middleware per gestire le richieste CORS (Cross-Origin Resource Sharing)
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,23 +15,84 @@ from fastapi.security import HTTPBearer
 
 # Importazione per gestire le sessioni del database
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
 import os
 
 # Importazioni locali per la configurazione del database e i modelli
-from backend.services.database import get_db, engine, Base
+from backend.services.database import get_db, get_async_db, engine, Base, async_engine, pool_stats
+from backend.services.validation_queue import queue_stats
 
 # Importazione di tutti i router dell'applicazione
-from backend.routers import auth, question, answer, validate, leaderboard
+from backend.routers import auth, question, answer, validate, leaderboard, jobs, quotas
+
+# Servizio LLM condiviso (il suo client HTTP va chiuso allo spegnimento)
+from backend.services.llm_service import llm_service
+
+# Errori del controllo di ammissione verso Ollama (circuito aperto, sovraccarico)
+from backend.services.llm_admission import LLMAdmissionError
+from backend.services.llm_judge import llm_judge
+
+# Quote di chiamate al modello per utente, IP ed endpoint
+from backend.services.quotas import QuotaCostTooHigh, QuotaExceeded, quota_manager
+
+# Warm-up dei modelli e stato di readiness
+from backend.services.llm_warmup import model_warmup
+
+# Pool di thread per l'hashing bcrypt delle password
+from backend.services.password_hasher import password_hasher
+
+# Cache degli utenti autenticati usata da get_current_user
+from backend.services.principal_cache import principal_cache
+
+# Cache in memoria dei temi culturali (caricata all'avvio)
+from backend.services.reference_cache import theme_cache
+
+# Indice in memoria della classifica (costruito dal database all'avvio)
+from backend.services.leaderboard_index import leaderboard_index
+
+# Coda persistente dei job LLM (i worker locali partono con l'applicazione)
+from backend.services.jobs import job_queue, JOB_WORKERS
+
+# Metriche in formato Prometheus (i collector esportano cache, pool e ammissione LLM)
+from backend.services.metrics import CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry
+import backend.services.metrics_collectors  # noqa: F401 (registra i collector)
 
 # Importazione degli schemi Pydantic per la validazione dei dati
 from backend.models.schemas import UserCreate, UserLogin, Token
 
-# Creazione delle tabelle nel database se non esistono
-# Questo comando utilizza i modelli SQLAlchemy per generare lo schema
-Base.metadata.create_all(bind=engine)
+# Migrazioni del database (Alembic): crea le tabelle e gli indici mancanti
+# portando lo schema all'ultima revisione in backend/migrations/versions;
+# con DB_AUTO_MIGRATE disattivato l'avvio fallisce se lo schema non è aggiornato
+from backend.services.migrations import run_migrations, check_schema, DB_AUTO_MIGRATE
+if DB_AUTO_MIGRATE:
+    run_migrations()
+else:
+    check_schema()
+
+# Ciclo di vita dell'applicazione
+# - All'avvio parte il pool di worker della coda job (JOB_WORKERS, 0 = nessuno)
+#   e in background il warm-up dei modelli (l'avvio non attende il caricamento)
+#   e la costruzione dell'indice della classifica; i temi vengono caricati in memoria
+# - Allo spegnimento ferma worker e sonda, chiude il pool di connessioni verso Ollama
+#   e il pool di thread dell'hashing delle password
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await theme_cache.load()
+    job_queue.start(JOB_WORKERS)
+    model_warmup.start()
+    leaderboard_index.start()
+    yield
+    await leaderboard_index.stop()
+    await model_warmup.stop()
+    await job_queue.stop()
+    await llm_service.aclose()
+    await quota_manager.aclose()
+    password_hasher.shutdown()
+    await async_engine.dispose()
 
 # Inizializzazione dell'applicazione FastAPI con titolo e versione
-app = FastAPI(title="CulturaLLM API", version="1.0.0")
+app = FastAPI(title="CulturaLLM API", version="1.0.0", lifespan=lifespan)
 
 # Configurazione del middleware CORS
 # Permette le richieste da:
@@ -41,8 +104,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursore della pagina successiva nelle liste paginate
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Latenza, esito e richieste in corso per ogni route (esposte su /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Le richieste al modello non ammesse (circuito aperto o capacità esaurita)
+# vengono rifiutate con 503 e l'header Retry-After
+@app.exception_handler(LLMAdmissionError)
+async def llm_admission_error_handler(request: Request, exc: LLMAdmissionError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
+# Le richieste oltre la quota di chiamate al modello vengono rifiutate con 429
+# e l'header Retry-After
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    retry_after = max(1, int(exc.retry_after + 0.999))
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": exc.detail, "scope": exc.scope, "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+# Una richiesta che costa più della capacità dei bucket non sarebbe mai
+# ammessa: viene rifiutata con 400 e il numero massimo di elementi
+@app.exception_handler(QuotaCostTooHigh)
+async def quota_cost_too_high_handler(request: Request, exc: QuotaCostTooHigh):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"detail": exc.detail, "max_items": exc.max_items},
+    )
+
 # Inclusione dei router per organizzare gli endpoint
 # Ogni router gestisce una specifica area funzionale dell'API
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])                 # Gestione autenticazione
@@ -50,6 +148,8 @@ app.include_router(question.router, prefix="/api/questions", tags=["questions"])
 app.include_router(answer.router, prefix="/api/answers", tags=["answers"])         # Gestione risposte
 app.include_router(validate.router, prefix="/api/validate", tags=["validate"])     # Gestione validazioni
 app.include_router(leaderboard.router, prefix="/api/leaderboard", tags=["leaderboard"]) # Gestione classifica
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])                 # Stato della coda job
+app.include_router(quotas.router, prefix="/api/quotas", tags=["quotas"])           # Consumo del modello per utente
 
 # Endpoint per il controllo dello stato dell'API
 # Utilizzato per healthcheck e monitoraggio
@@ -57,6 +157,78 @@ app.include_router(leaderboard.router, prefix="/api/leaderboard", tags=["leaderb
 async def health_check():
     return {"status": "healthy"}
 
+# Readiness: 503 finché il modello non è caricato e risponde alla sonda
+# Da usare per instradare il traffico solo verso istanze con il modello in memoria
+@app.get("/health/ready")
+async def readiness_check():
+    stats = model_warmup.stats()
+    if not stats["ready"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content=jsonable_encoder({"status": "not_ready", **stats}),
+        )
+    return {"status": "ready", **stats}
+
+# Coda delle validazioni: risposte in attesa e lease attivi
+@app.get("/health/validation-queue")
+async def validation_queue_stats(db: AsyncSession = Depends(get_async_db)):
+    return await queue_stats(db)
+
+# Stato dell'indice della classifica (backend, dimensione, ultima ricostruzione)
+@app.get("/health/leaderboard")
+async def leaderboard_index_stats():
+    return await leaderboard_index.stats()
+
+# Metriche in formato testo Prometheus: latenza per route, chiamate a Ollama
+# (durata di caricamento, prompt e generazione, token), cache e pool del database
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE)
+
+# Contatori della cache dei temi (caricamenti, invalidazioni, ETag corrente)
+@app.get("/health/reference-cache")
+async def reference_cache_stats():
+    return theme_cache.stats()
+
+# Contatori della cache degli utenti autenticati
+@app.get("/health/principal-cache")
+async def principal_cache_stats():
+    return principal_cache.stats()
+
+# Contatori dell'hashing delle password (operazioni in coda, tempo medio per hash)
+# Utile per dimensionare PASSWORD_HASH_WORKERS e BCRYPT_ROUNDS
+@app.get("/health/password-hasher")
+async def password_hasher_stats():
+    return password_hasher.stats()
+
+# Stato dei pool di connessioni al database (checkout, attese, overflow)
+# Utile per dimensionare DB_POOL_SIZE e DB_MAX_OVERFLOW
+@app.get("/health/db-pool")
+async def db_pool_stats():
+    return pool_stats()
+
+# Endpoint con i contatori della cache delle risposte LLM
+# Utile per dimensionare LLM_CACHE_SIZE e LLM_CACHE_TTL
+@app.get("/health/llm-cache")
+async def llm_cache_stats():
+    return llm_service.cache.stats()
+
+# Endpoint con lo stato del controllo di ammissione verso Ollama
+# (limite di concorrenza adattivo, coda e circuit breaker)
+@app.get("/health/llm-admission")
+async def llm_admission_stats():
+    return llm_service.admission.stats()
+
+# Contatori delle quote (richieste ammesse e rifiutate per ambito) e limiti configurati
+@app.get("/health/quotas")
+async def quota_stats():
+    return quota_manager.stats()
+
+# Statistiche del giudice LLM (tasso di output non validi e riparazioni)
+@app.get("/health/llm-judge")
+async def llm_judge_stats():
+    return llm_judge.stats()
+
 # Endpoint root che conferma il funzionamento dell'API
 @app.get("/")
 async def root():
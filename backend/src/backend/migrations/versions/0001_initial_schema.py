@@ -0,0 +1,109 @@
+"""Schema iniziale (tabelle create finora da Base.metadata.create_all)
+
+Ogni tabella viene creata solo se non esiste già: i database esistenti,
+creati con create_all o con mariadb_init/init.sql, passano a questa
+revisione senza modifiche.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_table(name, *columns, indexes=(), **kwargs):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns, **kwargs)
+    op.create_index(f"ix_{name}_id", name, ["id"])
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade() -> None:
+    _create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False),
+        sa.Column("email", sa.String(100), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("score", sa.Integer()),
+        sa.Column("badges", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("is_active", sa.Boolean()),
+        indexes=[
+            ("ix_users_username", ["username"], True),
+            ("ix_users_email", ["email"], True),
+        ],
+    )
+    _create_table(
+        "cultural_themes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("description", sa.Text()),
+    )
+    _create_table(
+        "questions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("creator_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("theme_id", sa.Integer(), sa.ForeignKey("cultural_themes.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("tag", sa.String(100), nullable=True),
+    )
+    _create_table(
+        "answers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("question_id", sa.Integer(), sa.ForeignKey("questions.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("is_llm_answer", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    _create_table(
+        "validations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("answer_id", sa.Integer(), sa.ForeignKey("answers.id"), nullable=False),
+        sa.Column("validator_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("is_correct", sa.Boolean(), nullable=False),
+        sa.Column("feedback", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    _create_table(
+        "llm_validations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("answer_id", sa.Integer(), sa.ForeignKey("answers.id"), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("is_correct", sa.Boolean(), nullable=False),
+        sa.Column("feedback", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    _create_table(
+        "validated_tags",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("question_id", sa.Integer(), sa.ForeignKey("questions.id"), nullable=False),
+        sa.Column("tag", sa.String(100), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("user_id", "question_id", name="_user_question_uc"),
+    )
+
+
+def downgrade() -> None:
+    for name in ("validated_tags", "llm_validations", "validations", "answers",
+                 "questions", "cultural_themes", "users"):
+        op.drop_table(name)
@@ -0,0 +1,87 @@
+"""Al massimo una risposta AI per domanda e tabella dei job
+
+- answers.llm_answer_question_id: colonna calcolata (question_id per le
+  risposte AI, NULL altrimenti) con indice univoco. Eventuali risposte AI
+  duplicate già presenti vengono unite nella più vecchia (le validazioni
+  vengono spostate su quella) prima di creare l'indice.
+- jobs: coda persistente del lavoro LLM (services/jobs.py)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _merge_duplicate_llm_answers(conn) -> None:
+    duplicates = conn.execute(sa.text(
+        "SELECT question_id, MIN(id) FROM answers WHERE is_llm_answer = 1 "
+        "GROUP BY question_id HAVING COUNT(*) > 1"
+    )).all()
+    for question_id, keep_id in duplicates:
+        params = {"question_id": question_id, "keep_id": keep_id}
+        duplicate_ids = "SELECT id FROM answers WHERE is_llm_answer = 1 AND question_id = :question_id AND id <> :keep_id"
+        for table in ("validations", "llm_validations"):
+            conn.execute(sa.text(
+                f"UPDATE {table} SET answer_id = :keep_id WHERE answer_id IN "
+                f"(SELECT id FROM ({duplicate_ids}) AS duplicates)"
+            ), params)
+        conn.execute(sa.text(
+            f"DELETE FROM answers WHERE id IN (SELECT id FROM ({duplicate_ids}) AS duplicates)"
+        ), params)
+    if duplicates:
+        print(f"[migrations] Unite le risposte AI duplicate di {len(duplicates)} domande")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    answer_columns = {column["name"] for column in inspector.get_columns("answers")}
+    if "llm_answer_question_id" not in answer_columns:
+        _merge_duplicate_llm_answers(conn)
+        with op.batch_alter_table("answers") as batch_op:
+            batch_op.add_column(sa.Column(
+                "llm_answer_question_id",
+                sa.Integer(),
+                sa.Computed("CASE WHEN is_llm_answer = 1 THEN question_id ELSE NULL END", persisted=True),
+            ))
+        op.create_index("uq_answers_llm_answer_question_id", "answers", ["llm_answer_question_id"], unique=True)
+
+    if not inspector.has_table("jobs"):
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("kind", sa.String(50), nullable=False),
+            sa.Column("payload", sa.Text(), nullable=False),
+            sa.Column("dedup_key", sa.String(191), nullable=True, unique=True),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("max_attempts", sa.Integer(), nullable=False),
+            sa.Column("run_after", sa.DateTime(), nullable=False),
+            sa.Column("locked_until", sa.DateTime(), nullable=True),
+            sa.Column("last_error", sa.Text(), nullable=True),
+            sa.Column("result", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_jobs_id", "jobs", ["id"])
+        op.create_index("ix_jobs_status_run_after", "jobs", ["status", "run_after"])
+
+
+def downgrade() -> None:
+    op.drop_table("jobs")
+    op.drop_index("uq_answers_llm_answer_question_id", table_name="answers")
+    with op.batch_alter_table("answers") as batch_op:
+        batch_op.drop_column("llm_answer_question_id")
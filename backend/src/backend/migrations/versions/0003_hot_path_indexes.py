@@ -0,0 +1,54 @@
+"""Indici composti per le query più frequenti
+
+- answers(question_id, is_llm_answer): risposta AI di una domanda
+- answers(user_id, question_id): l'utente ha già risposto? / domande a cui ha risposto
+- validations(validator_id, answer_id): risposte già validate dall'utente
+- validations(answer_id): validazioni di una risposta
+- llm_validations(answer_id): risposte non ancora validate dal modello
+- questions(is_active, theme_id): elenco delle domande attive per tema
+- questions(tag): domande ancora senza tag (job dei tag)
+- users(is_active, score): classifica
+
+validated_tags(user_id, question_id) è già coperto dal vincolo univoco
+_user_question_uc.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_answers_question_llm", "answers", ["question_id", "is_llm_answer"]),
+    ("ix_answers_user_question", "answers", ["user_id", "question_id"]),
+    ("ix_validations_validator_answer", "validations", ["validator_id", "answer_id"]),
+    ("ix_validations_answer", "validations", ["answer_id"]),
+    ("ix_llm_validations_answer", "llm_validations", ["answer_id"]),
+    ("ix_questions_active_theme", "questions", ["is_active", "theme_id"]),
+    ("ix_questions_tag", "questions", ["tag"]),
+    ("ix_users_active_score", "users", ["is_active", "score"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
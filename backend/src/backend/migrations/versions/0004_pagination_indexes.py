@@ -0,0 +1,60 @@
+"""Indici per la paginazione a cursore (created_at, id)
+
+Le liste paginate filtrano su una colonna e ordinano per (created_at, id):
+- answers(question_id, created_at, id): risposte di una domanda
+- validations(answer_id, created_at, id): validazioni di una risposta
+  (sostituisce validations(answer_id))
+- questions(is_active, created_at, id): elenco delle domande attive
+- questions(is_active, theme_id, created_at, id): domande attive per tema
+  (sostituisce questions(is_active, theme_id))
+- validated_tags(user_id, created_at, id): tag validati di un utente
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_answers_question_created", "answers", ["question_id", "created_at", "id"]),
+    ("ix_validations_answer_created", "validations", ["answer_id", "created_at", "id"]),
+    ("ix_questions_active_created", "questions", ["is_active", "created_at", "id"]),
+    ("ix_questions_active_theme_created", "questions", ["is_active", "theme_id", "created_at", "id"]),
+    ("ix_validated_tags_user_created", "validated_tags", ["user_id", "created_at", "id"]),
+]
+
+# Indici resi superflui da quelli nuovi (stesso prefisso)
+REPLACED = [
+    ("ix_validations_answer", "validations", ["answer_id"]),
+    ("ix_questions_active_theme", "questions", ["is_active", "theme_id"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns)
+    for name, table, _ in REPLACED:
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if name in existing:
+            op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, table, columns in REPLACED:
+        op.create_index(name, table, columns)
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
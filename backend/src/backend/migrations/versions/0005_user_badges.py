@@ -0,0 +1,55 @@
+"""Badge in tabella normalizzata
+
+- user_badges(user_id, badge): un badge assegnato per riga, con indice
+  (badge, user_id) per cercare gli utenti che possiedono un badge
+- i badge già presenti nella stringa users.badges vengono copiati nella
+  tabella; la stringa resta come copia testuale restituita dalle API
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Nomi mostrati -> codici (come in services/badges.py al momento della migrazione)
+BADGE_CODES = {
+    "Bronze Validator": "bronze_validator",
+    "Silver Validator": "silver_validator",
+    "Gold Validator": "gold_validator",
+}
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if sa.inspect(conn).has_table("user_badges"):
+        return
+    user_badges = op.create_table(
+        "user_badges",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("badge", sa.String(50), primary_key=True),
+        sa.Column("awarded_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_user_badges_badge_user", "user_badges", ["badge", "user_id"])
+
+    rows = []
+    for user_id, badges in conn.execute(sa.text("SELECT id, badges FROM users WHERE badges <> ''")):
+        names = {name.strip() for name in (badges or "").split(",")}
+        rows.extend({"user_id": user_id, "badge": BADGE_CODES[name]} for name in names if name in BADGE_CODES)
+    if rows:
+        op.bulk_insert(user_badges, rows)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_badges_badge_user", table_name="user_badges")
+    op.drop_table("user_badges")
@@ -0,0 +1,49 @@
+"""Coda delle validazioni con lease
+
+- answers.validation_count: validazioni ricevute (calcolate per le risposte esistenti)
+- answers.leased_by / lease_expires_at: validatore a cui la risposta è assegnata
+- answers(validation_count, id): risposte in ordine di priorità
+- answers(leased_by, lease_expires_at): lease di un validatore
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(conn).get_columns("answers")}
+    if "validation_count" in columns:
+        return
+    with op.batch_alter_table("answers") as batch_op:
+        batch_op.add_column(sa.Column("validation_count", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("leased_by", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+    conn.execute(sa.text(
+        "UPDATE answers SET validation_count = "
+        "(SELECT COUNT(*) FROM validations WHERE validations.answer_id = answers.id)"
+    ))
+    op.create_index("ix_answers_validation_queue", "answers", ["validation_count", "id"])
+    op.create_index("ix_answers_leased_by", "answers", ["leased_by", "lease_expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_answers_leased_by", table_name="answers")
+    op.drop_index("ix_answers_validation_queue", table_name="answers")
+    with op.batch_alter_table("answers") as batch_op:
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("leased_by")
+        batch_op.drop_column("validation_count")
@@ -0,0 +1,45 @@
+"""Contatore delle risposte per domanda
+
+- questions.answer_count: risposte degli utenti (esclusa quella AI),
+  calcolato per le domande esistenti
+- questions(is_active, answer_count, id) e (is_active, theme_id, answer_count, id):
+  domande da rispondere, prima quelle con meno risposte
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(conn).get_columns("questions")}
+    if "answer_count" in columns:
+        return
+    with op.batch_alter_table("questions") as batch_op:
+        batch_op.add_column(sa.Column("answer_count", sa.Integer(), nullable=False, server_default="0"))
+    conn.execute(sa.text(
+        "UPDATE questions SET answer_count = (SELECT COUNT(*) FROM answers "
+        "WHERE answers.question_id = questions.id AND answers.is_llm_answer = 0)"
+    ))
+    op.create_index("ix_questions_active_answers", "questions", ["is_active", "answer_count", "id"])
+    op.create_index("ix_questions_active_theme_answers", "questions", ["is_active", "theme_id", "answer_count", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_questions_active_theme_answers", table_name="questions")
+    op.drop_index("ix_questions_active_answers", table_name="questions")
+    with op.batch_alter_table("questions") as batch_op:
+        batch_op.drop_column("answer_count")
@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, UniqueConstraint, Computed, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -18,13 +18,22 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     score = Column(Integer, default=0)
-    badges = Column(Text, default="")  # JSON string of badges
+    badges = Column(Text, default="")  # Copia testuale dei badge di user_badges (services/badges.py)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Boolean, default=True)
     
     questions = relationship("Question", back_populates="creator")
     answers = relationship("Answer", back_populates="user")
     validations = relationship("Validation", back_populates="validator")
+    __table_args__ = (Index('ix_users_active_score', 'is_active', 'score'),)
+
+class UserBadge(Base):
+    __tablename__ = "user_badges"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    badge = Column(String(50), primary_key=True)  # codice della regola (BADGE_RULES)
+    awarded_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (Index('ix_user_badges_badge_user', 'badge', 'user_id'),)
 
 class CulturalTheme(Base):
     __tablename__ = "cultural_themes"
@@ -45,10 +54,19 @@ class Question(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Boolean, default=True)
     tag = Column(String(100), nullable=True)
+    # Risposte degli utenti ricevute (esclusa quella AI), aggiornato a ogni nuova risposta
+    answer_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     creator = relationship("User", back_populates="questions")
     theme = relationship("CulturalTheme", back_populates="questions")
     answers = relationship("Answer", back_populates="question")
+    __table_args__ = (
+        Index('ix_questions_active_created', 'is_active', 'created_at', 'id'),
+        Index('ix_questions_active_theme_created', 'is_active', 'theme_id', 'created_at', 'id'),
+        Index('ix_questions_tag', 'tag'),
+        Index('ix_questions_active_answers', 'is_active', 'answer_count', 'id'),
+        Index('ix_questions_active_theme_answers', 'is_active', 'theme_id', 'answer_count', 'id'),
+    )
 
 class Answer(Base):
     __tablename__ = "answers"
@@ -59,11 +77,30 @@ class Answer(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL for LLM answers
     is_llm_answer = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Vale question_id solo per le risposte AI (NULL altrimenti): l'indice univoco
+    # garantisce al massimo una risposta AI per domanda
+    llm_answer_question_id = Column(
+        Integer,
+        Computed("CASE WHEN is_llm_answer = 1 THEN question_id ELSE NULL END", persisted=True),
+    )
+    # Coda delle validazioni (services/validation_queue.py): validazioni ricevute
+    # e lease del validatore a cui la risposta è assegnata
+    validation_count = Column(Integer, nullable=False, default=0, server_default="0")
+    leased_by = Column(Integer, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # UTC
     
     question = relationship("Question", back_populates="answers")
     user = relationship("User", back_populates="answers")
     validations = relationship("Validation", back_populates="answer")
     llm_validations = relationship("LLMValidation", back_populates="answer")
+    __table_args__ = (
+        Index('uq_answers_llm_answer_question_id', 'llm_answer_question_id', unique=True),
+        Index('ix_answers_question_llm', 'question_id', 'is_llm_answer'),
+        Index('ix_answers_user_question', 'user_id', 'question_id'),
+        Index('ix_answers_question_created', 'question_id', 'created_at', 'id'),
+        Index('ix_answers_validation_queue', 'validation_count', 'id'),
+        Index('ix_answers_leased_by', 'leased_by', 'lease_expires_at'),
+    )
 
 class Validation(Base):
     __tablename__ = "validations"
@@ -78,6 +115,10 @@ class Validation(Base):
     
     answer = relationship("Answer", back_populates="validations")
     validator = relationship("User", back_populates="validations")
+    __table_args__ = (
+        Index('ix_validations_validator_answer', 'validator_id', 'answer_id'),
+        Index('ix_validations_answer_created', 'answer_id', 'created_at', 'id'),
+    )
 
 class LLMValidation(Base):
     __tablename__ = "llm_validations"
@@ -90,6 +131,7 @@ class LLMValidation(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     answer = relationship("Answer", back_populates="llm_validations")
+    __table_args__ = (Index('ix_llm_validations_answer', 'answer_id'),)
 
 class ValidatedTag(Base):
     __tablename__ = "validated_tags"
@@ -99,7 +141,27 @@ class ValidatedTag(Base):
     tag = Column(String(100), nullable=False)
     score = Column(Float, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    __table_args__ = (UniqueConstraint('user_id', 'question_id', name='_user_question_uc'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'question_id', name='_user_question_uc'),
+        Index('ix_validated_tags_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    dedup_key = Column(String(191), unique=True, nullable=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False)   # UTC
+    locked_until = Column(DateTime, nullable=True)  # UTC, scadenza del lease del worker
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, nullable=False)  # UTC
+    updated_at = Column(DateTime, nullable=False)  # UTC
+    __table_args__ = (Index('ix_jobs_status_run_after', 'status', 'run_after'),)
 
 # Pydantic Models
 class UserBase(BaseModel):
@@ -180,11 +242,21 @@ class ValidationResponse(BaseModel):
     score: float
     is_correct: bool
     feedback: Optional[str]
-    created_at: datetime
+    created_at: Optional[datetime]  # None per le validazioni mock (llm-validate-text)
     
     class Config:
         from_attributes = True
 
+class BulkLLMValidationRequest(BaseModel):
+    answer_ids: Optional[List[int]] = None   # Se presenti, ignora include_llm_answers
+    theme_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    only_unvalidated: bool = True            # Solo risposte senza validazioni LLM
+    include_llm_answers: bool = False
+    limit: int = 100
+    concurrency: Optional[int] = None        # Default: LLM_VALIDATE_CONCURRENCY
+
 class PendingValidationResponse(BaseModel):
     answer: AnswerResponse
     question: QuestionResponse
@@ -199,6 +271,17 @@ class LeaderboardEntry(BaseModel):
     badges: str
     rank: int
 
+class BadgeResponse(BaseModel):
+    code: str
+    name: str
+    min_score: int
+    holders: int
+
+class BadgeHolderResponse(BaseModel):
+    username: str
+    score: int
+    awarded_at: Optional[datetime]
+
 class QuestionModel(BaseModel):
     id: int
     text: str
@@ -226,3 +309,31 @@ class ValidatedTagResponse(BaseModel):
 
 class ValidatedTagResponseList(BaseModel):
     items: list[ValidatedTagResponse]
+    next_cursor: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    dedup_key: Optional[str] = None
+    run_after: datetime
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
+
+class QueueStatsResponse(BaseModel):
+    depth: int                     # Job in attesa di esecuzione (pending)
+    by_status: Dict[str, int]
+    pending_by_kind: Dict[str, int]
+    oldest_pending_seconds: Optional[float] = None
+    local_workers: int             # Worker attivi in questo processo
+
+class QuotaUsageResponse(BaseModel):
+    llm_calls: int               # Chiamate effettive al modello (esclusa la cache)
+    prompt_tokens: int             # Somma di prompt_eval_count restituito da Ollama
+    eval_tokens: int               # Somma di eval_count restituito da Ollama
+    per_minute: float              # Chiamate al modello ricaricate al minuto
+    burst: float                   # Chiamate consecutive massime
@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 import re
 
-from backend.services.database import get_db
+from backend.services.database import get_async_db, AsyncSessionLocal
 from backend.services.llm_service import llm_service
+from backend.services.singleflight import SingleFlight
+from backend.services.jobs import job_queue
 from backend.models.schemas import (
-    Answer, Question, User,
+    Answer, Question,
     AnswerCreate, AnswerResponse
 )
 from backend.routers.auth import get_current_user
+from backend.services.principal_cache import Principal
+from backend.utils.pagination import DEFAULT_PAGE_SIZE, clamp_page_size, keyset_page, split_page, set_next_cursor
 
 router = APIRouter()
 
+# Generazioni della risposta AI in corso, una per domanda
+llm_answer_flight = SingleFlight()
+
+# Tipo di job per la generazione della risposta AI
+LLM_ANSWER_JOB = "llm_answer"
+
 def clean_text(text: str) -> str:
     """
     Pulisce il testo della risposta rimuovendo caratteri indesiderati.
@@ -36,47 +49,103 @@ def clean_text(text: str) -> str:
     text = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
     return text
 
-async def generate_llm_answer_background(question_id: int, db: Session):
+async def get_llm_answer(question_id: int, db: AsyncSession) -> Optional[Answer]:
+    """Restituisce la risposta AI di una domanda, se esiste."""
+    return (await db.execute(
+        select(Answer).where(
+            Answer.question_id == question_id,
+            Answer.is_llm_answer == True
+        )
+    )).scalars().first()
+
+async def _generate_llm_answer(question_id: int) -> Optional[int]:
     """
-    Task in background per generare la risposta del modello AI.
-    Viene eseguito in modo asincrono per non bloccare la risposta all'utente.
-    
+    Genera e salva la risposta AI di una domanda, se non esiste già.
+    Usa una sessione propria, indipendente da quella della richiesta.
+
+    Returns:
+        ID della risposta AI (nuova o già esistente), None se la domanda non esiste
+    """
+    async with AsyncSessionLocal() as db:
+        existing = await get_llm_answer(question_id, db)
+        if existing:
+            return existing.id
+
+        # Recupera la domanda dal database (con il tema, usato come contesto)
+        question = (await db.execute(
+            select(Question).options(selectinload(Question.theme)).where(Question.id == question_id)
+        )).scalars().first()
+        if not question:
+            return None
+
+        # Genera la risposta AI usando il contesto culturale se disponibile
+        cultural_context = question.theme.name if question.theme else ""
+        llm_answer_text = await llm_service.generate_answer(question.text, cultural_context, strict=True)
+
+        # Salva la risposta AI pulita nel database
+        llm_answer = Answer(
+            text=clean_text(llm_answer_text),
+            question_id=question_id,
+            user_id=None,  # Nessun utente associato per risposte AI
+            is_llm_answer=True
+        )
+        db.add(llm_answer)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Un altro processo ha salvato la risposta AI nel frattempo:
+            # il vincolo di unicità su llm_answer_question_id lo impedisce
+            await db.rollback()
+            existing = await get_llm_answer(question_id, db)
+            return existing.id if existing else None
+        return llm_answer.id
+
+async def ensure_llm_answer(question_id: int) -> Optional[int]:
+    """
+    Garantisce che la domanda abbia una risposta del modello AI, generandola se serve.
+
+    Se per la stessa domanda c'è già una generazione in corso, il chiamante
+    si aggancia a quella invece di avviarne un'altra.
+
     Args:
         question_id: ID della domanda da rispondere
-        db: Sessione del database
+
+    Returns:
+        ID della risposta AI, None se la domanda non esiste
+
+    Raises:
+        httpx.HTTPError: se il modello non risponde (il job verrà ritentato)
     """
-    # Recupera la domanda dal database
-    question = db.query(Question).filter(Question.id == question_id).first()
-    if not question:
-        return
-    
-    # Genera la risposta AI usando il contesto culturale se disponibile
-    cultural_context = question.theme.name if question.theme else ""
-    llm_answer_text = llm_service.generate_answer(question.text, cultural_context)
-    
-    # Salva la risposta AI pulita nel database
-    llm_answer = Answer(
-        text=clean_text(llm_answer_text),
-        question_id=question_id,
-        user_id=None,  # Nessun utente associato per risposte AI
-        is_llm_answer=True
+    return await llm_answer_flight.do(question_id, lambda: _generate_llm_answer(question_id))
+
+@job_queue.handler(LLM_ANSWER_JOB)
+async def llm_answer_job(payload: dict, db: AsyncSession) -> dict:
+    """Job che genera la risposta AI di una domanda."""
+    return {"answer_id": await ensure_llm_answer(payload["question_id"])}
+
+async def enqueue_llm_answer(question_id: int, db: AsyncSession):
+    """
+    Mette in coda la generazione della risposta AI di una domanda.
+    La chiave di de-duplicazione evita job multipli per la stessa domanda.
+    """
+    return await job_queue.enqueue(
+        db,
+        LLM_ANSWER_JOB,
+        {"question_id": question_id},
+        dedup_key=f"{LLM_ANSWER_JOB}:{question_id}",
     )
-    db.add(llm_answer)
-    db.commit()
 
 @router.post("/", response_model=AnswerResponse)
 async def create_answer(
     answer: AnswerCreate,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Crea una nuova risposta utente e genera una risposta AI in background.
+    Crea una nuova risposta utente e mette in coda la generazione della risposta AI.
     
     Args:
         answer: Dati della risposta da creare
-        background_tasks: Gestore dei task in background
         current_user: Utente autenticato (da middleware)
         db: Sessione del database
         
@@ -87,15 +156,17 @@ async def create_answer(
         HTTPException: Se la domanda non esiste o l'utente ha già risposto
     """
     # Verifica che la domanda esista
-    question = db.query(Question).filter(Question.id == answer.question_id).first()
+    question = await db.get(Question, answer.question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
     # Controlla se l'utente ha già risposto a questa domanda
-    existing_answer = db.query(Answer).filter(
-        Answer.question_id == answer.question_id,
-        Answer.user_id == current_user.id
-    ).first()
+    existing_answer = (await db.execute(
+        select(Answer).where(
+            Answer.question_id == answer.question_id,
+            Answer.user_id == current_user.id
+        )
+    )).scalars().first()
     if existing_answer:
         raise HTTPException(status_code=400, detail="You have already answered this question")
     
@@ -107,37 +178,54 @@ async def create_answer(
         is_llm_answer=False
     )
     db.add(db_answer)
-    db.commit()
-    db.refresh(db_answer)
+    # Contatore delle risposte della domanda (incremento atomico, stesso commit)
+    await db.execute(
+        update(Question).where(Question.id == answer.question_id)
+        .values(answer_count=Question.answer_count + 1)
+    )
+    await db.commit()
+    await db.refresh(db_answer)
+    # La risposta HTTP viene costruita prima di accodare il job: se un'altra
+    # richiesta accoda lo stesso job in parallelo, il rollback di enqueue
+    # scade gli oggetti della sessione
+    response = AnswerResponse.from_orm(db_answer)
     
-    # Genera la risposta AI in background se non esiste già
-    llm_answer_exists = db.query(Answer).filter(
-        Answer.question_id == answer.question_id,
-        Answer.is_llm_answer == True
-    ).first()
+    # Mette in coda la generazione della risposta AI se non esiste già
+    llm_answer_exists = await get_llm_answer(answer.question_id, db)
     
     if not llm_answer_exists:
-        background_tasks.add_task(generate_llm_answer_background, answer.question_id, db)
+        await enqueue_llm_answer(answer.question_id, db)
     
-    return AnswerResponse.from_orm(db_answer)
+    return response
 
 @router.get("/question/{question_id}", response_model=List[AnswerResponse])
-async def get_answers_for_question(question_id: int, db: Session = Depends(get_db)):
+async def get_answers_for_question(
+    question_id: int,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Recupera tutte le risposte per una specifica domanda.
+    Recupera le risposte per una specifica domanda, in ordine di creazione.
     
     Args:
         question_id: ID della domanda
+        limit: Dimensione della pagina (max MAX_PAGE_SIZE)
+        cursor: Cursore della pagina successiva (header X-Next-Cursor della risposta precedente)
         db: Sessione del database
         
     Returns:
-        Lista di tutte le risposte associate alla domanda
+        Una pagina delle risposte associate alla domanda
     """
-    answers = db.query(Answer).filter(Answer.question_id == question_id).all()
+    limit = clamp_page_size(limit)
+    query = keyset_page(select(Answer).where(Answer.question_id == question_id), Answer, cursor, limit)
+    answers, next_cursor = split_page((await db.execute(query)).scalars().all(), limit)
+    set_next_cursor(response, next_cursor)
     return answers
 
 @router.get("/{answer_id}", response_model=AnswerResponse)
-async def get_answer(answer_id: int, db: Session = Depends(get_db)):
+async def get_answer(answer_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Recupera una specifica risposta tramite il suo ID.
     
@@ -151,7 +239,7 @@ async def get_answer(answer_id: int, db: Session = Depends(get_db)):
     Raises:
         HTTPException: Se la risposta non viene trovata
     """
-    answer = db.query(Answer).filter(Answer.id == answer_id).first()
+    answer = await db.get(Answer, answer_id)
     if not answer:
         raise HTTPException(status_code=404, detail="Answer not found")
     return answer
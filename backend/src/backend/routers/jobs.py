@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.services.database import get_async_db
+from backend.services.jobs import job_queue, job_to_response
+from backend.models.schemas import Job, JobResponse, QueueStatsResponse
+
+router = APIRouter()
+
+@router.get("/stats", response_model=QueueStatsResponse)
+async def get_queue_stats(db: AsyncSession = Depends(get_async_db)):
+    """
+    Restituisce la profondità della coda (job in attesa), i conteggi per
+    stato e per tipo, e l'età del job in attesa più vecchio.
+    """
+    return await job_queue.stats(db)
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Restituisce lo stato di un job."""
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_response(job)
@@ -1,24 +1,109 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, desc, func, or_, select
+from typing import List, Tuple
 
-from backend.services.database import get_db
-from backend.models.schemas import User, LeaderboardEntry
+from backend.services.database import get_async_db
+from backend.models.schemas import User, UserBadge, LeaderboardEntry, BadgeResponse, BadgeHolderResponse
+from backend.routers.auth import get_current_user_fresh
+from backend.services.leaderboard_index import leaderboard_index, LeaderboardUnavailable
+from backend.services.badges import BADGE_RULES, BADGES_BY_CODE
+from backend.utils.pagination import clamp_page_size
 
 router = APIRouter()
 
+async def _top_from_db(limit: int, db: AsyncSession) -> List[Tuple[int, int, int]]:
+    """Classifica calcolata dal database (se l'indice non è disponibile)."""
+    rows = (await db.execute(
+        select(User.id, User.score).where(User.is_active == True).order_by(desc(User.score), desc(User.id)).limit(limit)
+    )).all()
+    return [(rank, user_id, score or 0) for rank, (user_id, score) in enumerate(rows, 1)]
+
+async def _rank_from_db(user: User, db: AsyncSession) -> int:
+    """Posizione di un utente calcolata dal database: utenti davanti + 1."""
+    score = user.score or 0
+    ahead = (await db.execute(select(func.count(User.id)).where(
+        User.is_active == True,
+        or_(User.score > score, and_(User.score == score, User.id > user.id)),
+    ))).scalar()
+    return ahead + 1
+
 @router.get("/", response_model=List[LeaderboardEntry])
-async def get_leaderboard(limit: int = 10, db: Session = Depends(get_db)):
-    users = db.query(User).filter(User.is_active == True).order_by(desc(User.score)).limit(limit).all()
+async def get_leaderboard(limit: int = 10, db: AsyncSession = Depends(get_async_db)):
+    # Posizioni restituite: al massimo MAX_PAGE_SIZE, come le altre liste
+    limit = clamp_page_size(limit)
+    try:
+        ranking = await leaderboard_index.top(limit)
+    except LeaderboardUnavailable:
+        ranking = await _top_from_db(limit, db)
+    
+    # Nomi e badge dei soli utenti in classifica (ricerca per chiave primaria)
+    user_ids = [user_id for _, user_id, _ in ranking]
+    users = {user.id: user for user in (await db.execute(select(User).where(User.id.in_(user_ids)))).scalars()}
     
     leaderboard = []
-    for rank, user in enumerate(users, 1):
+    for rank, user_id, score in ranking:
+        user = users.get(user_id)
+        if user is None:
+            continue
         leaderboard.append(LeaderboardEntry(
             username=user.username,
-            score=user.score,
-            badges=user.badges,
+            score=score,
+            badges=user.badges or "",
             rank=rank
         ))
     
     return leaderboard
+
+@router.get("/me", response_model=LeaderboardEntry)
+async def get_my_rank(current_user: User = Depends(get_current_user_fresh), db: AsyncSession = Depends(get_async_db)):
+    """
+    Restituisce la posizione in classifica dell'utente autenticato.
+    """
+    if not current_user.is_active:
+        raise HTTPException(status_code=404, detail="User not in leaderboard")
+    try:
+        rank = await leaderboard_index.rank(current_user.id)
+    except LeaderboardUnavailable:
+        rank = None
+    if rank is None:
+        rank = await _rank_from_db(current_user, db)
+    return LeaderboardEntry(
+        username=current_user.username,
+        score=current_user.score or 0,
+        badges=current_user.badges or "",
+        rank=rank
+    )
+
+@router.get("/badges", response_model=List[BadgeResponse])
+async def get_badges(db: AsyncSession = Depends(get_async_db)):
+    """
+    Restituisce i badge disponibili con il numero di utenti che li possiedono.
+    """
+    holders = dict((await db.execute(
+        select(UserBadge.badge, func.count(UserBadge.user_id)).group_by(UserBadge.badge)
+    )).all())
+    return [
+        BadgeResponse(code=rule.code, name=rule.name, min_score=rule.min_score, holders=holders.get(rule.code, 0))
+        for rule in BADGE_RULES
+    ]
+
+@router.get("/badges/{badge}", response_model=List[BadgeHolderResponse])
+async def get_badge_holders(badge: str, limit: int = 50, db: AsyncSession = Depends(get_async_db)):
+    """
+    Restituisce gli utenti attivi che possiedono un badge, dal primo che lo ha ottenuto.
+    
+    Args:
+        badge: codice del badge (es. gold_validator)
+        limit: numero massimo di utenti
+    """
+    if badge not in BADGES_BY_CODE:
+        raise HTTPException(status_code=404, detail="Badge not found")
+    rows = (await db.execute(
+        select(User.username, User.score, UserBadge.awarded_at)
+        .join(UserBadge, UserBadge.user_id == User.id)
+        .where(UserBadge.badge == badge, User.is_active == True)
+        .order_by(UserBadge.awarded_at, UserBadge.user_id)
+        .limit(limit)
+    )).all()
+    return [BadgeHolderResponse(username=username, score=score or 0, awarded_at=awarded_at) for username, score, awarded_at in rows]
@@ -1,161 +1,291 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+import httpx
+from typing import List, Optional
+import os
 import random
 
-from backend.services.database import get_db
+from backend.services.database import get_async_db
 from backend.services.llm_service import llm_service
+from backend.services.llm_admission import LLMAdmissionError
 from backend.models.schemas import (
-    Question, CulturalTheme, User,
+    Question,
     QuestionCreate, QuestionResponse, CulturalThemeResponse,
     Answer, TagResponse
 )
 from backend.routers.auth import get_current_user
+from backend.routers.quotas import llm_quota
+from backend.services.principal_cache import Principal
+from backend.routers.answer import enqueue_llm_answer
+from backend.services.jobs import job_queue
+from backend.utils.formatters import format_sse
+from backend.utils.pagination import clamp_page_size, keyset_page, split_page, set_next_cursor
+from backend.services.reference_cache import theme_cache, cache_headers
 
 router = APIRouter()
 
-async def generate_llm_answer_background(question_id: int, db: Session):
-    """Background task to generate LLM answer"""
-    question = db.query(Question).filter(Question.id == question_id).first()
+# Tipo di job per la generazione del tag di una domanda
+QUESTION_TAG_JOB = "question_tag"
+
+# Generazione dei tag a gruppi
+# - TAG_BATCH_SIZE: domande massime per chiamata al modello
+# - TAG_BATCH_DELAY: secondi di attesa prima di eseguire un job di tag, così
+#   le domande create a breve distanza finiscono nello stesso gruppo
+TAG_BATCH_SIZE = int(os.getenv("TAG_BATCH_SIZE", "8"))
+TAG_BATCH_DELAY = float(os.getenv("TAG_BATCH_DELAY", "2"))
+
+@job_queue.handler(QUESTION_TAG_JOB)
+async def question_tag_job(payload: dict, db: AsyncSession) -> dict:
+    """
+    Job che genera il tag di una domanda e lo salva.
+
+    Insieme alla domanda del job vengono taggate, con una sola chiamata al
+    modello, fino a TAG_BATCH_SIZE - 1 altre domande ancora senza tag: i loro
+    job, quando eseguiti, trovano il tag già presente e terminano subito.
+    """
+    question = await db.get(Question, payload["question_id"])
     if not question:
-        return
-    
-    # Generate LLM answer
-    cultural_context = question.theme.name if question.theme else ""
-    llm_answer_text = llm_service.generate_answer(question.text, cultural_context)
-    
-    # Save LLM answer
-    llm_answer = Answer(
-        text=llm_answer_text,
-        question_id=question_id,
-        user_id=None,
-        is_llm_answer=True
+        return {"tag": None}
+    if question.tag is not None:
+        return {"tag": question.tag, "batched": True}
+
+    others = (await db.execute(
+        select(Question).where(
+            Question.tag.is_(None),
+            Question.id != question.id
+        ).order_by(Question.id).limit(max(TAG_BATCH_SIZE - 1, 0))
+    )).scalars().all()
+    batch = [question, *others]
+
+    tags = {}
+    if len(batch) > 1:
+        tags = await llm_service.generate_tags({q.id: q.text for q in batch})
+    if question.id not in tags:
+        tags[question.id] = await llm_service.generate_tag(question.text, strict=True)
+
+    # Aggiornamento condizionato: un altro worker può aver già taggato la domanda
+    for question_id, tag in tags.items():
+        await db.execute(
+            update(Question).where(
+                Question.id == question_id,
+                Question.tag.is_(None)
+            ).values(tag=tag).execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return {"tag": tags[question.id], "batch_size": len(batch), "tagged": len(tags)}
+
+async def enqueue_question_tag(question_id: int, db: AsyncSession):
+    """Mette in coda la generazione del tag di una domanda."""
+    return await job_queue.enqueue(
+        db,
+        QUESTION_TAG_JOB,
+        {"question_id": question_id},
+        dedup_key=f"{QUESTION_TAG_JOB}:{question_id}",
+        delay=TAG_BATCH_DELAY,
     )
-    db.add(llm_answer)
-    db.commit()
+
+def questions_with_theme():
+    """Select delle domande con il tema già caricato (richiesto da QuestionResponse)."""
+    return select(Question).options(selectinload(Question.theme))
 
 @router.get("/themes", response_model=List[CulturalThemeResponse])
-async def get_themes(db: Session = Depends(get_db)):
-    themes = db.query(CulturalTheme).all()
+async def get_themes(request: Request, response: Response):
+    # Temi dalla cache in memoria: 304 se il client ha già la versione corrente
+    themes, etag = await theme_cache.snapshot()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers(etag))
+    response.headers.update(cache_headers(etag))
     return themes
 
 @router.get("/random-theme", response_model=CulturalThemeResponse)
-async def get_random_theme(db: Session = Depends(get_db)):
-    themes = db.query(CulturalTheme).all()
+async def get_random_theme(response: Response):
+    themes = await theme_cache.all()
     if not themes:
         raise HTTPException(status_code=404, detail="No themes available")
     
+    # Ogni chiamata deve restituire un tema diverso: niente cache HTTP
+    response.headers["Cache-Control"] = "no-store"
     random_theme = random.choice(themes)
     return random_theme
 
 @router.post("/", response_model=QuestionResponse)
 async def create_question(
     question: QuestionCreate,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Verify theme exists
-    theme = db.query(CulturalTheme).filter(CulturalTheme.id == question.theme_id).first()
+    theme = await theme_cache.get(question.theme_id)
     if not theme:
         raise HTTPException(status_code=404, detail="Theme not found")
-    # Genera il tag
-    tag = llm_service.generate_tag(question.text)
+    # Il tag viene generato da un job: la domanda viene salvata subito senza tag
     db_question = Question(
         text=question.text,
         creator_id=current_user.id,
         theme_id=question.theme_id,
-        tag=tag
+        tag=None
     )
     db.add(db_question)
-    db.commit()
-    db.refresh(db_question)
-    # Generate LLM answer in background
-    background_tasks.add_task(generate_llm_answer_background, db_question.id, db)
-    return QuestionResponse.from_orm(db_question)
+    await db.commit()
+    await db.refresh(db_question)
+    # Costruita prima di accodare i job (un rollback di enqueue scade gli oggetti della sessione)
+    response = QuestionResponse(
+        id=db_question.id,
+        text=db_question.text,
+        creator_id=db_question.creator_id,
+        theme_id=db_question.theme_id,
+        created_at=db_question.created_at,
+        theme=theme,
+        tag=db_question.tag,
+    )
+    # Tag and LLM answer are generated by the job workers
+    await enqueue_question_tag(response.id, db)
+    await enqueue_llm_answer(response.id, db)
+    return response
 
 @router.get("/", response_model=List[QuestionResponse])
 async def get_questions(
-    skip: int = 0,
+    response: Response,
     limit: int = 10,
     theme_id: int = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True, description="Usare cursor (header X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Question).filter(Question.is_active == True)
+    limit = clamp_page_size(limit)
+    query = questions_with_theme().where(Question.is_active == True)
     
     if theme_id:
-        query = query.filter(Question.theme_id == theme_id)
+        query = query.where(Question.theme_id == theme_id)
     
-    questions = query.offset(skip).limit(limit).all()
+    query = keyset_page(query, Question, cursor, limit)
+    if skip and not cursor:
+        query = query.offset(skip)
+    questions, next_cursor = split_page((await db.execute(query)).scalars().all(), limit)
+    set_next_cursor(response, next_cursor)
     return questions
 
 @router.get("/{question_id}", response_model=QuestionResponse)
-async def get_question(question_id: int, db: Session = Depends(get_db)):
-    question = db.query(Question).filter(Question.id == question_id).first()
+async def get_question(question_id: int, db: AsyncSession = Depends(get_async_db)):
+    question = (await db.execute(questions_with_theme().where(Question.id == question_id))).scalars().first()
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     return question
 
 @router.get("/pending/answer")
 async def get_pending_questions_for_answer(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = 10,
+    theme_id: Optional[int] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get questions that need answers (excluding user's own questions and already answered)"""
-    # Get questions that user has already answered
-    answered_questions = db.query(Answer.question_id).filter(
+    """
+    Get questions that need answers (excluding user's own questions and already answered).
+    Le domande con meno risposte vengono proposte per prime: la query scorre
+    l'indice (is_active, [theme_id,] answer_count, id) e si ferma dopo `limit`
+    domande valide, quindi il costo non cresce con lo storico dell'utente.
+    """
+    limit = clamp_page_size(limit)
+    # Risposta dell'utente alla domanda (controllo puntuale su ix_answers_user_question)
+    answered = exists().where(
+        Answer.question_id == Question.id,
         Answer.user_id == current_user.id
-    ).subquery()
+    )
     
-    # Get questions that need answers
-    questions = db.query(Question).filter(
-        Question.creator_id != current_user.id,  # Not user's own questions
+    query = questions_with_theme().where(
         Question.is_active == True,  # Only active questions
-        ~Question.id.in_(answered_questions)  # Not already answered by user
-    ).limit(10).all()
+        Question.creator_id != current_user.id,  # Not user's own questions
+        ~answered  # Not already answered by user
+    )
+    if theme_id:
+        query = query.where(Question.theme_id == theme_id)
     
+    questions = (await db.execute(query.order_by(Question.answer_count, Question.id).limit(limit))).scalars().all()
     return questions
 
-@router.post("/generate/{theme_id}")
+def build_question_prompt(theme_name: str) -> str:
+    """Costruisce il prompt per generare una domanda su un tema culturale."""
+    return f"""
+    Genera una domanda semplice e veloce sulla cultura italiana riguardante il tema: {theme_name}
+    La domanda deve essere:
+    - Chiara e concisa
+    - Specifica per il tema {theme_name}
+    - Adatta a un quiz sulla cultura italiana
+    - Non troppo lunga
+    Formato richiesto: solo la domanda, senza spiegazioni aggiuntive.
+    """
+
+@router.post("/generate/{theme_id}", dependencies=[Depends(llm_quota("questions.generate"))])
 async def generate_llm_question(
     theme_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Genera una nuova domanda sulla cultura italiana basata su un tema specifico.
     Restituisce solo il testo e il tag, NON salva nulla nel database.
     """
     # Verifica che il tema esista
-    theme = db.query(CulturalTheme).filter(CulturalTheme.id == theme_id).first()
+    theme = await theme_cache.get(theme_id)
     if not theme:
         raise HTTPException(status_code=404, detail="Theme not found")
     # Genera la domanda usando il servizio LLM
-    prompt = f"""
-    Genera una domanda semplice e veloce sulla cultura italiana riguardante il tema: {theme.name}
-    La domanda deve essere:
-    - Chiara e concisa
-    - Specifica per il tema {theme.name}
-    - Adatta a un quiz sulla cultura italiana
-    - Non troppo lunga
-    Formato richiesto: solo la domanda, senza spiegazioni aggiuntive.
-    """
+    prompt = build_question_prompt(theme.name)
     try:
-        question_text = llm_service.generate_answer(prompt)
-        tag = llm_service.generate_tag(question_text.strip())
+        question_text = await llm_service.generate_answer(prompt)
+        tag = await llm_service.generate_tag(question_text.strip())
         return {"text": question_text.strip(), "tag": tag}
+    except LLMAdmissionError:
+        raise  # Gestito dall'handler globale (503 con Retry-After)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error generating question: {str(e)}"
         )
 
-@router.post("/tag", response_model=TagResponse)
+@router.post("/generate/{theme_id}/stream", dependencies=[Depends(llm_quota("questions.generate"))])
+async def generate_llm_question_stream(
+    theme_id: int,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Variante in streaming (Server-Sent Events) di /generate/{theme_id}.
+    Invia un evento "token" per ogni frammento generato, poi un evento "done"
+    con il testo completo e il tag. In caso di errore invia un evento "error".
+    """
+    theme = await theme_cache.get(theme_id)
+    if not theme:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    prompt = build_question_prompt(theme.name)
+
+    async def event_stream():
+        parts = []
+        try:
+            async for token in llm_service.stream_answer(prompt):
+                parts.append(token)
+                yield format_sse("token", {"text": token})
+            question_text = "".join(parts).strip()
+            tag = await llm_service.generate_tag(question_text)
+            yield format_sse("done", {"text": question_text, "tag": tag})
+        except httpx.HTTPError as e:
+            yield format_sse("error", {"detail": f"Error generating question: {str(e)}"})
+        except LLMAdmissionError as e:
+            yield format_sse("error", {"detail": e.detail, "retry_after": e.retry_after})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/tag", response_model=TagResponse, dependencies=[Depends(llm_quota("questions.tag"))])
 async def generate_tag_for_question(
     question: str = Body(..., embed=True)
 ):
     """
     Genera un tag riassuntivo (max 3 parole) per una domanda fornita.
     """
-    tag = llm_service.generate_tag(question)
+    tag = await llm_service.generate_tag(question)
     return TagResponse(tag=tag)
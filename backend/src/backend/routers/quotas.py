@@ -0,0 +1,52 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request
+
+from backend.routers.auth import get_current_user, get_optional_user
+from backend.services.principal_cache import Principal
+from backend.services.quotas import QUOTA_TRUST_FORWARDED, quota_manager
+from backend.models.schemas import QuotaUsageResponse
+
+router = APIRouter()
+
+def client_ip(request: Request) -> str:
+    """Indirizzo del client; X-Forwarded-For solo se QUOTA_TRUST_FORWARDED è attivo."""
+    if QUOTA_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def llm_quota(endpoint: str):
+    """
+    Dipendenza per gli endpoint che chiamano il modello: scala la quota del
+    chiamante (utente, o IP se la richiesta non è autenticata), dell'IP e dell'endpoint.
+    Se la quota è esaurita risponde 429 con Retry-After (QuotaExceeded).
+    """
+    async def dependency(request: Request, user: Optional[Principal] = Depends(get_optional_user)):
+        await quota_manager.charge(endpoint, user_id=user.id if user else None, ip=client_ip(request))
+    return dependency
+
+def max_llm_items(endpoint: str, max_items: int) -> int:
+    """Elementi per richiesta: al massimo `max_items`, e non più di quanti ne ammette la quota."""
+    quota_items = quota_manager.max_items(endpoint)
+    return max_items if quota_items is None else min(max_items, quota_items)
+
+async def charge_llm_items(endpoint: str, items: int, request: Request, user: Optional[Principal]):
+    """
+    Scala la quota per `items` elementi, negli endpoint che valutano più
+    risposte per richiesta (il costo si conosce solo dopo aver letto il corpo).
+    Se la quota è esaurita solleva QuotaExceeded (429 con Retry-After), se
+    gli elementi sono più di max_llm_items QuotaCostTooHigh (400).
+    """
+    await quota_manager.charge(endpoint, user_id=user.id if user else None, ip=client_ip(request), items=items)
+
+@router.get("/me", response_model=QuotaUsageResponse)
+async def get_my_usage(current_user: Principal = Depends(get_current_user)):
+    """Chiamate al modello e token consumati dall'utente, con i limiti della sua quota."""
+    limit = quota_manager.limits["user"]
+    return QuotaUsageResponse(
+        **await quota_manager.usage(f"user:{current_user.id}"),
+        per_minute=limit.per_minute,
+        burst=limit.burst,
+    )
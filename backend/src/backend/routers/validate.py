@@ -1,71 +1,110 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, UniqueConstraint
-from typing import List
-from sqlalchemy.sql import func
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
-import re
-
-from backend.services.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from sqlalchemy import and_, exists, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import List, Optional, Tuple
+import asyncio
+import os
+import httpx
+
+from backend.services.database import get_async_db, AsyncSessionLocal
 from backend.models.schemas import (
     Validation, Answer, Question, User, LLMValidation,
-    ValidationCreate, ValidationResponse, PendingValidationResponse, CulturalTheme,
-    QuestionModel, ValidatedTag, ValidatedTagResponse, ValidatedTagResponseList, Base
+    ValidationCreate, ValidationResponse, PendingValidationResponse,
+    ValidatedTag, ValidatedTagResponseList,
+    BulkLLMValidationRequest, JobResponse
 )
 from backend.routers.auth import get_current_user
+from backend.routers.quotas import charge_llm_items, llm_quota, max_llm_items
+from backend.services.principal_cache import Principal
 from backend.services.llm_service import llm_service
+from backend.services.llm_admission import LLMAdmissionError
+from backend.services.llm_judge import llm_judge, JudgeError
+from backend.utils.formatters import format_sse
+from backend.utils.pagination import DEFAULT_PAGE_SIZE, clamp_page_size, keyset_page, split_page, set_next_cursor
+from backend.services.jobs import job_queue, job_to_response
+from backend.services.leaderboard_index import leaderboard_index
+from backend.services.badges import award_badges
+from backend.services.validation_queue import lease_answers, release_lease, record_validation
 
 router = APIRouter()
 
-def update_user_score(user_id: int, points: int, db: Session):
+async def update_user_score(user_id: int, points: int, db: AsyncSession) -> Optional[int]:
     """
-    Aggiorna il punteggio dell'utente e assegna badge in base ai risultati.
+    Aggiunge punti all'utente e assegna i badge di cui supera la soglia.
+    
+    L'incremento è atomico (UPDATE ... SET score = score + punti) e non fa
+    commit: va chiamata dentro la transazione del chiamante, che la chiude
+    con un unico commit. Dopo l'UPDATE la riga resta bloccata fino al commit,
+    quindi il punteggio riletto è quello definitivo.
     
     Args:
         user_id: ID dell'utente da aggiornare
         points: Punti da aggiungere al punteggio
         db: Sessione del database
     
-    Sistema Badge:
-    - Bronze Validator: 100 punti
-    - Silver Validator: 500 punti
-    - Gold Validator: 1000 punti
-    """
-    user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        user.score += points
-        
-        # Sistema di badge basato sul punteggio
-        badges = user.badges.split(",") if user.badges else []
-        
-        # Assegnazione badge in base alle soglie di punteggio
-        if user.score >= 100 and "Bronze Validator" not in badges:
-            badges.append("Bronze Validator")
-        if user.score >= 500 and "Silver Validator" not in badges:
-            badges.append("Silver Validator")
-        if user.score >= 1000 and "Gold Validator" not in badges:
-            badges.append("Gold Validator")
-        
-        user.badges = ",".join(filter(None, badges))
-        db.commit()
-
-def save_validated_tag(user_id: int, question_id: int, tag: str, score: float, db: Session):
+    Returns:
+        Il nuovo punteggio, None se l'utente non esiste
+    
+    Sistema Badge: vedi BADGE_RULES in services/badges.py
+    (Bronze Validator: 100 punti, Silver: 500, Gold: 1000)
+    """
+    result = await db.execute(update(User).where(User.id == user_id).values(score=User.score + points))
+    if result.rowcount == 0:
+        return None
+    score = (await db.execute(select(User.score).where(User.id == user_id))).scalar()
+    
+    # Badge: solo quelli la cui soglia è stata appena superata
+    await award_badges(user_id, score - points, score, db)
+    return score
+
+async def save_validated_tags(rows: List[dict], db: AsyncSession):
+    """
+    Salva tag e punteggio validati con un solo upsert (senza commit).
+    Per ogni coppia (utente, domanda) esiste una sola riga: una nuova
+    validazione ne aggiorna tag e punteggio.
+    
+    Args:
+        rows: dizionari con user_id, question_id, tag e score
+        db: Sessione del database
+    """
     # Non salvare se il tag è None o vuoto
-    if not tag:
-        print(f"[WARN] Tag mancante per question_id={question_id}, user_id={user_id}. Non salvo validated_tag.")
+    for row in rows:
+        if not row["tag"]:
+            print(f"[WARN] Tag mancante per question_id={row['question_id']}, user_id={row['user_id']}. Non salvo validated_tag.")
+    rows = [row for row in rows if row["tag"]]
+    if not rows:
+        return
+    dialect = db.bind.dialect.name
+    if dialect == "mysql":
+        statement = mysql_insert(ValidatedTag).values(rows)
+        statement = statement.on_duplicate_key_update(tag=statement.inserted.tag, score=statement.inserted.score)
+    elif dialect == "sqlite":
+        statement = sqlite_insert(ValidatedTag).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "question_id"],
+            set_={"tag": statement.excluded.tag, "score": statement.excluded.score},
+        )
+    else:
+        for row in rows:
+            existing = (await db.execute(
+                select(ValidatedTag).filter_by(user_id=row["user_id"], question_id=row["question_id"])
+            )).scalars().first()
+            if existing:
+                existing.tag, existing.score = row["tag"], row["score"]
+            else:
+                db.add(ValidatedTag(**row))
         return
-    # Cerca duplicati anche per tag e score
-    existing = db.query(ValidatedTag).filter_by(user_id=user_id, question_id=question_id, tag=tag, score=score).first()
-    if existing:
-        return  # Non salvare duplicati esatti
-    db.add(ValidatedTag(user_id=user_id, question_id=question_id, tag=tag, score=score))
-    db.commit()
+    await db.execute(statement)
 
 @router.post("/", response_model=ValidationResponse)
 async def create_validation(
     validation: ValidationCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Crea una nuova validazione per una risposta e aggiorna i punteggi.
@@ -89,17 +128,17 @@ async def create_validation(
     - Autore risposta: doppio del punteggio assegnato se >= 7
     """
     # Verifica che la risposta esista
-    answer = db.query(Answer).filter(Answer.id == validation.answer_id).first()
+    answer = await db.get(Answer, validation.answer_id)
     if not answer:
         raise HTTPException(status_code=404, detail="Answer not found")
     
     # Controlla se l'utente ha già validato questa risposta
-    existing_validation = db.query(Validation).filter(
+    existing_validation = (await db.execute(select(Validation).where(
         and_(
             Validation.answer_id == validation.answer_id,
             Validation.validator_id == current_user.id
         )
-    ).first()
+    ))).scalars().first()
     if existing_validation:
         raise HTTPException(status_code=400, detail="You have already validated this answer")
     
@@ -116,37 +155,60 @@ async def create_validation(
         feedback=validation.feedback
     )
     db.add(db_validation)
-    db.commit()
-    db.refresh(db_validation)
+    # Conteggio per la coda delle validazioni (e chiusura del lease)
+    await record_validation(validation.answer_id, current_user.id, db)
     
-    # Assegna punti al validatore
-    points = 10 if validation.is_correct else 5  # Più punti per validazioni corrette
-    update_user_score(current_user.id, points, db)
-    
-    # Assegna punti all'autore della risposta se la valutazione è positiva
+    # Punti da assegnare nella stessa transazione della validazione
+    # Validatore: più punti per validazioni corrette
+    awards = {current_user.id: 10 if validation.is_correct else 5}
+    # Autore della risposta: solo se la valutazione è positiva
     if answer.user_id and validation.is_correct and validation.score >= 7:
-        update_user_score(answer.user_id, int(validation.score * 2), db)
+        awards[answer.user_id] = awards.get(answer.user_id, 0) + int(validation.score * 2)
+    
+    # Gli utenti vengono aggiornati in ordine di id: due validazioni
+    # concorrenti bloccano le righe nello stesso ordine (niente deadlock)
+    new_scores = {}
+    for user_id in sorted(awards):
+        new_scores[user_id] = await update_user_score(user_id, awards[user_id], db)
     
-    question = db.query(Question).filter(Question.id == answer.question_id).first()
+    question = await db.get(Question, answer.question_id)
     if question and question.tag:
-        # Salva per il validatore
-        save_validated_tag(current_user.id, question.id, question.tag, validation.score, db)
-        # Salva per il rispondente solo se diverso dal validatore e diverso dal creatore della domanda
+        # Tag per il validatore
+        tag_rows = [{"user_id": current_user.id, "question_id": question.id, "tag": question.tag, "score": validation.score}]
+        # Per il rispondente solo se diverso dal validatore e diverso dal creatore della domanda
         if answer.user_id and answer.user_id != current_user.id and answer.user_id != question.creator_id:
-            save_validated_tag(answer.user_id, question.id, question.tag, validation.score, db)
+            tag_rows.append({"user_id": answer.user_id, "question_id": question.id, "tag": question.tag, "score": validation.score})
+        await save_validated_tags(tag_rows, db)
+    
+    # Un solo commit per validazione, punti e tag
+    await db.commit()
+    
+    # Alla classifica vanno i punti assegnati, non il punteggio letto nella
+    # transazione: con validazioni concorrenti gli aggiornamenti possono
+    # arrivare in qualunque ordine
+    for user_id, score in new_scores.items():
+        if score is not None:
+            await leaderboard_index.add_points(user_id, awards[user_id])
+    await db.refresh(db_validation)
     
     return ValidationResponse.from_orm(db_validation)
 
+# Dimensione della pagina delle validazioni pendenti (default e massimo)
+PENDING_PAGE_SIZE = int(os.getenv("PENDING_PAGE_SIZE", "10"))
+PENDING_MAX_PAGE_SIZE = int(os.getenv("PENDING_MAX_PAGE_SIZE", "50"))
+
 @router.get("/pending", response_model=List[PendingValidationResponse])
 async def get_pending_validations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    page_size: int = PENDING_PAGE_SIZE,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Recupera le risposte che necessitano di validazione.
     Esclude le risposte dell'utente corrente e quelle già validate.
     
     Args:
+        page_size: Numero massimo di risposte restituite (max PENDING_MAX_PAGE_SIZE)
         current_user: Utente che richiede le validazioni
         db: Sessione del database
     
@@ -157,245 +219,422 @@ async def get_pending_validations(
         - Risposta AI corrispondente (se presente)
     
     Note:
-        Limita il risultato a 10 risposte per volta
-    """
-    print(f"\n=== Richiesta validazioni pendenti per utente {current_user.username} ===")
-    
-    # Trova le risposte già validate dall'utente
-    subquery = db.query(Validation.answer_id).filter(
-        Validation.validator_id == current_user.id
-    ).subquery()
-    
-    # Recupera le risposte da validare
-    answers = db.query(Answer).filter(
-        Answer.user_id != current_user.id,  # Esclude le proprie risposte
-        ~Answer.id.in_(subquery)  # Esclude risposte già validate
-    ).limit(10).all()
-    
-    print(f"Trovate {len(answers)} risposte da validare")
-    
-    # Costruisce il risultato completo per ogni risposta
-    result = []
-    for answer in answers:
-        print(f"\nProcessando risposta ID: {answer.id}")
-        print(f"Testo risposta: {answer.text}")
-        
-        # Recupera la domanda con il tema
-        question = db.query(Question).filter(Question.id == answer.question_id).first()
-        if not question:
-            print(f"Domanda non trovata per ID: {answer.question_id}")
-            continue
-            
-        print(f"Domanda trovata: {question.text}")
-            
-        # Recupera il tema culturale
-        theme = db.query(CulturalTheme).filter(CulturalTheme.id == question.theme_id).first()
-        if not theme:
-            print(f"Tema non trovato per ID: {question.theme_id}")
-            continue
-            
-        print(f"Tema trovato: {theme.name}")
-            
-        # Recupera la risposta AI corrispondente
-        llm_answer = db.query(Answer).filter(
-            Answer.question_id == answer.question_id,
-            Answer.is_llm_answer == True
-        ).first()
-        
-        if llm_answer:
-            print(f"Risposta LLM trovata: {llm_answer.text}")
-        else:
-            print("Nessuna risposta LLM trovata")
-        
-        # Associa il tema alla domanda
-        question.theme = theme
-        
-        # Aggiunge la risposta completa al risultato
-        result.append(PendingValidationResponse(
-            answer=answer,
-            question=question,
-            llm_answer=llm_answer
+        Le risposte sono assegnate in lease al validatore (services/validation_queue.py):
+        validatori concorrenti ricevono risposte diverse, prima quelle con meno
+        validazioni. Risposta, domanda, tema e risposta AI arrivano poi da
+        un'unica query (join sulla risposta AI e sulla domanda con il suo tema).
+    """
+    page_size = max(1, min(page_size, PENDING_MAX_PAGE_SIZE))
+    answer_ids = await lease_answers(current_user.id, page_size, db)
+    if not answer_ids:
+        return []
+    llm_answer = aliased(Answer)
+
+    rows = (await db.execute(
+        select(Answer, llm_answer)
+        .options(joinedload(Answer.question, innerjoin=True).joinedload(Question.theme, innerjoin=True))
+        .outerjoin(llm_answer, and_(
+            llm_answer.question_id == Answer.question_id,
+            llm_answer.is_llm_answer == True
         ))
-    
-    print(f"\nTotale risposte da validare restituite: {len(result)}")
-    return result
+        .where(Answer.id.in_(answer_ids))
+    )).all()
+    by_id = {answer.id: (answer, llm) for answer, llm in rows}
+
+    return [
+        PendingValidationResponse(answer=answer, question=answer.question, llm_answer=llm)
+        for answer, llm in (by_id[answer_id] for answer_id in answer_ids if answer_id in by_id)
+    ]
+
+@router.post("/pending/{answer_id}/release")
+async def release_pending_validation(
+    answer_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Rilascia una risposta assegnata all'utente (es. se decide di saltarla),
+    che torna subito disponibile per gli altri validatori.
+    """
+    if not await release_lease(answer_id, current_user.id, db):
+        raise HTTPException(status_code=404, detail="No lease on this answer")
+    return {"answer_id": answer_id, "released": True}
 
 @router.get("/answer/{answer_id}", response_model=List[ValidationResponse])
-async def get_validations_for_answer(answer_id: int, db: Session = Depends(get_db)):
+async def get_validations_for_answer(
+    answer_id: int,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Recupera tutte le validazioni per una specifica risposta.
+    Recupera le validazioni per una specifica risposta, in ordine di creazione.
     
     Args:
         answer_id: ID della risposta
+        limit: Dimensione della pagina (max MAX_PAGE_SIZE)
+        cursor: Cursore della pagina successiva (header X-Next-Cursor della risposta precedente)
         db: Sessione del database
     
     Returns:
-        Lista di tutte le validazioni per la risposta specificata
+        Una pagina delle validazioni per la risposta specificata
     """
-    validations = db.query(Validation).filter(Validation.answer_id == answer_id).all()
+    limit = clamp_page_size(limit)
+    query = keyset_page(select(Validation).where(Validation.answer_id == answer_id), Validation, cursor, limit)
+    validations, next_cursor = split_page((await db.execute(query)).scalars().all(), limit)
+    set_next_cursor(response, next_cursor)
     return validations
 
-@router.post("/llm-validate", response_model=List[ValidationResponse])
+# Concorrenza delle chiamate al giudice LLM nella validazione massiva
+# - LLM_VALIDATE_CONCURRENCY: valore di default
+# - LLM_VALIDATE_MAX_CONCURRENCY: limite massimo richiedibile dal client
+# - LLM_VALIDATE_MAX_ITEMS: numero massimo di risposte per richiesta (ridotto
+#   se la quota di chiamate al modello ne ammette meno, vedi max_llm_items)
+LLM_VALIDATE_CONCURRENCY = int(os.getenv("LLM_VALIDATE_CONCURRENCY", "4"))
+LLM_VALIDATE_MAX_CONCURRENCY = int(os.getenv("LLM_VALIDATE_MAX_CONCURRENCY", "16"))
+LLM_VALIDATE_MAX_ITEMS = int(os.getenv("LLM_VALIDATE_MAX_ITEMS", "1000"))
+
+# Tipo di job per la validazione di una risposta da parte del modello LLM
+LLM_VALIDATION_JOB = "llm_validation"
+
+def build_judge_prompt(question_text: str, theme_name: Optional[str], answer_text: str, is_llm: bool = False) -> str:
+    """
+    Costruisce il prompt con cui il modello LLM valuta una risposta salvata nel DB.
+    Le istruzioni sul formato della risposta vengono aggiunte da llm_judge.
+    """
+    return f"""
+    Sei un esperto di cultura italiana e il tuo compito è valutare una risposta a una domanda su questo tema.
+
+    ISTRUZIONI IMPORTANTI:
+    Devi rispondere ESATTAMENTE nel formato indicato alla fine, senza alcuna variazione, senza markdown, senza intestazioni, senza spiegazioni extra. Ogni campo deve apparire nell'ordine esatto, con etichette identiche e valori numerici nel formato richiesto. Non usare punti elenco, non saltare righe. Eventuali deviazioni sono considerate errore.
+
+    Domanda: {question_text}  
+    Tema: {theme_name or 'N/A'}  
+    Risposta da valutare: {answer_text}  
+    Tipo risposta: {'LLM' if is_llm else 'Umana'}
+
+    Valuta la risposta considerando i seguenti 4 criteri:
+    1. Correttezza (accuratezza delle informazioni)
+    2. Rilevanza (pertinenza rispetto alla domanda)
+    3. Dettaglio (completezza della risposta)
+    4. Chiarezza (comprensibilità e struttura)
+
+    Assegna:
+    - Un punteggio da 0 a 10 per ciascun criterio (0 = completamente sbagliato/inappropriato)
+    - Un punteggio complessivo da 0 a 10 (0 = completamente sbagliato/inappropriato)
+    - Un breve feedback (1-2 frasi) che giustifichi il punteggio
+
+    """
+
+async def judge_answer(question_text: str, theme_name: Optional[str], answer_text: str, is_llm: bool = False) -> Tuple[float, str]:
+    """
+    Chiede al modello LLM di valutare una risposta.
+
+    Returns:
+        Coppia (punteggio complessivo 0-10, feedback)
+
+    Raises:
+        JudgeError (ValueError): modello non raggiungibile o output non valido
+    """
+    result = await llm_judge.judge(build_judge_prompt(question_text, theme_name, answer_text, is_llm))
+    return result.punteggio_complessivo, result.feedback
+
+async def save_llm_validation(answer_id: int, score: float, feedback: str, db: AsyncSession) -> ValidationResponse:
+    """Salva una validazione del modello LLM nella tabella llm_validations."""
+    llm_validation = LLMValidation(
+        answer_id=answer_id,
+        score=score,
+        is_correct=score >= 6,
+        feedback=feedback
+    )
+    db.add(llm_validation)
+    await db.commit()
+    await db.refresh(llm_validation)
+
+    return ValidationResponse(
+        id=llm_validation.id,
+        answer_id=llm_validation.answer_id,
+        validator_id=None,
+        score=llm_validation.score,
+        is_correct=llm_validation.is_correct,
+        feedback=llm_validation.feedback,
+        created_at=llm_validation.created_at
+    )
+
+@router.post("/llm-validate", response_model=List[ValidationResponse], dependencies=[Depends(llm_quota("validate.llm"))])
 async def validate_with_llm(
     answer_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Valuta sia la risposta umana che la risposta LLM corrispondente utilizzando il modello LLM.
     Le validazioni vengono salvate nella tabella llm_validations.
+    Le due valutazioni vengono richieste al modello in parallelo.
     
     Returns:
         Lista di due ValidationResponse: una per la risposta umana e una per la risposta LLM
     """
     # Recupera la risposta umana e la domanda
-    human_answer = db.query(Answer).filter(Answer.id == answer_id).first()
+    human_answer = await db.get(Answer, answer_id)
     if not human_answer:
         raise HTTPException(status_code=404, detail="Risposta umana non trovata")
     
-    question = db.query(Question).filter(Question.id == human_answer.question_id).first()
+    question = (await db.execute(
+        select(Question).options(selectinload(Question.theme)).where(Question.id == human_answer.question_id)
+    )).scalars().first()
     if not question:
         raise HTTPException(status_code=404, detail="Domanda non trovata")
     
     # Recupera la risposta LLM corrispondente
-    llm_answer = db.query(Answer).filter(
+    llm_answer = (await db.execute(select(Answer).where(
         Answer.question_id == human_answer.question_id,
         Answer.is_llm_answer == True
-    ).first()
+    ))).scalars().first()
     
     if not llm_answer:
         raise HTTPException(status_code=404, detail="Risposta LLM non trovata")
     
-    validations = []
-    
-    # Funzione helper per validare una singola risposta
-    def validate_single_answer(answer, is_llm=False):
-        prompt = f"""
-        Sei un esperto di cultura italiana e il tuo compito è valutare una risposta a una domanda su questo tema.
-
-        ISTRUZIONI IMPORTANTI:
-        Devi fornire ESATTAMENTE il seguente formato, senza alcuna variazione, senza markdown, senza intestazioni, senza spiegazioni extra. Ogni campo deve apparire nell'ordine esatto, con etichette identiche e valori numerici nel formato richiesto. Non usare punti elenco, non saltare righe. Eventuali deviazioni sono considerate errore.
-
-        Domanda: {question.text}  
-        Tema: {question.theme.name if question.theme else 'N/A'}  
-        Risposta da valutare: {answer.text}  
-        Tipo risposta: {'LLM' if is_llm else 'Umana'}
-
-        Valuta la risposta considerando i seguenti 4 criteri:
-        1. Correttezza (accuratezza delle informazioni)
-        2. Rilevanza (pertinenza rispetto alla domanda)
-        3. Dettaglio (completezza della risposta)
-        4. Chiarezza (comprensibilità e struttura)
-
-        Assegna:
-        - Un punteggio da 0 a 10 per ciascun criterio (0 = completamente sbagliato/inappropriato)
-        - Un punteggio complessivo da 0 a 10 (0 = completamente sbagliato/inappropriato)
-        - Un breve feedback (1-2 frasi) che giustifichi il punteggio
-
-        RISPOSTA FINALE – FORMATO OBBLIGATORIO:
-        Correttezza: [0-10]  
-        Rilevanza: [0-10]  
-        Dettaglio: [0-10]  
-        Chiarezza: [0-10]  
-        Punteggio complessivo: [0-10]  
-        Feedback: [breve spiegazione della valutazione]
-
-        NON includere altri commenti, spiegazioni, simboli o formattazioni. Segui il formato richiesto alla lettera.
-        """
-        
-        llm_response = llm_service.generate_answer(prompt)
-        
-        try:
-            # Dividi la risposta in righe e rimuovi spazi vuoti
-            lines = [line.strip() for line in llm_response.split('\n') if line.strip()]
-            print("--------------------------------")
-            print("--------------------------------")
-            print("Domanda valutata: ", question.text)
-            print("Risposta da valutare: ", answer.text)
-            print("risposta ricevuta LLM: ", lines)
-            print("--------------------------------")
-            print("--------------------------------")
-            # Cerca il punteggio complessivo
-            score_lines = [line for line in lines if 'Punteggio complessivo:' in line]
-            if not score_lines:
-                raise ValueError("Formato risposta non valido: manca il punteggio complessivo")
-            
-            score_str = score_lines[0].split(':')[1].strip()
-            match = re.search(r'([0-9]|10)', score_str)
-            if not match:
-                raise ValueError(f"Punteggio non valido nel testo: {score_str}")
-            score = float(match.group(1))
-            
-            # Cerca il feedback
-            feedback_lines = [line for line in lines if 'Feedback:' in line]
-            if not feedback_lines:
-                raise ValueError("Formato risposta non valido: manca il feedback")
-            
-            feedback = feedback_lines[0].split(':')[1].strip()
-            if not feedback:
-                feedback = "Nessun feedback fornito"
-            
-            llm_validation = LLMValidation(
-                answer_id=answer.id,
-                score=score,  # Non serve più normalizzare
-                is_correct=score >= 6,
-                feedback=feedback
-            )
-            
-            db.add(llm_validation)
-            db.commit()
-            db.refresh(llm_validation)
-            
-            return ValidationResponse(
-                id=llm_validation.id,
-                answer_id=llm_validation.answer_id,
-                validator_id=None,
-                score=llm_validation.score,
-                is_correct=llm_validation.is_correct,
-                feedback=llm_validation.feedback,
-                created_at=llm_validation.created_at
-            )
-            
-        except ValueError as ve:
-            print(f"Errore di validazione: {str(ve)}")
-            print(f"Risposta LLM ricevuta: {llm_response}")
-            raise HTTPException(status_code=500, detail=f"Errore nel formato della risposta LLM: {str(ve)}")
-        except Exception as e:
-            print(f"Errore generico: {str(e)}")
-            print(f"Risposta LLM ricevuta: {llm_response}")
-            raise HTTPException(status_code=500, detail=f"Errore nell'elaborazione della risposta LLM: {str(e)}")
-    
-    # Valida entrambe le risposte
-    validations.append(validate_single_answer(human_answer, False))
-    validations.append(validate_single_answer(llm_answer, True))
+    theme_name = question.theme.name if question.theme else None
+    try:
+        results = await asyncio.gather(
+            judge_answer(question.text, theme_name, human_answer.text, False),
+            judge_answer(question.text, theme_name, llm_answer.text, True),
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=500, detail=f"Errore nel formato della risposta LLM: {str(ve)}")
     
-    return validations
+    return [
+        await save_llm_validation(answer.id, score, feedback, db)
+        for answer, (score, feedback) in zip((human_answer, llm_answer), results)
+    ]
+
+@router.post("/llm-validate/bulk")
+async def validate_with_llm_bulk(
+    request: BulkLLMValidationRequest,
+    http_request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Valuta con il modello LLM molte risposte in una sola chiamata (richiede il login).
+    La quota di chiamate al modello viene scalata per ogni risposta selezionata;
+    `limit` è ridotto al numero di risposte che la quota ammette in una richiesta.
+
+    Le risposte si selezionano per ID (answer_ids) oppure tramite filtri
+    (tema, intervallo di date, solo quelle non ancora validate dal modello).
+    Le chiamate al giudice girano in parallelo fino al limite di concorrenza
+    e i risultati vengono inviati come Server-Sent Events appena pronti:
+    - "result": {"answer_id", "validation"} per ogni risposta valutata
+    - "error": {"answer_id", "detail"} se la valutazione di una risposta fallisce
+    - "done": riepilogo con totale, successi e fallimenti
+    Se il client si disconnette le valutazioni non ancora completate vengono annullate.
+    """
+    limit = max(1, min(request.limit, max_llm_items("validate.llm_bulk", LLM_VALIDATE_MAX_ITEMS)))
+    concurrency = max(1, min(request.concurrency or LLM_VALIDATE_CONCURRENCY, LLM_VALIDATE_MAX_CONCURRENCY))
+
+    query = select(Answer).join(Question, Answer.question_id == Question.id).options(
+        joinedload(Answer.question).joinedload(Question.theme)
+    )
+    if request.answer_ids:
+        query = query.where(Answer.id.in_(request.answer_ids))
+    elif not request.include_llm_answers:
+        query = query.where(Answer.is_llm_answer == False)
+    if request.theme_id is not None:
+        query = query.where(Question.theme_id == request.theme_id)
+    if request.created_from is not None:
+        query = query.where(Answer.created_at >= request.created_from)
+    if request.created_to is not None:
+        query = query.where(Answer.created_at <= request.created_to)
+    if request.only_unvalidated:
+        query = query.where(~exists().where(LLMValidation.answer_id == Answer.id))
+
+    # Copia i dati necessari: lo stream continua dopo la fine della richiesta
+    items = [
+        (
+            answer.id,
+            answer.question.text,
+            answer.question.theme.name if answer.question.theme else None,
+            answer.text,
+            bool(answer.is_llm_answer),
+        )
+        for answer in (await db.execute(query.order_by(Answer.id).limit(limit))).scalars().all()
+    ]
+    await charge_llm_items("validate.llm_bulk", len(items), http_request, current_user)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def judge_item(item):
+        answer_id, question_text, theme_name, answer_text, is_llm = item
+        async with semaphore:
+            try:
+                score, feedback = await judge_answer(question_text, theme_name, answer_text, is_llm)
+            except ValueError as ve:
+                return answer_id, None, f"Errore nel formato della risposta LLM: {str(ve)}"
+            except LLMAdmissionError as e:
+                return answer_id, None, e.detail
+        return answer_id, (score, feedback), None
+
+    async def event_stream():
+        succeeded = failed = 0
+        tasks = [asyncio.ensure_future(judge_item(item)) for item in items]
+        try:
+            async with AsyncSessionLocal() as session:
+                for next_result in asyncio.as_completed(tasks):
+                    answer_id, result, error = await next_result
+                    if error:
+                        failed += 1
+                        yield format_sse("error", {"answer_id": answer_id, "detail": error})
+                        continue
+                    validation = await save_llm_validation(answer_id, result[0], result[1], session)
+                    succeeded += 1
+                    yield format_sse("result", {"answer_id": answer_id, "validation": validation.model_dump(mode="json")})
+            yield format_sse("done", {"total": len(items), "succeeded": succeeded, "failed": failed})
+        finally:
+            # Stream interrotto (client disconnesso): le valutazioni in attesa non chiamano più il modello
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@job_queue.handler(LLM_VALIDATION_JOB)
+async def llm_validation_job(payload: dict, db: AsyncSession) -> dict:
+    """Job che valuta una risposta con il modello LLM e salva il risultato."""
+    answer = (await db.execute(select(Answer).options(
+        joinedload(Answer.question).joinedload(Question.theme)
+    ).where(Answer.id == payload["answer_id"]))).scalars().first()
+    if not answer:
+        return {"validation_id": None}
+    question = answer.question
+    score, feedback = await judge_answer(
+        question.text,
+        question.theme.name if question.theme else None,
+        answer.text,
+        bool(answer.is_llm_answer),
+    )
+    validation = await save_llm_validation(answer.id, score, feedback, db)
+    return {"validation_id": validation.id, "score": score}
+
+@router.post("/llm-validate/jobs", response_model=List[JobResponse])
+async def enqueue_llm_validations(
+    http_request: Request,
+    answer_ids: List[int] = Body(..., embed=True),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Mette in coda la validazione LLM delle risposte indicate (richiede il login).
+    La quota di chiamate al modello viene scalata per ogni risposta.
+    Restituisce un job per risposta; lo stato si consulta su /api/jobs/{job_id}.
+    Una risposta già in coda (o già validata tramite job) non viene accodata di nuovo.
+    """
+    max_items = max_llm_items("validate.llm_jobs", LLM_VALIDATE_MAX_ITEMS)
+    if len(answer_ids) > max_items:
+        raise HTTPException(status_code=400, detail=f"Massimo {max_items} risposte per richiesta")
+    await charge_llm_items("validate.llm_jobs", len(answer_ids), http_request, current_user)
+    jobs = [
+        await job_queue.enqueue(
+            db,
+            LLM_VALIDATION_JOB,
+            {"answer_id": answer_id},
+            dedup_key=f"{LLM_VALIDATION_JOB}:{answer_id}",
+        )
+        for answer_id in answer_ids
+    ]
+    return [job_to_response(job) for job in jobs]
 
 @router.get("/validated-tags/me", response_model=ValidatedTagResponseList)
-async def get_my_validated_tags(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_my_validated_tags(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Restituisce tutti i tag e punteggi delle domande validate dall'utente (come validatore).
+    Restituisce i tag e punteggi delle domande validate dall'utente (come validatore),
+    una pagina alla volta: next_cursor va ripassato come `cursor` per la pagina successiva.
     """
     # Prendi solo le validazioni dove l'utente è stato validatore
-    validated_questions = db.query(Validation.answer_id).filter(Validation.validator_id == current_user.id).subquery()
+    validated_questions = select(Validation.answer_id).where(Validation.validator_id == current_user.id)
     # Trova le domande associate a queste risposte
-    validated_question_ids = db.query(Answer.question_id).filter(Answer.id.in_(validated_questions)).distinct()
-    tags = db.query(ValidatedTag).filter(ValidatedTag.user_id == current_user.id, ValidatedTag.question_id.in_(validated_question_ids)).all()
-    return ValidatedTagResponseList(items=tags)
+    validated_question_ids = select(Answer.question_id).where(Answer.id.in_(validated_questions)).distinct()
+    limit = clamp_page_size(limit)
+    query = keyset_page(
+        select(ValidatedTag).where(ValidatedTag.user_id == current_user.id, ValidatedTag.question_id.in_(validated_question_ids)),
+        ValidatedTag, cursor, limit,
+    )
+    tags, next_cursor = split_page((await db.execute(query)).scalars().all(), limit)
+    return ValidatedTagResponseList(items=tags, next_cursor=next_cursor)
 
 @router.get("/validated-tags/by-answers", response_model=ValidatedTagResponseList)
-async def get_validated_tags_by_answers(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_validated_tags_by_answers(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Restituisce tutti i tag e punteggi delle domande a cui l'utente ha risposto (solo i suoi).
+    Restituisce i tag e punteggi delle domande a cui l'utente ha risposto (solo i suoi),
+    una pagina alla volta come /validated-tags/me.
     """
     # Trova tutte le domande a cui l'utente ha risposto
-    answered_questions = db.query(Answer.question_id).filter(Answer.user_id == current_user.id).distinct()
-    tags = db.query(ValidatedTag).filter(
+    answered_questions = select(Answer.question_id).where(Answer.user_id == current_user.id).distinct()
+    limit = clamp_page_size(limit)
+    query = keyset_page(select(ValidatedTag).where(
         ValidatedTag.user_id == current_user.id,
         ValidatedTag.question_id.in_(answered_questions)
-    ).all()
-    return ValidatedTagResponseList(items=tags)
+    ), ValidatedTag, cursor, limit)
+    tags, next_cursor = split_page((await db.execute(query)).scalars().all(), limit)
+    return ValidatedTagResponseList(items=tags, next_cursor=next_cursor)
+
+async def judge_text_answer(question_text: str, theme: str, answer_text: str, is_llm: bool = False) -> ValidationResponse:
+    """
+    Valuta con il modello LLM una risposta arbitraria (non presente nel DB).
+
+    Returns:
+        ValidationResponse mock (id=0, answer_id=0, senza data di creazione)
 
-@router.post("/llm-validate-text", response_model=List[ValidationResponse])
+    Raises:
+        HTTPException: 500 se la risposta del modello non rispetta il formato
+    """
+    prompt = f"""
+    Valuta la seguente risposta a una domanda sulla cultura italiana,sei un esperto di cultura italiana.
+    Non ti fare problemi a dare voti molto bassi se ritieni la risposta sbagliata o non pertinente.
+    Domanda: {question_text}
+    Tema: {theme}
+    Risposta da valutare: {answer_text}
+    Tipo risposta: {'LLM' if is_llm else 'Umana'}
+    
+    Valuta la risposta considerando:
+    1. Correttezza (accuratezza delle informazioni)
+    2. Rilevanza (pertinenza rispetto alla domanda)
+    3. Dettaglio (completezza della risposta)
+    4. Chiarezza (comprensibilità e struttura)
+    
+    Fornisci:
+    1. Un punteggio da 0 a 10 per ogni criterio (0 = completamente sbagliato/inappropriato)
+    2. Un punteggio complessivo da 0 a 10
+    3. Un breve feedback che spieghi la valutazione
+    
+    """
+    try:
+        result = await llm_judge.judge(prompt)
+    except JudgeError as e:
+        raise HTTPException(status_code=500, detail=f"Errore nel parsing della risposta LLM: {str(e)}")
+    return ValidationResponse(
+        id=0,
+        answer_id=0,
+        validator_id=None,
+        score=result.punteggio_complessivo,
+        is_correct=result.punteggio_complessivo >= 6,
+        feedback=result.feedback,
+        created_at=None
+    )
+
+@router.post("/llm-validate-text", response_model=List[ValidationResponse], dependencies=[Depends(llm_quota("validate.llm_text"))])
 async def validate_with_llm_text(
     answer_text: str = Body(..., embed=True),
     question_text: str = Body("Domanda di esempio", embed=True),
@@ -405,75 +644,51 @@ async def validate_with_llm_text(
     Valida una risposta arbitraria (non presente nel DB) e una risposta LLM generata al volo.
     Restituisce una lista di 2 ValidationResponse (mock, senza DB).
     """
-    # Funzione helper per validare una singola risposta
-    def validate_single_answer(answer_text, is_llm=False):
-        prompt = f"""
-        Valuta la seguente risposta a una domanda sulla cultura italiana,sei un esperto di cultura italiana.
-        Non ti fare problemi a dare voti molto bassi se ritieni la risposta sbagliata o non pertinente.
-        Domanda: {question_text}
-        Tema: {theme}
-        Risposta da valutare: {answer_text}
-        Tipo risposta: {'LLM' if is_llm else 'Umana'}
-        
-        Valuta la risposta considerando:
-        1. Correttezza (accuratezza delle informazioni)
-        2. Rilevanza (pertinenza rispetto alla domanda)
-        3. Dettaglio (completezza della risposta)
-        4. Chiarezza (comprensibilità e struttura)
-        
-        Fornisci:
-        1. Un punteggio da 0 a 10 per ogni criterio (0 = completamente sbagliato/inappropriato)
-        2. Un punteggio complessivo da 0 a 10
-        3. Un breve feedback che spieghi la valutazione
-        
-        Formato di risposta richiesto:
-        Correttezza: [0-10]
-        Rilevanza: [0-10]
-        Dettaglio: [0-10]
-        Chiarezza: [0-10]
-        Punteggio complessivo: [0-10]
-        Feedback: [breve spiegazione]
-        Non usare markdown o formattazioni particolari.
-        Rispetta esattamente il formato richiesto. Non sono ammessi errori.
-        Riporta quindi correttezza, rilevanza, dettaglio, chiarezza, punteggio complessivo e feedback.
-        """
-        llm_response = llm_service.generate_answer(prompt)
+    async def generate_and_judge():
+        # Genera una risposta LLM per la stessa domanda e la valuta
+        llm_generated_answer = await llm_service.generate_answer(question_text, theme)
+        return await judge_text_answer(question_text, theme, llm_generated_answer, is_llm=True)
+
+    # La valutazione della risposta umana non dipende dalla generazione: vanno in parallelo
+    return list(await asyncio.gather(
+        judge_text_answer(question_text, theme, answer_text, is_llm=False),
+        generate_and_judge(),
+    ))
+
+@router.post("/llm-validate-text/stream", dependencies=[Depends(llm_quota("validate.llm_text"))])
+async def validate_with_llm_text_stream(
+    answer_text: str = Body(..., embed=True),
+    question_text: str = Body("Domanda di esempio", embed=True),
+    theme: str = Body("Tema generico", embed=True),
+):
+    """
+    Variante in streaming (Server-Sent Events) di /llm-validate-text.
+    Eventi inviati:
+    - "token": frammenti della risposta LLM generata al volo
+    - "validation": una ValidationResponse per ciascuna risposta valutata
+    - "done": fine dello stream
+    - "error": errore durante la generazione o la valutazione
+    """
+    async def event_stream():
+        parts = []
         try:
-            lines = [line.strip() for line in llm_response.split('\n') if line.strip()]
-            score_lines = [line for line in lines if 'Punteggio complessivo:' in line]
-            if not score_lines:
-                raise ValueError("Formato risposta non valido: manca il punteggio complessivo")
-            score_str = score_lines[0].split(':')[1].strip()
-            match = re.search(r'([0-9]|10)', score_str)
-            if not match:
-                raise ValueError(f"Punteggio non valido nel testo: {score_str}")
-            score = float(match.group(1))
-            feedback_lines = [line for line in lines if 'Feedback:' in line]
-            if not feedback_lines:
-                raise ValueError("Formato risposta non valido: manca il feedback")
-            feedback = feedback_lines[0].split(':')[1].strip()
-            if not feedback:
-                feedback = "Nessun feedback fornito"
-            llm_validation = LLMValidation(
-                answer_id=0,
-                score=score,  # Non serve più normalizzare
-                is_correct=score >= 6,
-                feedback=feedback
-            )
-            return ValidationResponse(
-                id=0,
-                answer_id=0,
-                validator_id=None,
-                score=llm_validation.score,
-                is_correct=llm_validation.is_correct,
-                feedback=llm_validation.feedback,
-                created_at=None
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Errore nel parsing della risposta LLM: {str(e)}")
-    # Genera una risposta LLM per la stessa domanda
-    llm_generated_answer = llm_service.generate_answer(question_text, theme)
-    return [
-        validate_single_answer(answer_text, is_llm=False),
-        validate_single_answer(llm_generated_answer, is_llm=True)
-    ]
+            async for token in llm_service.stream_answer(question_text, theme):
+                parts.append(token)
+                yield format_sse("token", {"text": token})
+            llm_generated_answer = "".join(parts).strip()
+            for text, is_llm in ((answer_text, False), (llm_generated_answer, True)):
+                validation = await judge_text_answer(question_text, theme, text, is_llm=is_llm)
+                yield format_sse("validation", validation.model_dump(mode="json"))
+            yield format_sse("done", {})
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail})
+        except httpx.HTTPError as e:
+            yield format_sse("error", {"detail": f"Errore nella generazione LLM: {str(e)}"})
+        except LLMAdmissionError as e:
+            yield format_sse("error", {"detail": e.detail, "retry_after": e.retry_after})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
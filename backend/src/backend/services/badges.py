@@ -0,0 +1,79 @@
+# Badge degli utenti
+# I badge assegnati sono righe della tabella user_badges (indicizzata per
+# badge, così si possono cercare ad es. tutti i Gold Validator). Le regole
+# sono soglie di punteggio: un badge viene assegnato solo nel momento in cui
+# un aggiornamento del punteggio supera la sua soglia, senza rileggere i
+# badge già posseduti.
+# users.badges contiene solo la copia testuale ("Bronze Validator,Silver
+# Validator") restituita dalle API; viene riscritta quando si assegna un badge.
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models.schemas import User, UserBadge
+
+@dataclass(frozen=True)
+class BadgeRule:
+    code: str        # chiave memorizzata in user_badges.badge
+    name: str        # nome mostrato all'utente
+    min_score: int   # soglia di punteggio
+
+# Regole in ordine di soglia crescente
+BADGE_RULES = [
+    BadgeRule("bronze_validator", "Bronze Validator", 100),
+    BadgeRule("silver_validator", "Silver Validator", 500),
+    BadgeRule("gold_validator", "Gold Validator", 1000),
+]
+BADGES_BY_CODE = {rule.code: rule for rule in BADGE_RULES}
+BADGES_BY_NAME = {rule.name: rule for rule in BADGE_RULES}
+_THRESHOLDS = [rule.min_score for rule in BADGE_RULES]
+
+def crossed_badges(old_score: int, new_score: int) -> List[BadgeRule]:
+    """
+    Regole la cui soglia è stata superata passando da old_score a new_score.
+
+    Esempio:
+        (90, 120) -> [Bronze Validator]
+        (120, 130) -> []
+    """
+    if new_score <= old_score:
+        return []
+    return BADGE_RULES[bisect_right(_THRESHOLDS, old_score):bisect_right(_THRESHOLDS, new_score)]
+
+def badges_display(codes) -> str:
+    """Copia testuale dei badge nell'ordine delle regole (es. "Bronze Validator,Silver Validator")."""
+    codes = set(codes)
+    return ",".join(rule.name for rule in BADGE_RULES if rule.code in codes)
+
+async def award_badges(user_id: int, old_score: int, new_score: int, db: AsyncSession) -> List[BadgeRule]:
+    """
+    Assegna i badge le cui soglie sono state superate (senza commit).
+    Un badge già posseduto non viene duplicato.
+
+    Returns:
+        Le regole superate con questo aggiornamento
+    """
+    rules = crossed_badges(old_score, new_score)
+    if not rules:
+        return []
+    rows = [{"user_id": user_id, "badge": rule.code} for rule in rules]
+    dialect = db.bind.dialect.name
+    if dialect == "mysql":
+        await db.execute(mysql_insert(UserBadge).values(rows).prefix_with("IGNORE"))
+    elif dialect == "sqlite":
+        await db.execute(sqlite_insert(UserBadge).values(rows).on_conflict_do_nothing())
+    else:
+        owned = set((await db.execute(
+            select(UserBadge.badge).where(UserBadge.user_id == user_id)
+        )).scalars())
+        db.add_all(UserBadge(**row) for row in rows if row["badge"] not in owned)
+        await db.flush()
+
+    codes = (await db.execute(select(UserBadge.badge).where(UserBadge.user_id == user_id))).scalars()
+    await db.execute(update(User).where(User.id == user_id).values(badges=badges_display(codes)))
+    return rules
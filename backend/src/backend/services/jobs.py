@@ -0,0 +1,311 @@
+# Coda di job persistente per il lavoro LLM (risposte AI, tag, validazioni)
+# I job vengono salvati nella tabella `jobs` e quindi sopravvivono a riavvii
+# e a --reload. Un pool di worker asincroni li preleva con un lease,
+# li esegue con una sessione del database propria e li ritenta con backoff.
+# Se Ollama non è disponibile o è sovraccarico (LLMAdmissionError) il job viene
+# rinviato di retry_after secondi senza consumare un tentativo: un'interruzione
+# di Ollama non fa fallire definitivamente i job.
+import asyncio
+import json
+import os
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models.schemas import Job
+from backend.services.database import AsyncSessionLocal
+from backend.services.llm_admission import LLMAdmissionError
+
+# Configurazione tramite variabili d'ambiente
+# - JOB_WORKERS: worker avviati nel processo dell'API (0 = solo worker esterni)
+# - JOB_POLL_INTERVAL: secondi tra due controlli della coda quando è vuota
+# - JOB_LEASE_SECONDS: durata del lease; scaduto, il job può essere ripreso da un altro worker
+# - JOB_MAX_ATTEMPTS: tentativi massimi di default
+# - JOB_RETRY_BASE_DELAY / JOB_RETRY_MAX_DELAY: backoff esponenziale tra i tentativi
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# Stati di un job
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Un handler riceve il payload del job e una sessione dedicata,
+# e può restituire un risultato serializzabile in JSON
+JobHandler = Callable[[dict, AsyncSession], Awaitable[Optional[dict]]]
+
+def utcnow() -> datetime:
+    return datetime.utcnow()
+
+def retry_delay(attempts: int) -> float:
+    """Ritardo in secondi prima del prossimo tentativo (backoff esponenziale)."""
+    return min(JOB_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), JOB_RETRY_MAX_DELAY)
+
+class JobQueue:
+    """
+    Coda di job basata sul database.
+
+    Gli handler si registrano per tipo di job con il decoratore `handler`;
+    `enqueue` inserisce un job (de-duplicato per `dedup_key`) e `start`
+    avvia i worker nel processo corrente.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def handler(self, kind: str):
+        """Decoratore che registra l'handler per un tipo di job."""
+        def decorator(fn: JobHandler) -> JobHandler:
+            self._handlers[kind] = fn
+            return fn
+        return decorator
+
+    # --- Inserimento ---
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        kind: str,
+        payload: dict,
+        dedup_key: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        delay: float = 0,
+    ) -> Job:
+        """
+        Inserisce un job nella coda e fa commit.
+
+        Se esiste già un job con la stessa `dedup_key` viene restituito quello;
+        un job fallito con la stessa chiave viene rimesso in coda.
+        """
+        if dedup_key is not None:
+            existing = await self._get_by_dedup_key(db, dedup_key)
+            if existing is not None:
+                return await self._requeue_if_failed(db, existing)
+
+        now = utcnow()
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload),
+            dedup_key=dedup_key,
+            status=PENDING,
+            attempts=0,
+            max_attempts=max_attempts,
+            run_after=now + timedelta(seconds=delay),
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Stessa dedup_key inserita in parallelo da un'altra richiesta
+            await db.rollback()
+            existing = await self._get_by_dedup_key(db, dedup_key)
+            if existing is None:
+                raise
+            return await self._requeue_if_failed(db, existing)
+        await db.refresh(job)
+        self._notify()
+        return job
+
+    async def _get_by_dedup_key(self, db: AsyncSession, dedup_key: str) -> Optional[Job]:
+        return (await db.execute(select(Job).where(Job.dedup_key == dedup_key))).scalars().first()
+
+    async def _requeue_if_failed(self, db: AsyncSession, job: Job) -> Job:
+        if job.status == FAILED:
+            job.status = PENDING
+            job.attempts = 0
+            job.run_after = utcnow()
+            job.updated_at = utcnow()
+            await db.commit()
+            await db.refresh(job)
+            self._notify()
+        return job
+
+    def _notify(self):
+        """Sveglia i worker locali in attesa (se presenti)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- Prelievo ed esecuzione ---
+
+    async def _claim(self, db: AsyncSession) -> Optional[Job]:
+        """
+        Preleva un job eseguibile impostando un lease.
+        L'aggiornamento è condizionato a stato e tentativi letti (compare-and-set),
+        così due worker, anche in processi diversi, non prendono lo stesso job.
+        """
+        now = utcnow()
+        candidates = (await db.execute(
+            select(Job.id, Job.status, Job.attempts).where(
+                Job.kind.in_(list(self._handlers)),
+                or_(
+                    and_(Job.status == PENDING, Job.run_after <= now),
+                    and_(Job.status == RUNNING, Job.locked_until < now),  # lease scaduto
+                )
+            ).order_by(Job.run_after, Job.id).limit(5)
+        )).all()
+
+        for job_id, status, attempts in candidates:
+            claimed = await db.execute(
+                update(Job).where(
+                    Job.id == job_id,
+                    Job.status == status,
+                    Job.attempts == attempts,
+                ).values(
+                    status=RUNNING,
+                    attempts=attempts + 1,
+                    locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    updated_at=now,
+                ).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if claimed.rowcount:
+                return await db.get(Job, job_id, populate_existing=True)
+        return None
+
+    async def run_once(self) -> bool:
+        """
+        Preleva ed esegue un singolo job.
+
+        Returns:
+            True se è stato eseguito un job, False se la coda era vuota
+        """
+        async with AsyncSessionLocal() as db:
+            job = await self._claim(db)
+            if job is None:
+                return False
+
+            if job.attempts > job.max_attempts:
+                # Il lease è scaduto troppe volte (es. worker terminato durante l'esecuzione)
+                await self._finish(db, job, FAILED, error="Lease scaduto: tentativi esauriti")
+                return True
+
+            handler = self._handlers[job.kind]
+            try:
+                result = await handler(json.loads(job.payload or "{}"), db)
+            except LLMAdmissionError as e:
+                await db.rollback()
+                await db.refresh(job)  # il rollback fa scadere gli attributi del job
+                print(f"[jobs] Job {job.id} ({job.kind}) rinviato di {e.retry_after:.0f}s: {e.detail}")
+                # Il tentativo preso da _claim viene restituito
+                job.attempts = max(job.attempts - 1, 0)
+                await self._reschedule(db, job, e.retry_after, e.detail)
+                return True
+            except Exception as e:
+                await db.rollback()
+                await db.refresh(job)  # il rollback fa scadere gli attributi del job
+                print(f"[jobs] Job {job.id} ({job.kind}) fallito al tentativo {job.attempts}: {e}")
+                if job.attempts >= job.max_attempts:
+                    await self._finish(db, job, FAILED, error=traceback.format_exc())
+                else:
+                    await self._reschedule(db, job, retry_delay(job.attempts), str(e))
+                return True
+
+            await self._finish(db, job, DONE, result=result)
+            return True
+
+    async def _reschedule(self, db: AsyncSession, job: Job, delay: float, error: str):
+        """Rimette il job in coda, eseguibile tra `delay` secondi."""
+        job.status = PENDING
+        job.run_after = utcnow() + timedelta(seconds=delay)
+        job.locked_until = None
+        job.last_error = error
+        job.updated_at = utcnow()
+        await db.commit()
+
+    async def _finish(self, db: AsyncSession, job: Job, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        job.status = status
+        job.locked_until = None
+        job.updated_at = utcnow()
+        if result is not None:
+            job.result = json.dumps(result)
+        if error is not None:
+            job.last_error = error
+        await db.commit()
+
+    async def _worker(self, index: int):
+        while not self._stopping:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                # Errori del database o simili: il worker non deve morire
+                print(f"[jobs] Errore nel worker {index}: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Ciclo di vita del pool ---
+
+    def start(self, workers: int = JOB_WORKERS):
+        """Avvia `workers` worker nell'event loop corrente."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        for index in range(workers):
+            self._workers.append(asyncio.create_task(self._worker(index)))
+
+    async def stop(self):
+        """Ferma i worker locali; i job in corso tornano eseguibili alla scadenza del lease."""
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+
+    @property
+    def local_workers(self) -> int:
+        return len(self._workers)
+
+    # --- Stato ---
+
+    async def stats(self, db: AsyncSession) -> dict:
+        """Profondità della coda e conteggi per stato e tipo."""
+        by_status = dict((await db.execute(
+            select(Job.status, func.count(Job.id)).group_by(Job.status)
+        )).all())
+        pending_by_kind = dict((await db.execute(
+            select(Job.kind, func.count(Job.id)).where(Job.status == PENDING).group_by(Job.kind)
+        )).all())
+        oldest = await db.scalar(select(func.min(Job.created_at)).where(Job.status == PENDING))
+        return {
+            "depth": by_status.get(PENDING, 0),
+            "by_status": by_status,
+            "pending_by_kind": pending_by_kind,
+            "oldest_pending_seconds": (utcnow() - oldest).total_seconds() if oldest else None,
+            "local_workers": self.local_workers,
+        }
+
+def job_to_response(job: Job) -> dict:
+    """Converte un Job nel formato di JobResponse (payload e risultato decodificati)."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "dedup_key": job.dedup_key,
+        "run_after": job.run_after,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+# Istanza globale della coda
+job_queue = JobQueue()
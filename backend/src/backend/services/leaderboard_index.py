@@ -0,0 +1,441 @@
+# Indice in memoria della classifica
+# La classifica è mantenuta in una struttura ordinata con statistiche d'ordine
+# (skip list indicizzata), così top-N e posizione di un utente costano
+# O(log n) invece di un ORDER BY su tutta la tabella users.
+# L'indice viene ricostruito dal database all'avvio (e periodicamente) e
+# aggiornato dopo ogni commit con i punti assegnati (incrementi, non punteggi
+# assoluti: due validazioni concorrenti possono arrivare all'indice in
+# qualunque ordine senza che il punteggio più vecchio sovrascriva il nuovo).
+#
+# Con più processi (più worker uvicorn) ognuno ha il proprio indice: la
+# ricostruzione periodica li riallinea. Per avere un'unica classifica condivisa
+# si può usare Redis (LEADERBOARD_REDIS_URL), che memorizza la classifica in
+# un sorted set.
+#
+# A parità di punteggio viene prima l'utente con id più alto (stesso ordine
+# del sorted set di Redis e della query di fallback).
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from backend.models.schemas import User
+from backend.services.database import AsyncSessionLocal
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis è opzionale
+    aioredis = None
+
+# Configurazione tramite variabili d'ambiente
+# - LEADERBOARD_INDEX_ENABLED: "false" per usare sempre la query sul database
+# - LEADERBOARD_RESYNC_INTERVAL: secondi tra due ricostruzioni dal database (0 = solo all'avvio)
+# - LEADERBOARD_REDIS_URL: se impostato la classifica è condivisa tramite Redis
+# - LEADERBOARD_REDIS_KEY: chiave del sorted set su Redis
+LEADERBOARD_INDEX_ENABLED = os.getenv("LEADERBOARD_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+LEADERBOARD_RESYNC_INTERVAL = float(os.getenv("LEADERBOARD_RESYNC_INTERVAL", "300"))
+LEADERBOARD_REDIS_URL = os.getenv("LEADERBOARD_REDIS_URL", "")
+LEADERBOARD_REDIS_KEY = os.getenv("LEADERBOARD_REDIS_KEY", "culturallm:leaderboard")
+# Secondi di attesa prima di riprovare una ricostruzione fallita
+LEADERBOARD_RETRY_DELAY = 5
+
+class LeaderboardUnavailable(Exception):
+    """L'indice non è (ancora) utilizzabile: va usata la query sul database."""
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        # width[i]: numero di posizioni saltate seguendo next[i]
+        self.width = [0] * level
+
+class RankedSkipList:
+    """
+    Skip list indicizzata: insieme ordinato di chiavi con ricerca per
+    posizione e posizione di una chiave in O(log n) (in media).
+    Le posizioni partono da 1.
+    """
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.width[i] = self.size
+            self.level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key) -> bool:
+        update = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return True
+
+    def rank(self, key) -> Optional[int]:
+        """Posizione (da 1) di una chiave, None se assente."""
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                traversed += node.width[i]
+                node = node.next[i]
+        return traversed if node is not self.head and node.key == key else None
+
+    def slice(self, start: int, count: int) -> list:
+        """Fino a `count` chiavi a partire dalla posizione `start` (da 1)."""
+        if start < 1 or start > self.size or count <= 0:
+            return []
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and traversed + node.width[i] <= start:
+                traversed += node.width[i]
+                node = node.next[i]
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+class MemoryLeaderboard:
+    """Classifica nella memoria del processo."""
+    name = "memory"
+
+    def __init__(self):
+        self._list = RankedSkipList()
+        self._scores: Dict[int, int] = {}
+
+    @staticmethod
+    def _key(user_id: int, score: int) -> tuple:
+        return (-score, -user_id)
+
+    async def replace(self, entries: Iterable[Tuple[int, int]]):
+        ranked = RankedSkipList()
+        scores = {}
+        for user_id, score in entries:
+            scores[user_id] = score
+            ranked.insert(self._key(user_id, score))
+        self._list, self._scores = ranked, scores
+
+    async def set_score(self, user_id: int, score: int):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._list.remove(self._key(user_id, old))
+        self._scores[user_id] = score
+        self._list.insert(self._key(user_id, score))
+
+    async def increment(self, user_id: int, points: int):
+        await self.set_score(user_id, self._scores.get(user_id, 0) + points)
+
+    async def remove(self, user_id: int):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._list.remove(self._key(user_id, old))
+
+    async def top(self, limit: int, offset: int = 0) -> List[Tuple[int, int]]:
+        return [(-user_id, -score) for score, user_id in self._list.slice(offset + 1, limit)]
+
+    async def rank(self, user_id: int) -> Optional[int]:
+        score = self._scores.get(user_id)
+        return None if score is None else self._list.rank(self._key(user_id, score))
+
+    async def size(self) -> int:
+        return len(self._list)
+
+    async def aclose(self):
+        pass
+
+class RedisLeaderboard:
+    """
+    Classifica condivisa in un sorted set di Redis.
+    I membri sono gli id a lunghezza fissa, così a parità di punteggio
+    l'ordine lessicografico inverso di ZREVRANGE corrisponde all'id più alto.
+    """
+    name = "redis"
+
+    def __init__(self, url: str, key: str = LEADERBOARD_REDIS_KEY):
+        self.key = key
+        self._redis = aioredis.from_url(url)
+
+    @staticmethod
+    def _member(user_id: int) -> str:
+        return f"{user_id:012d}"
+
+    async def replace(self, entries: Iterable[Tuple[int, int]]):
+        # La nuova classifica viene scritta in una chiave temporanea e poi
+        # sostituita con RENAME (atomico): i lettori non vedono mai un indice parziale
+        temporary = f"{self.key}:rebuild:{uuid.uuid4().hex}"
+        mapping = {self._member(user_id): score for user_id, score in entries}
+        pipe = self._redis.pipeline(transaction=False)
+        items = list(mapping.items())
+        for start in range(0, len(items), 1000):
+            pipe.zadd(temporary, dict(items[start:start + 1000]))
+        if items:
+            pipe.rename(temporary, self.key)
+        else:
+            pipe.delete(self.key)
+        await pipe.execute()
+
+    async def set_score(self, user_id: int, score: int):
+        await self._redis.zadd(self.key, {self._member(user_id): score})
+
+    async def increment(self, user_id: int, points: int):
+        await self._redis.zincrby(self.key, points, self._member(user_id))
+
+    async def remove(self, user_id: int):
+        await self._redis.zrem(self.key, self._member(user_id))
+
+    async def top(self, limit: int, offset: int = 0) -> List[Tuple[int, int]]:
+        rows = await self._redis.zrevrange(self.key, offset, offset + limit - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    async def rank(self, user_id: int) -> Optional[int]:
+        rank = await self._redis.zrevrank(self.key, self._member(user_id))
+        return None if rank is None else rank + 1
+
+    async def size(self) -> int:
+        return await self._redis.zcard(self.key)
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+def make_backend():
+    if LEADERBOARD_REDIS_URL:
+        if aioredis is not None:
+            return RedisLeaderboard(LEADERBOARD_REDIS_URL)
+        print("[leaderboard] LEADERBOARD_REDIS_URL impostato ma il pacchetto redis non è installato: uso la memoria")
+    return MemoryLeaderboard()
+
+class LeaderboardIndex:
+    """
+    Indice della classifica con ricostruzione dal database.
+
+    Finché l'indice non è stato costruito, o dopo un errore del backend,
+    le letture sollevano LeaderboardUnavailable e il chiamante usa la query
+    sul database; la ricostruzione successiva lo rende di nuovo disponibile.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        enabled: bool = LEADERBOARD_INDEX_ENABLED,
+        resync_interval: float = LEADERBOARD_RESYNC_INTERVAL,
+    ):
+        self.backend = backend or make_backend()
+        self.enabled = enabled
+        self.resync_interval = resync_interval
+        self._ready = False
+        # Utenti aggiornati durante una ricostruzione: riletti dal database alla fine
+        self._pending: Optional[Set[int]] = None
+        self._rebuilt_at: Optional[datetime] = None
+        self._last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._ready
+
+    def _fail(self, error: Exception):
+        self._ready = False
+        self._last_error = str(error) or type(error).__name__
+        print(f"[leaderboard] Indice non disponibile: {self._last_error}")
+
+    async def rebuild(self) -> int:
+        """Ricostruisce l'indice con i punteggi degli utenti attivi."""
+        self._pending = set()
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(select(User.id, User.score).where(User.is_active == True))).all()
+            await self.backend.replace((user_id, score or 0) for user_id, score in rows)
+            # Gli utenti aggiornati nel frattempo vengono riletti: la lettura
+            # iniziale può includere o no i loro ultimi punti
+            while self._pending:
+                users, self._pending = self._pending, set()
+                async with AsyncSessionLocal() as db:
+                    scores = dict((await db.execute(
+                        select(User.id, User.score).where(User.id.in_(users), User.is_active == True)
+                    )).all())
+                for user_id in users:
+                    if user_id in scores:
+                        await self.backend.set_score(user_id, scores[user_id] or 0)
+                    else:
+                        await self.backend.remove(user_id)
+        finally:
+            self._pending = None
+        self._ready = True
+        self._last_error = None
+        self._rebuilt_at = datetime.utcnow()
+        return len(rows)
+
+    async def set_score(self, user_id: int, score: int):
+        """Imposta il punteggio di un utente appena creato (da chiamare dopo il commit)."""
+        if not self.enabled:
+            return
+        if self._pending is not None:
+            self._pending.add(user_id)
+        try:
+            await self.backend.set_score(user_id, score)
+        except Exception as e:
+            self._fail(e)
+
+    async def add_points(self, user_id: int, points: int):
+        """Aggiunge punti al punteggio di un utente (da chiamare dopo il commit)."""
+        if not self.enabled:
+            return
+        if self._pending is not None:
+            self._pending.add(user_id)
+        try:
+            await self.backend.increment(user_id, points)
+        except Exception as e:
+            self._fail(e)
+
+    async def remove(self, user_id: int):
+        """Toglie un utente dalla classifica (es. utente disattivato)."""
+        if not self.enabled:
+            return
+        if self._pending is not None:
+            self._pending.add(user_id)
+        try:
+            await self.backend.remove(user_id)
+        except Exception as e:
+            self._fail(e)
+
+    async def top(self, limit: int, offset: int = 0) -> List[Tuple[int, int, int]]:
+        """
+        Restituisce le posizioni da offset+1 a offset+limit.
+
+        Returns:
+            Lista di (posizione, user_id, punteggio)
+
+        Raises:
+            LeaderboardUnavailable: se l'indice non è utilizzabile
+        """
+        if not self.ready:
+            raise LeaderboardUnavailable()
+        try:
+            rows = await self.backend.top(limit, offset)
+        except Exception as e:
+            self._fail(e)
+            raise LeaderboardUnavailable() from e
+        return [(offset + position, user_id, score) for position, (user_id, score) in enumerate(rows, 1)]
+
+    async def rank(self, user_id: int) -> Optional[int]:
+        """
+        Posizione in classifica di un utente (None se non è in classifica).
+
+        Raises:
+            LeaderboardUnavailable: se l'indice non è utilizzabile
+        """
+        if not self.ready:
+            raise LeaderboardUnavailable()
+        try:
+            return await self.backend.rank(user_id)
+        except Exception as e:
+            self._fail(e)
+            raise LeaderboardUnavailable() from e
+
+    async def _run(self):
+        while True:
+            was_ready = self._ready
+            try:
+                count = await self.rebuild()
+                if not was_ready:
+                    print(f"[leaderboard] Indice costruito: {count} utenti (backend {self.backend.name})")
+            except Exception as e:
+                # La ricostruzione non deve mai terminare il task
+                self._fail(e)
+            if self._ready and not self.resync_interval:
+                return
+            await asyncio.sleep(self.resync_interval if self._ready else LEADERBOARD_RETRY_DELAY)
+
+    def start(self):
+        """Costruisce l'indice e avvia la ricostruzione periodica (non bloccante)."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.backend.aclose()
+
+    async def stats(self) -> dict:
+        size = None
+        if self.ready:
+            try:
+                size = await self.backend.size()
+            except Exception as e:
+                self._fail(e)
+        return {
+            "ready": self.ready,
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "size": size,
+            "rebuilt_at": self._rebuilt_at,
+            "resync_interval": self.resync_interval,
+            "last_error": self._last_error,
+        }
+
+# Istanza globale dell'indice della classifica
+leaderboard_index = LeaderboardIndex()
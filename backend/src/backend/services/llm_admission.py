@@ -0,0 +1,295 @@
+# Controllo di ammissione per le chiamate a Ollama
+# - AdaptiveLimiter: limite di concorrenza adattivo (AIMD) sulla latenza misurata,
+#   con una coda limitata per le richieste in eccesso
+# - CircuitBreaker: quando il backend non risponde fallisce subito invece di
+#   attendere il timeout; dopo il cooldown verifica con una sonda (is_available)
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+# Configurazione tramite variabili d'ambiente
+# - LLM_LIMIT_INITIAL / LLM_LIMIT_MIN / LLM_LIMIT_MAX: limite di concorrenza iniziale e suoi estremi
+# - LLM_LATENCY_TARGET: latenza (s) oltre la quale il limite viene ridotto
+# - LLM_LIMIT_BACKOFF: fattore di riduzione moltiplicativa (0-1)
+# - LLM_QUEUE_MAX: richieste massime in attesa di uno slot
+# - LLM_QUEUE_TIMEOUT: attesa massima (s) in coda prima del rifiuto
+# - LLM_BREAKER_FAILURES: errori consecutivi che aprono il circuito
+# - LLM_BREAKER_COOLDOWN: secondi di circuito aperto prima della sonda
+LLM_LIMIT_INITIAL = int(os.getenv("LLM_LIMIT_INITIAL", "4"))
+LLM_LIMIT_MIN = int(os.getenv("LLM_LIMIT_MIN", "1"))
+LLM_LIMIT_MAX = int(os.getenv("LLM_LIMIT_MAX", "16"))
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "20"))
+LLM_LIMIT_BACKOFF = float(os.getenv("LLM_LIMIT_BACKOFF", "0.7"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Esiti di una chiamata, usati per aggiornare limiter e circuit breaker
+OK = "ok"              # risposta valida
+OVERLOAD = "overload"  # timeout, connessione fallita o errore 5xx
+ERROR = "error"        # altro errore HTTP (es. 4xx)
+IGNORED = "ignored"    # chiamata interrotta (es. client disconnesso): nessun segnale
+
+class LLMAdmissionError(Exception):
+    """Richiesta al modello non ammessa. `retry_after` indica i secondi consigliati di attesa."""
+
+    def __init__(self, detail: str, retry_after: float = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+class LLMOverloadedError(LLMAdmissionError):
+    """Capacità esaurita: troppe richieste in attesa o attesa in coda troppo lunga."""
+
+class LLMUnavailableError(LLMAdmissionError):
+    """Circuito aperto: il backend LLM è considerato non disponibile."""
+
+def classify_error(exc: BaseException) -> str:
+    """Classifica un'eccezione di una chiamata a Ollama in uno degli esiti."""
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError)):
+        return OVERLOAD
+    if isinstance(exc, httpx.HTTPStatusError):
+        return OVERLOAD if exc.response.status_code >= 500 else ERROR
+    if isinstance(exc, httpx.HTTPError):
+        return ERROR
+    return IGNORED
+
+class AdaptiveLimiter:
+    """
+    Limite di concorrenza AIMD (additive increase, multiplicative decrease).
+
+    Ogni chiamata completata entro LLM_LATENCY_TARGET aumenta il limite di
+    1/limite (circa +1 per "giro" di richieste); una chiamata lenta o in
+    sovraccarico lo moltiplica per LLM_LIMIT_BACKOFF. Le richieste oltre il
+    limite attendono in coda (FIFO) fino a LLM_QUEUE_TIMEOUT secondi.
+    """
+
+    def __init__(
+        self,
+        initial: int = LLM_LIMIT_INITIAL,
+        min_limit: int = LLM_LIMIT_MIN,
+        max_limit: int = LLM_LIMIT_MAX,
+        latency_target: float = LLM_LATENCY_TARGET,
+        backoff: float = LLM_LIMIT_BACKOFF,
+        max_queue: int = LLM_QUEUE_MAX,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self.rejected = 0
+        self.queue_timeouts = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    async def acquire(self):
+        """
+        Ottiene uno slot, attendendo in coda se il limite è raggiunto.
+
+        Raises:
+            LLMOverloadedError: coda piena o attesa oltre queue_timeout
+        """
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloadedError("Servizio LLM sovraccarico: troppe richieste in coda", retry_after=self.queue_timeout)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout=self.queue_timeout)
+        except BaseException as exc:
+            if fut.done() and not fut.cancelled():
+                # Lo slot era stato assegnato ma il chiamante è stato cancellato
+                self.release(0, IGNORED)
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            if isinstance(exc, asyncio.TimeoutError):
+                self.queue_timeouts += 1
+                raise LLMOverloadedError("Servizio LLM sovraccarico: attesa in coda scaduta", retry_after=self.queue_timeout) from None
+            raise
+
+    def release(self, latency: float, outcome: str):
+        """Libera uno slot e aggiorna il limite in base all'esito e alla latenza."""
+        self._in_flight -= 1
+        if outcome == OK and latency <= self.latency_target:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        elif outcome == OVERLOAD or (outcome == OK and latency > self.latency_target):
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        self._wake()
+
+    def _wake(self):
+        """Assegna gli slot liberi alle richieste in coda, in ordine di arrivo."""
+        while self._waiters and self._in_flight < self.limit:
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._in_flight += 1
+            fut.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "limit_exact": round(self._limit, 3),
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "queue_timeouts": self.queue_timeouts,
+        }
+
+class CircuitBreaker:
+    """
+    Circuit breaker a tre stati.
+
+    - closed: le chiamate passano; dopo `failure_threshold` errori consecutivi si apre
+    - open: le chiamate falliscono subito per `cooldown` secondi
+    - half_open: dopo il cooldown una sonda (`probe`, es. is_available) verifica
+      il backend; se risponde passa una sola chiamata di prova, il cui esito
+      chiude o riapre il circuito
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        probe: Callable[[], Awaitable[bool]],
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        cooldown: float = LLM_BREAKER_COOLDOWN,
+    ):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.short_circuited = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._trial_in_flight = False
+
+    def _retry_in(self) -> float:
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def _reject(self, retry_after: float):
+        self.short_circuited += 1
+        raise LLMUnavailableError("Servizio LLM non disponibile, riprovare più tardi", retry_after=max(retry_after, 1))
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self.opened_count += 1
+        print(f"[llm] Circuit breaker aperto dopo {self.consecutive_failures} errori consecutivi")
+
+    async def before_call(self):
+        """
+        Verifica se una chiamata può passare.
+
+        Raises:
+            LLMUnavailableError: circuito aperto o chiamata di prova già in corso
+        """
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if self._retry_in() > 0:
+                self._reject(self._retry_in())
+            if self._probing:
+                self._reject(1)
+            self._probing = True
+            try:
+                healthy = await self.probe()
+            finally:
+                self._probing = False
+            if self.state != self.OPEN:
+                # Un'altra richiesta ha già cambiato stato durante la sonda
+                return await self.before_call()
+            if not healthy:
+                self._open()
+                self._reject(self.cooldown)
+            self.state = self.HALF_OPEN
+        if self._trial_in_flight:
+            self._reject(1)
+        self._trial_in_flight = True
+
+    def record(self, outcome: str):
+        """Aggiorna lo stato con l'esito di una chiamata ammessa."""
+        if outcome == OK:
+            if self.state != self.CLOSED:
+                print("[llm] Circuit breaker chiuso: backend di nuovo disponibile")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+        elif outcome in (OVERLOAD, ERROR):
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open()
+        else:
+            # Chiamata interrotta: in half_open si permette una nuova prova
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "short_circuited": self.short_circuited,
+            "retry_in_seconds": round(self._retry_in(), 1) if self.state == self.OPEN else 0,
+        }
+
+class AdmissionController:
+    """Combina circuit breaker e limiter attorno a una singola chiamata a Ollama."""
+
+    def __init__(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker):
+        self.limiter = limiter
+        self.breaker = breaker
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Context manager da usare attorno alla chiamata HTTP.
+
+        Raises:
+            LLMUnavailableError: circuito aperto
+            LLMOverloadedError: capacità esaurita
+        """
+        await self.breaker.before_call()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            self.breaker.record(IGNORED)
+            raise
+        start = time.monotonic()
+        outcome = IGNORED
+        try:
+            yield
+            outcome = OK
+        except BaseException as exc:
+            outcome = classify_error(exc)
+            raise
+        finally:
+            self.limiter.release(time.monotonic() - start, outcome)
+            self.breaker.record(outcome)
+
+    def stats(self) -> dict:
+        return {"limiter": self.limiter.stats(), "breaker": self.breaker.stats()}
@@ -0,0 +1,214 @@
+# Cache a due livelli per le risposte del modello LLM
+# - Livello 1: LRU in memoria, limitata e con scadenza (TTL)
+# - Livello 2 (opzionale): file SQLite su disco, sopravvive ai riavvii
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Configurazione tramite variabili d'ambiente
+# - LLM_CACHE_SIZE: numero massimo di voci in memoria (0 disattiva la cache)
+# - LLM_CACHE_TTL: durata di una voce in secondi
+# - LLM_CACHE_DISK_PATH: percorso del file SQLite (vuoto = livello su disco disattivato)
+# - LLM_CACHE_DISK_MAX_ENTRIES: numero massimo di voci su disco
+# - LLM_CACHE_MAX_TEMPERATURE: chiamate con temperatura <= soglia sono cacheabili di default
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "")
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizza un prompt per il calcolo della chiave di cache.
+    Spazi, tabulazioni e a capo consecutivi vengono ridotti a un singolo spazio.
+
+    Esempio:
+        "  Chi  ha\\n scritto " -> "Chi ha scritto"
+    """
+    return " ".join(prompt.split())
+
+def make_cache_key(prompt: str, model: str, options: dict, extra: Optional[dict] = None) -> str:
+    """
+    Calcola la chiave di cache a partire da prompt normalizzato, modello e
+    opzioni di campionamento (più eventuali parametri extra, es. `format`).
+    """
+    payload = {
+        "prompt": normalize_prompt(prompt),
+        "model": model,
+        "options": options,
+        "extra": extra or {},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def is_deterministic(options: dict) -> bool:
+    """Indica se una chiamata è abbastanza deterministica da essere cacheata di default."""
+    return options.get("temperature", 0.8) <= LLM_CACHE_MAX_TEMPERATURE
+
+class LLMCache:
+    """
+    Cache a due livelli per i risultati di Ollama.
+
+    Le voci sono i JSON restituiti da /api/generate. La ricerca avviene prima
+    in memoria e poi, se configurato, su disco; una voce trovata su disco
+    viene riportata in memoria. I contatori di hit/miss sono disponibili
+    tramite `stats()`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LLM_CACHE_SIZE,
+        ttl: float = LLM_CACHE_TTL,
+        disk_path: str = LLM_CACHE_DISK_PATH,
+        disk_max_entries: int = LLM_CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        if disk_path:
+            self._open_disk()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _open_disk(self):
+        """Apre (o crea) il file SQLite del livello su disco."""
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._disk.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._disk.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)")
+        self._disk.commit()
+
+    # --- Livello in memoria ---
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if time.time() - created_at > self.ttl:
+                del self._memory[key]
+                self._counters["expired"] += 1
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: dict, created_at: float):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    # --- Livello su disco ---
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if time.time() - created_at > self.ttl:
+                self._disk.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._disk.commit()
+                return None
+            return json.loads(value), created_at
+
+    def _disk_set(self, key: str, value: dict, created_at: float):
+        with self._disk_lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), created_at),
+            )
+            # Elimina le voci scadute e quelle più vecchie oltre il limite
+            self._disk.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            self._disk.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+            self._disk.commit()
+
+    # --- API pubblica ---
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Cerca una voce in memoria e poi su disco. Restituisce None se assente o scaduta."""
+        if not self.enabled:
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            self._counters["memory_hits"] += 1
+            return value
+        if self._disk is not None:
+            found = await asyncio.to_thread(self._disk_get, key)
+            if found is not None:
+                value, created_at = found
+                self._memory_set(key, value, created_at)
+                self._counters["disk_hits"] += 1
+                return value
+        self._counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        """Salva una voce in memoria e, se configurato, su disco."""
+        if not self.enabled:
+            return
+        created_at = time.time()
+        self._memory_set(key, value, created_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_set, key, value, created_at)
+        self._counters["stores"] += 1
+
+    def clear(self):
+        """Svuota entrambi i livelli (i contatori non vengono azzerati)."""
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM llm_cache")
+                self._disk.commit()
+
+    def stats(self) -> dict:
+        """Restituisce contatori e dimensioni correnti della cache."""
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            **self._counters,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.max_size,
+            "disk_enabled": self._disk is not None,
+            "ttl_seconds": self.ttl,
+        }
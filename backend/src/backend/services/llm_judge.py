@@ -0,0 +1,283 @@
+# Giudice LLM: valutazione delle risposte con output strutturato
+# In modalità "json" (default) la risposta del modello è vincolata a uno schema
+# JSON tramite l'opzione `format` di Ollama; in modalità "text" si usa il
+# formato testuale a righe. In entrambi i casi un parser tollerante estrae il
+# risultato e, se fallisce, un passaggio di riparazione limitato chiede al
+# modello di convertire il testo ricevuto nel JSON atteso, invece di ripetere
+# l'intera valutazione.
+import json
+import os
+import re
+import unicodedata
+from typing import Optional
+
+import httpx
+from pydantic import BaseModel
+
+from backend.services.llm_service import LLMService, llm_service
+
+# Configurazione tramite variabili d'ambiente
+# - LLM_JUDGE_MODE: "json" (output strutturato) oppure "text" (formato a righe)
+# - LLM_JUDGE_SCHEMA_FORMAT: "schema" passa lo schema a Ollama, "json" solo il JSON mode
+#   (per versioni di Ollama che non supportano gli schemi)
+# - LLM_JUDGE_REPAIR_ATTEMPTS: tentativi massimi di riparazione di un output non valido
+LLM_JUDGE_MODE = os.getenv("LLM_JUDGE_MODE", "json")
+LLM_JUDGE_SCHEMA_FORMAT = os.getenv("LLM_JUDGE_SCHEMA_FORMAT", "schema")
+LLM_JUDGE_REPAIR_ATTEMPTS = int(os.getenv("LLM_JUDGE_REPAIR_ATTEMPTS", "1"))
+
+CRITERIA = ("correttezza", "rilevanza", "dettaglio", "chiarezza")
+
+_SCORE = {"type": "integer", "minimum": 0, "maximum": 10}
+
+# Schema JSON della valutazione (quattro criteri, punteggio complessivo, feedback)
+JUDGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **{criterion: _SCORE for criterion in CRITERIA},
+        "punteggio_complessivo": _SCORE,
+        "feedback": {"type": "string"},
+    },
+    "required": [*CRITERIA, "punteggio_complessivo", "feedback"],
+}
+
+JSON_FORMAT_INSTRUCTIONS = """
+    RISPOSTA FINALE – FORMATO OBBLIGATORIO:
+    Rispondi esclusivamente con un oggetto JSON con questi campi, senza testo prima o dopo:
+    {"correttezza": 0-10, "rilevanza": 0-10, "dettaglio": 0-10, "chiarezza": 0-10, "punteggio_complessivo": 0-10, "feedback": "breve spiegazione della valutazione (1-2 frasi)"}
+    I punteggi sono numeri interi da 0 a 10 (0 = completamente sbagliato/inappropriato).
+    """
+
+TEXT_FORMAT_INSTRUCTIONS = """
+    RISPOSTA FINALE – FORMATO OBBLIGATORIO:
+    Correttezza: [0-10]
+    Rilevanza: [0-10]
+    Dettaglio: [0-10]
+    Chiarezza: [0-10]
+    Punteggio complessivo: [0-10]
+    Feedback: [breve spiegazione della valutazione]
+
+    NON includere altri commenti, spiegazioni, simboli o formattazioni. Segui il formato richiesto alla lettera.
+    """
+
+class JudgeResult(BaseModel):
+    correttezza: Optional[float] = None
+    rilevanza: Optional[float] = None
+    dettaglio: Optional[float] = None
+    chiarezza: Optional[float] = None
+    punteggio_complessivo: float
+    feedback: str
+
+class JudgeError(ValueError):
+    """La valutazione non è stata ottenuta (modello non raggiungibile o output non valido)."""
+
+class JudgeParseError(JudgeError):
+    """L'output del modello non contiene una valutazione riconoscibile."""
+
+def _normalize_key(key: str) -> str:
+    """'Punteggio Complessivo' -> 'punteggio_complessivo' (senza accenti)."""
+    key = unicodedata.normalize("NFKD", key).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z]+", "_", key.lower()).strip("_")
+
+# Nomi alternativi accettati per i campi
+_ALIASES = {
+    "punteggio": "punteggio_complessivo",
+    "punteggio_totale": "punteggio_complessivo",
+    "complessivo": "punteggio_complessivo",
+    "overall": "punteggio_complessivo",
+    "score": "punteggio_complessivo",
+    "commento": "feedback",
+    "motivazione": "feedback",
+}
+
+def _to_score(value) -> Optional[float]:
+    """Converte un valore (8, "8", "8/10", "7,5") in punteggio 0-10; None se non valido."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        score = float(value)
+    elif isinstance(value, str):
+        match = re.search(r"\d+(?:[.,]\d+)?", value)
+        if not match:
+            return None
+        score = float(match.group(0).replace(",", "."))
+    else:
+        return None
+    return score if 0 <= score <= 10 else None
+
+def _build_result(fields: dict) -> JudgeResult:
+    """Costruisce il risultato dai campi estratti, ricavando il complessivo se manca."""
+    scores = {criterion: _to_score(fields.get(criterion)) for criterion in CRITERIA}
+    overall = _to_score(fields.get("punteggio_complessivo"))
+    if overall is None:
+        known = [score for score in scores.values() if score is not None]
+        if not known:
+            raise JudgeParseError("Formato risposta non valido: manca il punteggio complessivo")
+        overall = round(sum(known) / len(known), 1)
+    feedback = fields.get("feedback")
+    feedback = str(feedback).strip() if feedback is not None else ""
+    return JudgeResult(
+        **scores,
+        punteggio_complessivo=overall,
+        feedback=feedback or "Nessun feedback fornito",
+    )
+
+def parse_judge_json(text: str) -> JudgeResult:
+    """
+    Parser tollerante dell'output JSON del giudice.
+    Accetta blocchi ```json, testo prima/dopo l'oggetto, chiavi con maiuscole,
+    spazi o accenti e punteggi scritti come stringhe.
+
+    Raises:
+        JudgeParseError: se non si trova un oggetto JSON con almeno un punteggio
+    """
+    cleaned = re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError:
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start == -1 or end <= start:
+            raise JudgeParseError("Formato risposta non valido: oggetto JSON assente")
+        try:
+            data = json.loads(cleaned[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise JudgeParseError(f"Formato risposta non valido: JSON malformato ({e.msg})")
+    if not isinstance(data, dict):
+        raise JudgeParseError("Formato risposta non valido: atteso un oggetto JSON")
+    fields = {}
+    for key, value in data.items():
+        normalized = _normalize_key(str(key))
+        fields[_ALIASES.get(normalized, normalized)] = value
+    return _build_result(fields)
+
+_TEXT_LINE = re.compile(
+    r"^[\s*\-#]*(correttezza|rilevanza|dettaglio|chiarezza|punteggio complessivo|feedback)[\s*]*:\s*(.*)$",
+    re.IGNORECASE,
+)
+
+def parse_judge_text(text: str) -> JudgeResult:
+    """
+    Parser del formato testuale a righe ("Correttezza: 8", ..., "Feedback: ...").
+    Riconosce correttamente il punteggio 10 e conserva i ':' nel feedback.
+
+    Raises:
+        JudgeParseError: se manca il punteggio complessivo (e non è ricavabile dai criteri)
+    """
+    fields = {}
+    for line in text.splitlines():
+        match = _TEXT_LINE.match(line.strip())
+        if match:
+            key = _normalize_key(match.group(1))
+            fields.setdefault(key, match.group(2).strip().strip("*").strip())
+    return _build_result(fields)
+
+class LLMJudge:
+    """
+    Valuta le risposte con il modello LLM e tiene le statistiche di parsing.
+
+    I contatori permettono di calcolare il tasso di output non validi
+    (parse_failure_rate) e quanti ne recupera la riparazione.
+    """
+
+    def __init__(
+        self,
+        service: LLMService,
+        mode: str = LLM_JUDGE_MODE,
+        repair_attempts: int = LLM_JUDGE_REPAIR_ATTEMPTS,
+    ):
+        self.service = service
+        self.mode = mode
+        self.repair_attempts = repair_attempts
+        self._counters = {
+            "judgments": 0,
+            "parsed_first_try": 0,
+            "parse_failures": 0,
+            "repaired": 0,
+            "failed": 0,
+            "repair_calls": 0,
+            "llm_errors": 0,
+        }
+
+    @property
+    def _format(self):
+        return JUDGE_SCHEMA if LLM_JUDGE_SCHEMA_FORMAT == "schema" else "json"
+
+    def build_prompt(self, body: str) -> str:
+        """Aggiunge al prompt di valutazione le istruzioni di formato della modalità attiva."""
+        return body + (JSON_FORMAT_INSTRUCTIONS if self.mode == "json" else TEXT_FORMAT_INSTRUCTIONS)
+
+    def _parse(self, text: str) -> JudgeResult:
+        if self.mode == "json":
+            try:
+                return parse_judge_json(text)
+            except JudgeParseError:
+                # Il modello può ignorare il formato: si prova comunque quello testuale
+                return parse_judge_text(text)
+        return parse_judge_text(text)
+
+    async def _repair(self, raw: str) -> JudgeResult:
+        prompt = f"""
+        Il testo seguente è la valutazione di una risposta, ma non è nel formato richiesto.
+        Convertilo in un oggetto JSON con i campi correttezza, rilevanza, dettaglio,
+        chiarezza, punteggio_complessivo (numeri interi da 0 a 10) e feedback (stringa).
+        Non cambiare i punteggi e non aggiungere altro testo.
+
+        Testo: {raw}
+        """
+        self._counters["repair_calls"] += 1
+        repaired = await self.service.generate_structured(prompt, self._format, {"temperature": 0})
+        return parse_judge_json(repaired)
+
+    async def judge(self, prompt_body: str) -> JudgeResult:
+        """
+        Esegue la valutazione descritta da `prompt_body` (senza istruzioni di formato).
+
+        Raises:
+            JudgeError: modello non raggiungibile o output non valido anche dopo la riparazione
+            LLMAdmissionError: circuito aperto o capacità esaurita
+        """
+        self._counters["judgments"] += 1
+        prompt = self.build_prompt(prompt_body)
+        try:
+            if self.mode == "json":
+                raw = await self.service.generate_structured(prompt, self._format)
+            else:
+                raw = await self.service.generate_answer(prompt, strict=True)
+        except httpx.HTTPError as e:
+            self._counters["llm_errors"] += 1
+            self._counters["failed"] += 1
+            raise JudgeError(f"Errore nella chiamata al modello: {e}")
+
+        try:
+            result = self._parse(raw)
+            self._counters["parsed_first_try"] += 1
+            return result
+        except JudgeParseError as first_error:
+            self._counters["parse_failures"] += 1
+            print(f"Errore di validazione: {str(first_error)}")
+            print(f"Risposta LLM ricevuta: {raw}")
+            error = first_error
+
+        for _ in range(self.repair_attempts):
+            try:
+                result = await self._repair(raw)
+                self._counters["repaired"] += 1
+                return result
+            except JudgeParseError as e:
+                error = e
+            except httpx.HTTPError as e:
+                self._counters["llm_errors"] += 1
+                break
+        self._counters["failed"] += 1
+        raise error
+
+    def stats(self) -> dict:
+        judgments = self._counters["judgments"]
+        return {
+            **self._counters,
+            "mode": self.mode,
+            "parse_failure_rate": self._counters["parse_failures"] / judgments if judgments else 0.0,
+            "final_failure_rate": self._counters["failed"] / judgments if judgments else 0.0,
+        }
+
+# Istanza globale del giudice
+llm_judge = LLMJudge(llm_service)
@@ -1,107 +1,400 @@
 # Importazioni necessarie per il servizio LLM
-import requests  # Per le chiamate HTTP a Ollama
+import asyncio  # Per il wrapper sincrono usato dagli script
+import httpx    # Client HTTP asincrono con pool di connessioni (usato per Ollama)
 import os       # Per accedere alle variabili d'ambiente
 import json     # Per la gestione dei dati JSON
-from typing import Optional  # Per il type hinting
+import time     # Per misurare la durata delle chiamate (metriche)
+from typing import AsyncIterator, Dict, Optional  # Per il type hinting
+
+from backend.services.llm_cache import LLMCache, make_cache_key, is_deterministic
+from backend.services.llm_admission import AdaptiveLimiter, AdmissionController, CircuitBreaker
+from backend.services.quotas import QuotaManager, quota_manager
+from backend.services.metrics import observe_llm_call
 
 # Configurazione del servizio Ollama tramite variabili d'ambiente
 # Se non specificate, usa i valori di default per lo sviluppo locale
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
 
+# Configurazione del pool di connessioni verso Ollama
+# - MAX_CONNECTIONS: numero massimo di connessioni contemporanee
+# - MAX_KEEPALIVE: connessioni inattive mantenute aperte per il riuso
+# - KEEPALIVE_EXPIRY: secondi dopo i quali una connessione inattiva viene chiusa
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "5"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+
+# Timeout (in secondi) per le singole chiamate
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_ANSWER_TIMEOUT = float(os.getenv("OLLAMA_ANSWER_TIMEOUT", "120"))
+OLLAMA_TAG_TIMEOUT = float(os.getenv("OLLAMA_TAG_TIMEOUT", "60"))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "10"))
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "300"))
+
+# Per quanto tempo Ollama tiene il modello in memoria dopo l'ultima richiesta
+# Accetta una durata ("30m", "2h") o un numero di secondi ("-1" = per sempre)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+def parse_keep_alive(value: Optional[str]):
+    """Converte il valore di OLLAMA_KEEP_ALIVE nel formato atteso da Ollama (None = default di Ollama)."""
+    if value is None or not value.strip():
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value.strip()
+
+# Schema JSON della risposta per la generazione dei tag a gruppi
+TAGS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tags": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, "tag": {"type": "string"}},
+                "required": ["id", "tag"],
+            },
+        },
+    },
+    "required": ["tags"],
+}
+
+def clean_tag(tag: str) -> str:
+    """Rimuove punteggiatura e virgolette ai bordi e limita il tag a 3 parole."""
+    return " ".join(str(tag).strip().strip(".,;:!?\"'`*").split()[:3])
+
 class LLMService:
     """
     Servizio per l'interazione con il modello linguistico Ollama.
     Gestisce la generazione di risposte alle domande sulla cultura italiana.
+
+    Tutte le chiamate sono asincrone e condividono un unico client HTTP con
+    pool di connessioni keep-alive, così una generazione lenta non blocca
+    l'event loop di uvicorn. Per gli script sono disponibili le varianti
+    sincrone con suffisso `_sync`.
     """
-    
-    def __init__(self):
+
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        model: str = OLLAMA_MODEL,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        max_keepalive: int = OLLAMA_MAX_KEEPALIVE,
+        keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY,
+        keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+        cache: Optional[LLMCache] = None,
+        admission: Optional[AdmissionController] = None,
+        quotas: Optional[QuotaManager] = None,
+    ):
         """
         Inizializza il servizio LLM con l'host e il modello configurati.
         Usa i valori delle variabili d'ambiente o i default se non specificati.
+        Il client HTTP viene creato alla prima chiamata, dentro l'event loop in uso.
+        Se non vengono passati cache o controllo di ammissione, vengono creati
+        con la configurazione di default (la sonda del circuit breaker è is_available).
+        I token di ogni chiamata vengono contati da `quotas` (default: quota_manager).
         """
-        self.host = OLLAMA_HOST
-        self.model = OLLAMA_MODEL
-    
-    def generate_answer(self, question: str, cultural_context: str = "") -> str:
+        self.host = host
+        self.model = model
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.cache = cache if cache is not None else LLMCache()
+        self.admission = admission if admission is not None else AdmissionController(
+            AdaptiveLimiter(), CircuitBreaker(probe=self.is_available)
+        )
+        self.quotas = quotas if quotas is not None else quota_manager
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
         """
-        Genera una risposta a una domanda culturale utilizzando il modello LLM.
-        
+        Restituisce il client condiviso, creandolo se necessario.
+        Un client è legato all'event loop in cui è stato creato: se il loop
+        cambia (es. wrapper sincrono) ne viene creato uno nuovo.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.host,
+                limits=self.limits,
+                timeout=httpx.Timeout(OLLAMA_ANSWER_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        """Chiude il client condiviso e le connessioni keep-alive del pool."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    def _timeout(self, seconds: float) -> httpx.Timeout:
+        """Costruisce il timeout per una singola chiamata."""
+        return httpx.Timeout(seconds, connect=min(OLLAMA_CONNECT_TIMEOUT, seconds))
+
+    def _payload(self, prompt: str, stream: bool, options: Optional[dict] = None, model: Optional[str] = None) -> dict:
+        """Corpo della richiesta a /api/generate, con il keep_alive configurato."""
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": stream,
+        }
+        if options is not None:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    async def _generate(
+        self,
+        prompt: str,
+        options: dict,
+        timeout: float,
+        cache: Optional[bool] = None,
+        format=None,
+    ) -> dict:
+        """
+        Esegue una chiamata non in streaming a /api/generate.
+
         Args:
-            question: La domanda posta dall'utente
-            cultural_context: Contesto culturale aggiuntivo (opzionale)
-            
+            cache: True/False per forzare l'uso della cache; None la usa solo
+                   per le chiamate deterministiche (bassa temperatura)
+            format: output strutturato di Ollama ("json" o uno schema JSON)
+
         Returns:
-            La risposta generata dal modello, o un messaggio di errore in caso di problemi
+            Il JSON completo restituito da Ollama (o dalla cache)
+
+        Raises:
+            httpx.HTTPError: per errori di rete, timeout o stato HTTP non valido
+            LLMAdmissionError: circuito aperto o capacità esaurita
         """
-        
+        use_cache = is_deterministic(options) if cache is None else cache
+        key = make_cache_key(prompt, self.model, options, {"format": format}) if use_cache else None
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        payload = self._payload(prompt, stream=False, options=options)  # Risposta completa, non streaming
+        if format is not None:
+            payload["format"] = format
+        async with self.admission.slot():
+            started = time.perf_counter()
+            response = await self._get_client().post(
+                "/api/generate",
+                json=payload,
+                timeout=self._timeout(timeout),
+            )
+            response.raise_for_status()  # Solleva eccezione per errori HTTP
+            result = response.json()
+        observe_llm_call(self.model, "generate", time.perf_counter() - started, result)
+        await self.quotas.record_usage(result)
+
+        # Solo le risposte valide finiscono in cache
+        if key is not None and result.get("response", "").strip():
+            await self.cache.set(key, result)
+        return result
+
+    def _answer_prompt(self, question: str, cultural_context: str = "") -> str:
+        """Costruisce il prompt per la generazione di una risposta culturale."""
         # Costruzione del prompt con istruzioni specifiche per il modello
-        prompt = f"""
+        return f"""
         Sei un assistente esperto nella cultura italiana. Rispondi alla seguente domanda in modo accurato e culturalmente appropriato.Non dare risposte troppo lunghe.
         Importante che la risposta sia umana e naturale senza markdown,'*' o formattazioni particolari o suddivisioni in paragrafi, quindi tutto in un unico paragrafo.
         Importante che non si capisca che è la risposta di un modello LLM.
         Contesto culturale: {cultural_context}
-        
+
         Domanda: {question}
-        
+
         Rispondi in italiano in modo naturale e informativo:
         """
-        
+
+    async def generate_answer(self, question: str, cultural_context: str = "", strict: bool = False) -> str:
+        """
+        Genera una risposta a una domanda culturale utilizzando il modello LLM.
+
+        Args:
+            question: La domanda posta dall'utente
+            cultural_context: Contesto culturale aggiuntivo (opzionale)
+            strict: se True gli errori vengono propagati invece di restituire
+                    il messaggio di fallback (usato dai job, che ritentano)
+
+        Returns:
+            La risposta generata dal modello, o un messaggio di errore in caso di problemi
+
+        Raises:
+            LLMAdmissionError: circuito aperto o capacità esaurita (anche con strict=False)
+        """
+
+        prompt = self._answer_prompt(question, cultural_context)
+
         try:
             # Chiamata API a Ollama per la generazione della risposta
-            response = requests.post(
-                f"{self.host}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,  # Risposta completa, non streaming
-                    "options": {
-                        "temperature": 0.7,    # Controllo della creatività (0.0-1.0)
-                        "top_p": 0.9,          # Sampling per varietà nelle risposte
-                        "max_tokens": 200,      # Lunghezza massima della risposta
-                        #"stop": ["\n\n"]       # Ferma la generazione ai doppi newline
-                    }
+            result = await self._generate(
+                prompt,
+                {
+                    "temperature": 0.7,    # Controllo della creatività (0.0-1.0)
+                    "top_p": 0.9,          # Sampling per varietà nelle risposte
+                    "max_tokens": 200,      # Lunghezza massima della risposta
+                    #"stop": ["\n\n"]       # Ferma la generazione ai doppi newline
                 },
-                timeout=120,  # Timeout della richiesta in secondi
+                timeout=OLLAMA_ANSWER_TIMEOUT,
             )
-            response.raise_for_status()  # Solleva eccezione per errori HTTP
-            
+
             # Estrae e pulisce la risposta dal JSON
-            result = response.json()
             response_text = result.get("response", "").strip()
             # Rimuove gli asterischi dalla risposta
             response_text = response_text.replace('*', '')
             return response_text
-            
-        except requests.exceptions.RequestException as e:
+
+        except httpx.HTTPError as e:
             # Gestione degli errori di rete o del servizio
             print(f"Error calling LLM: {e}")
+            if strict:
+                raise
             return "Mi dispiace, non riesco a rispondere in questo momento."
-    
-    def is_available(self) -> bool:
+
+    async def generate_structured(
+        self,
+        prompt: str,
+        format,
+        options: Optional[dict] = None,
+        timeout: float = OLLAMA_ANSWER_TIMEOUT,
+    ) -> str:
+        """
+        Genera una risposta vincolata a un formato JSON (opzione `format` di Ollama).
+
+        Args:
+            prompt: Il prompt completo
+            format: "json" oppure uno schema JSON che la risposta deve rispettare
+            options: Opzioni di campionamento (default: temperatura bassa)
+
+        Returns:
+            Il testo JSON prodotto dal modello (da validare a cura del chiamante)
+
+        Raises:
+            httpx.HTTPError: per errori di rete, timeout o stato HTTP non valido
+            LLMAdmissionError: circuito aperto o capacità esaurita
+        """
+        result = await self._generate(
+            prompt,
+            options or {"temperature": 0.1, "top_p": 0.8},
+            timeout=timeout,
+            format=format,
+        )
+        return result.get("response", "").strip()
+
+    async def stream_generate(self, prompt: str, options: dict, timeout: float) -> AsyncIterator[str]:
+        """
+        Esegue una chiamata in streaming a /api/generate.
+        Ollama restituisce un oggetto JSON per riga (NDJSON): ogni frammento
+        di testo viene restituito appena arriva.
+
+        Yields:
+            I frammenti di testo generati dal modello, nell'ordine di arrivo
+
+        Raises:
+            httpx.HTTPError: per errori di rete, timeout o stato HTTP non valido
+            LLMAdmissionError: circuito aperto o capacità esaurita
+        """
+        async with self.admission.slot():
+            started = time.perf_counter()
+            async with self._get_client().stream(
+                "POST",
+                "/api/generate",
+                json=self._payload(prompt, stream=True, options=options),
+                timeout=self._timeout(timeout),
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise httpx.HTTPError(chunk["error"])
+                    token = chunk.get("response", "")
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        # L'ultimo oggetto contiene durate e conteggi dei token
+                        observe_llm_call(self.model, "stream", time.perf_counter() - started, chunk)
+                        await self.quotas.record_usage(chunk)
+                        break
+
+    async def stream_answer(self, question: str, cultural_context: str = "") -> AsyncIterator[str]:
+        """
+        Variante in streaming di generate_answer: restituisce i token man mano
+        che il modello li produce, così il client vede subito il primo frammento.
+
+        Yields:
+            Frammenti della risposta, senza asterischi
+        """
+        async for token in self.stream_generate(
+            self._answer_prompt(question, cultural_context),
+            {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_tokens": 200,
+            },
+            timeout=OLLAMA_ANSWER_TIMEOUT,
+        ):
+            token = token.replace('*', '')
+            if token:
+                yield token
+
+    async def is_available(self) -> bool:
         """
         Verifica se il servizio LLM è disponibile e risponde.
-        
+
         Returns:
             True se il servizio è attivo e risponde, False altrimenti
         """
         try:
-            response = requests.get(f"{self.host}/api/tags", timeout=10)
+            response = await self._get_client().get("/api/tags", timeout=self._timeout(OLLAMA_HEALTH_TIMEOUT))
             return response.status_code == 200
-        except:
+        except httpx.HTTPError:
             return False
 
-    def generate_tag(self, question: str) -> str:
+    async def load_model(self, model: Optional[str] = None, timeout: float = OLLAMA_WARMUP_TIMEOUT) -> float:
+        """
+        Carica il modello in memoria (richiesta con prompt vuoto) e ne rinnova il keep_alive.
+        Non passa dal controllo di ammissione: il primo caricamento può essere
+        molto più lento di una generazione e non deve ridurre il limite di concorrenza.
+
+        Returns:
+            Secondi impiegati da Ollama per caricare il modello (0 se era già in memoria)
+
+        Raises:
+            httpx.HTTPError: modello assente, Ollama non raggiungibile o timeout
+        """
+        response = await self._get_client().post(
+            "/api/generate",
+            json=self._payload("", stream=False, model=model),
+            timeout=self._timeout(timeout),
+        )
+        response.raise_for_status()
+        return response.json().get("load_duration", 0) / 1e9
+
+    async def generate_tag(self, question: str, strict: bool = False) -> str:
         """
         Genera un tag riassuntivo (max 3 parole) per una domanda usando il modello LLM.
         Args:
             question: La domanda da riassumere
+            strict: se True gli errori vengono propagati invece di restituire il tag di fallback
         Returns:
             Un tag di massimo 3 parole
+        Raises:
+            LLMAdmissionError: circuito aperto o capacità esaurita (anche con strict=False)
         """
         prompt = f"""
-        Leggi attentamente la seguente affermazione. 
-        Genera un singolo tag che ne rappresenti al meglio il significato o l'argomento principale. 
+        Leggi attentamente la seguente affermazione.
+        Genera un singolo tag che ne rappresenti al meglio il significato o l'argomento principale.
         Non deve essere un riassunto della domanda, ma deve solo prendere in considerazione l'argomento principale.
         Cerca di usare parole che sono utilizzate già nella affermazione senza crearne altre.
         Il tag deve essere composto da massimo 3 parole, ma usa meno parole possibile (preferibilmente una o due parole, solo raramente tre se strettamente necessario).
@@ -110,27 +403,96 @@ class LLMService:
         Affermazione: {question}
         """
         try:
-            response = requests.post(
-                f"{self.host}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.8,
-                        "max_tokens": 10
-                    }
+            result = await self._generate(
+                prompt,
+                {
+                    "temperature": 0.3,
+                    "top_p": 0.8,
+                    "max_tokens": 10
                 },
-                timeout=60,
+                timeout=OLLAMA_TAG_TIMEOUT,
             )
-            response.raise_for_status()
-            result = response.json()
             return result.get("response", "").strip()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error calling LLM for tag: {e}")
+            if strict:
+                raise
             return "Tag non disponibile"
 
+    async def generate_tags(self, questions: Dict[int, str]) -> Dict[int, str]:
+        """
+        Genera i tag di più domande con una sola chiamata al modello.
+
+        Args:
+            questions: testo delle domande indicizzato per ID
+        Returns:
+            Tag indicizzati per ID; le domande per cui il modello non restituisce
+            un tag valido sono assenti (il chiamante può ripiegare su generate_tag)
+        Raises:
+            httpx.HTTPError: per errori di rete, timeout o stato HTTP non valido
+            LLMAdmissionError: circuito aperto o capacità esaurita
+        """
+        items = "\n".join(f"{question_id}. {text}" for question_id, text in questions.items())
+        prompt = f"""
+        Leggi attentamente le seguenti affermazioni, ciascuna preceduta dal suo ID.
+        Per ognuna genera un singolo tag che ne rappresenti al meglio il significato o l'argomento principale.
+        Non deve essere un riassunto, ma deve solo prendere in considerazione l'argomento principale.
+        Cerca di usare parole che sono utilizzate già nella affermazione senza crearne altre.
+        Ogni tag deve essere composto da massimo 3 parole, ma usa meno parole possibile (preferibilmente una o due).
+        Il tag deve essere sintetico, rappresentativo e privo di spiegazioni o punteggiatura.
+        Rispondi esclusivamente con un oggetto JSON nel formato
+        {{"tags": [{{"id": <ID>, "tag": "<tag>"}}, ...]}} con un elemento per ogni affermazione.
+
+        Affermazioni:
+        {items}
+        """
+        raw = await self.generate_structured(
+            prompt,
+            TAGS_SCHEMA,
+            {"temperature": 0.3, "top_p": 0.8},
+            timeout=OLLAMA_TAG_TIMEOUT,
+        )
+        try:
+            entries = json.loads(raw).get("tags", [])
+        except (ValueError, AttributeError):
+            print(f"Risposta non valida per i tag a gruppi: {raw}")
+            return {}
+
+        tags = {}
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                question_id = int(entry["id"])
+                tag = clean_tag(entry["tag"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if question_id in questions and tag:
+                tags.setdefault(question_id, tag)
+        return tags
+
+    # Wrapper sincroni per script e strumenti da riga di comando.
+    # Non vanno usati dentro un event loop già attivo (es. negli endpoint).
+
+    def _run_sync(self, coro):
+        """Esegue una coroutine del servizio in un event loop dedicato."""
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+        return asyncio.run(runner())
+
+    def generate_answer_sync(self, question: str, cultural_context: str = "") -> str:
+        """Versione sincrona di generate_answer."""
+        return self._run_sync(self.generate_answer(question, cultural_context))
+
+    def generate_tag_sync(self, question: str) -> str:
+        """Versione sincrona di generate_tag."""
+        return self._run_sync(self.generate_tag(question))
+
+    def is_available_sync(self) -> bool:
+        """Versione sincrona di is_available."""
+        return self._run_sync(self.is_available())
+
 # Istanza globale del servizio
 # Viene utilizzata in tutta l'applicazione per accedere al servizio LLM
 llm_service = LLMService()
@@ -0,0 +1,111 @@
+# Warm-up dei modelli e readiness del backend
+# All'avvio i modelli configurati vengono caricati in Ollama (con il keep_alive
+# di OLLAMA_KEEP_ALIVE), così la prima richiesta di un utente non paga il tempo
+# di caricamento. Finché il modello non risponde alla sonda l'istanza è
+# "non pronta" (/health/ready restituisce 503). Una volta pronta, la sonda
+# viene ripetuta periodicamente: rinnova il keep_alive e ricarica il modello
+# se Ollama lo ha scaricato dalla memoria.
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.services.llm_service import LLMService, OLLAMA_MODEL, llm_service
+
+# Configurazione tramite variabili d'ambiente
+# - LLM_WARMUP_ENABLED: "false" disattiva warm-up e sonda (l'istanza è sempre pronta)
+# - LLM_WARMUP_MODELS: modelli da caricare, separati da virgola (default: OLLAMA_MODEL)
+# - LLM_WARMUP_RETRY_DELAY: secondi tra due tentativi finché il modello non è pronto
+# - LLM_READINESS_INTERVAL: secondi tra due sonde quando il modello è pronto
+LLM_WARMUP_ENABLED = os.getenv("LLM_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_WARMUP_MODELS = [m.strip() for m in os.getenv("LLM_WARMUP_MODELS", OLLAMA_MODEL).split(",") if m.strip()]
+LLM_WARMUP_RETRY_DELAY = float(os.getenv("LLM_WARMUP_RETRY_DELAY", "5"))
+LLM_READINESS_INTERVAL = float(os.getenv("LLM_READINESS_INTERVAL", "60"))
+
+class ModelWarmup:
+    """
+    Carica i modelli all'avvio e tiene lo stato di readiness.
+
+    Lo stato di ogni modello contiene l'esito dell'ultima sonda, l'eventuale
+    errore e il tempo di caricamento riportato da Ollama.
+    """
+
+    def __init__(
+        self,
+        service: LLMService,
+        models: List[str] = LLM_WARMUP_MODELS,
+        enabled: bool = LLM_WARMUP_ENABLED,
+        retry_delay: float = LLM_WARMUP_RETRY_DELAY,
+        interval: float = LLM_READINESS_INTERVAL,
+    ):
+        self.service = service
+        self.models = models or [service.model]
+        self.enabled = enabled
+        self.retry_delay = retry_delay
+        self.interval = interval
+        self._state: Dict[str, dict] = {
+            model: {"ready": False, "last_error": None, "load_seconds": None, "checked_at": None}
+            for model in self.models
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        if not self.enabled:
+            return True
+        return all(state["ready"] for state in self._state.values())
+
+    async def probe(self, model: str) -> bool:
+        """Carica (o mantiene in memoria) un modello e ne aggiorna lo stato."""
+        state = self._state[model]
+        was_ready = state["ready"]
+        try:
+            load_seconds = await self.service.load_model(model)
+            state.update(ready=True, last_error=None)
+            if load_seconds > 0.5 or not was_ready:
+                state["load_seconds"] = round(load_seconds, 2)
+                print(f"[llm] Modello {model} pronto (caricamento {load_seconds:.1f}s)")
+        except httpx.HTTPError as e:
+            state.update(ready=False, last_error=str(e) or type(e).__name__)
+            if was_ready:
+                print(f"[llm] Modello {model} non più disponibile: {state['last_error']}")
+        state["checked_at"] = datetime.utcnow()
+        return state["ready"]
+
+    async def probe_all(self) -> bool:
+        results = await asyncio.gather(*(self.probe(model) for model in self.models))
+        return all(results)
+
+    async def _run(self):
+        while True:
+            try:
+                ready = await self.probe_all()
+            except Exception as e:
+                # La sonda non deve mai terminare il task
+                print(f"[llm] Errore durante il warm-up: {e}")
+                ready = False
+            await asyncio.sleep(self.interval if ready else self.retry_delay)
+
+    def start(self):
+        """Avvia warm-up e sonda periodica nell'event loop corrente (non bloccante)."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "enabled": self.enabled,
+            "keep_alive": self.service.keep_alive,
+            "models": self._state,
+        }
+
+# Istanza globale del warm-up
+model_warmup = ModelWarmup(llm_service)
@@ -0,0 +1,253 @@
+# Metriche dell'applicazione in formato testo Prometheus (/metrics)
+# - HTTP: latenza (istogramma) e numero di richieste per route, metodo e stato;
+#   richieste in corso per route
+# - LLM: latenza delle chiamate a Ollama e sua suddivisione in caricamento del
+#   modello, valutazione del prompt e generazione (campi *_duration della
+#   risposta), token elaborati e velocità di generazione
+# - Cache, pool del database e controllo di ammissione: esportati a ogni
+#   lettura dalle rispettive stats() tramite i collector registrati in main.py
+#
+# Le route sono identificate dal loro template (es. /api/questions/{question_id}),
+# così il numero di serie non cresce con gli id; le richieste che non
+# corrispondono a nessuna route sono raggruppate sotto "unmatched".
+# Nessuna dipendenza esterna: i tipi sono un sottoinsieme di quelli di
+# prometheus_client, aggiornati solo dall'event loop.
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Estremi superiori dei bucket degli istogrammi (secondi)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Starlette aggiunge "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# Campione: (suffisso del nome, etichette, valore)
+Sample = Tuple[str, Dict[str, str], float]
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Valore che può solo crescere."""
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        return [("_total", self._labels(key), value) for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    """Distribuzione di valori in bucket cumulativi, con somma e conteggio."""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # conteggi per bucket (non cumulativi), somma
+            series = self._series[key] = [[0] * len(self.buckets), 0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+                break
+        series[1] += value
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        for key, (counts, total) in self._series.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+# Collector: funzione chiamata a ogni lettura che restituisce le metriche
+# calcolate in quel momento come (nome, tipo, descrizione, [(etichette, valore)])
+Collected = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Collected]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=HTTP_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Collected]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Tutte le metriche nel formato di esposizione testuale di Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                print(f"[metrics] Collector {getattr(collector, '__name__', collector)} non riuscito: {e}")
+                continue
+            for name, metric_type, documentation, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Registro globale delle metriche
+registry = MetricsRegistry()
+
+# --- HTTP ---
+
+http_requests = registry.counter(
+    "http_requests", "Richieste HTTP completate", ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Durata delle richieste HTTP fino all'ultimo byte della risposta", ("method", "route"),
+)
+
+# Richieste in corso: scope ASGI indicizzati per id (la route viene letta al
+# momento dell'esportazione, dopo che il router l'ha aggiunta allo scope)
+_active_requests: Dict[int, dict] = {}
+
+def route_label(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """Middleware ASGI che misura latenza, esito e concorrenza delle richieste HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # se l'applicazione fallisce prima di rispondere
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        _active_requests[id(scope)] = scope
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            del _active_requests[id(scope)]
+            route = route_label(scope)
+            http_request_duration.observe(time.perf_counter() - started, method=scope["method"], route=route)
+            http_requests.inc(method=scope["method"], route=route, status=str(status))
+
+def _collect_in_flight() -> Iterable[Collected]:
+    counts: Dict[str, int] = {}
+    for scope in list(_active_requests.values()):
+        route = route_label(scope)
+        counts[route] = counts.get(route, 0) + 1
+    yield (
+        "http_requests_in_flight", "gauge", "Richieste HTTP in corso",
+        [({"route": route}, count) for route, count in sorted(counts.items())],
+    )
+
+registry.register_collector(_collect_in_flight)
+
+# --- LLM ---
+
+llm_request_duration = registry.histogram(
+    "llm_request_duration_seconds", "Durata delle chiamate a Ollama (senza l'attesa nel controllo di ammissione)",
+    ("model", "mode"), LLM_BUCKETS,
+)
+llm_phase_duration = registry.histogram(
+    "llm_phase_duration_seconds", "Durata delle fasi riportate da Ollama (load, prompt_eval, eval)",
+    ("model", "phase"), LLM_BUCKETS,
+)
+llm_tokens = registry.counter(
+    "llm_tokens", "Token elaborati da Ollama (prompt = prompt_eval_count, eval = eval_count)", ("model", "kind"),
+)
+llm_eval_rate = registry.histogram(
+    "llm_eval_tokens_per_second", "Velocità di generazione (eval_count / eval_duration)", ("model",), TOKEN_RATE_BUCKETS,
+)
+
+# Campi della risposta di Ollama (nanosecondi) per ciascuna fase
+_LLM_PHASES = (("load", "load_duration"), ("prompt_eval", "prompt_eval_duration"), ("eval", "eval_duration"))
+
+def observe_llm_call(model: str, mode: str, seconds: float, result: Optional[dict]):
+    """
+    Registra una chiamata completata a Ollama.
+
+    Args:
+        mode: "generate" (risposta completa) o "stream"
+        result: JSON finale di Ollama (per lo streaming l'oggetto con done=true)
+    """
+    llm_request_duration.observe(seconds, model=model, mode=mode)
+    if not result:
+        return
+    for phase, field in _LLM_PHASES:
+        if result.get(field) is not None:
+            llm_phase_duration.observe(result[field] / 1e9, model=model, phase=phase)
+    prompt_tokens = result.get("prompt_eval_count") or 0
+    eval_tokens = result.get("eval_count") or 0
+    if prompt_tokens:
+        llm_tokens.inc(prompt_tokens, model=model, kind="prompt")
+    if eval_tokens:
+        llm_tokens.inc(eval_tokens, model=model, kind="eval")
+        if result.get("eval_duration"):
+            llm_eval_rate.observe(eval_tokens / (result["eval_duration"] / 1e9), model=model)
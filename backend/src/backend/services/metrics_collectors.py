@@ -0,0 +1,73 @@
+# Collector delle metriche calcolate dalle stats() dei servizi
+# Registrati all'importazione (da main.py): a ogni lettura di /metrics
+# esportano lo stato corrente di cache, pool del database, controllo di
+# ammissione verso Ollama e hashing delle password.
+from backend.services.database import DB_MAX_OVERFLOW, pool_stats
+from backend.services.llm_service import llm_service
+from backend.services.metrics import registry
+from backend.services.password_hasher import password_hasher
+from backend.services.principal_cache import principal_cache
+from backend.services.reference_cache import theme_cache
+
+def collect_caches():
+    llm = llm_service.cache.stats()
+    principal = principal_cache.stats()
+    themes = theme_cache.stats()
+    # Per la cache dei temi un miss è un caricamento dal database
+    caches = {
+        "llm": (llm["hits"], llm["misses"], llm["memory_entries"]),
+        "principal": (principal["hits"], principal["misses"], principal["entries"]),
+        "themes": (themes["hits"], themes["loads"], themes["themes"]),
+    }
+    yield ("cache_hits_total", "counter", "Letture servite dalla cache",
+           [({"cache": name}, hits) for name, (hits, _, _) in caches.items()])
+    yield ("cache_misses_total", "counter", "Letture non trovate in cache",
+           [({"cache": name}, misses) for name, (_, misses, _) in caches.items()])
+    yield ("cache_hit_ratio", "gauge", "Frazione di letture servite dalla cache dall'avvio",
+           [({"cache": name}, hits / (hits + misses) if hits + misses else 0.0) for name, (hits, misses, _) in caches.items()])
+    yield ("cache_entries", "gauge", "Voci presenti in cache",
+           [({"cache": name}, entries) for name, (_, _, entries) in caches.items()])
+    yield ("llm_cache_hits_total", "counter", "Letture servite dalla cache LLM per livello",
+           [({"tier": "memory"}, llm["memory_hits"]), ({"tier": "disk"}, llm["disk_hits"])])
+
+def collect_db_pool():
+    pools = pool_stats()
+    yield ("db_pool_checkouts_total", "counter", "Connessioni prese dal pool",
+           [({"engine": name}, stats["checkouts"]) for name, stats in pools.items()])
+    yield ("db_pool_connects_total", "counter", "Nuove connessioni aperte verso il database",
+           [({"engine": name}, stats["connects"]) for name, stats in pools.items()])
+    yield ("db_pool_wait_seconds_max", "gauge", "Attesa massima per ottenere una connessione",
+           [({"engine": name}, stats["wait_seconds_max"]) for name, stats in pools.items()])
+    # I campi seguenti esistono solo per i pool con dimensione (non SQLite)
+    sized = {name: stats for name, stats in pools.items() if "size" in stats}
+    yield ("db_pool_size", "gauge", "Connessioni mantenute nel pool (DB_POOL_SIZE)",
+           [({"engine": name}, stats["size"]) for name, stats in sized.items()])
+    yield ("db_pool_checked_out", "gauge", "Connessioni in uso",
+           [({"engine": name}, stats["checked_out"]) for name, stats in sized.items()])
+    yield ("db_pool_overflow", "gauge", "Connessioni aperte oltre DB_POOL_SIZE",
+           [({"engine": name}, stats["overflow"]) for name, stats in sized.items()])
+    # Solo per i pool configurati con DB_POOL_SIZE e DB_MAX_OVERFLOW (database server)
+    configured = {name: stats for name, stats in sized.items() if stats["pool"].startswith("Timed")}
+    yield ("db_pool_utilization", "gauge", "Connessioni in uso rispetto al massimo (DB_POOL_SIZE + DB_MAX_OVERFLOW)",
+           [({"engine": name}, stats["checked_out"] / (stats["size"] + DB_MAX_OVERFLOW)) for name, stats in configured.items()])
+
+def collect_llm_admission():
+    limiter = llm_service.admission.limiter.stats()
+    breaker = llm_service.admission.breaker.stats()
+    yield ("llm_concurrency_limit", "gauge", "Limite di concorrenza adattivo verso Ollama", [({}, limiter["limit"])])
+    yield ("llm_in_flight", "gauge", "Chiamate a Ollama in corso", [({}, limiter["in_flight"])])
+    yield ("llm_queued", "gauge", "Chiamate in attesa di uno slot", [({}, limiter["queued"])])
+    yield ("llm_rejected_total", "counter", "Chiamate rifiutate per sovraccarico o circuito aperto",
+           [({"reason": "overload"}, limiter["rejected"]), ({"reason": "queue_timeout"}, limiter["queue_timeouts"]),
+            ({"reason": "circuit_open"}, breaker["short_circuited"])])
+    yield ("llm_circuit_open", "gauge", "1 se il circuito verso Ollama è aperto",
+           [({}, 1 if breaker["state"] == "open" else 0)])
+
+def collect_password_hasher():
+    stats = password_hasher.stats()
+    yield ("password_hash_pending", "gauge", "Hash bcrypt in coda o in esecuzione", [({}, stats["pending"])])
+    yield ("password_hash_operations_total", "counter", "Operazioni bcrypt eseguite",
+           [({"operation": "hash"}, stats["hashes"]), ({"operation": "verify"}, stats["verifications"])])
+
+for _collector in (collect_caches, collect_db_pool, collect_llm_admission, collect_password_hasher):
+    registry.register_collector(_collector)
@@ -0,0 +1,80 @@
+# Migrazioni del database con Alembic
+# Le revisioni sono in backend/migrations/versions. All'avvio l'applicazione
+# porta il database all'ultima revisione (DB_AUTO_MIGRATE); da riga di comando:
+#   alembic upgrade head        (dalla cartella che contiene alembic.ini)
+#   python -m backend.services.migrations
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+
+from backend.services.database import engine
+
+# Configurazione tramite variabili d'ambiente
+# - DB_AUTO_MIGRATE: "false" per non applicare le migrazioni all'avvio
+# - DB_MIGRATION_LOCK_TIMEOUT: secondi di attesa del lock quando più processi
+#   (API e worker) partono insieme
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+DB_MIGRATION_LOCK_TIMEOUT = int(os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "60"))
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+MIGRATION_LOCK_NAME = "culturallm_migrations"
+
+def alembic_config(connection=None) -> Config:
+    """Configurazione di Alembic che non dipende da alembic.ini."""
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+def current_revision() -> str:
+    """Revisione applicata al database (None se mai migrato)."""
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+def head_revision() -> str:
+    """Ultima revisione in backend/migrations/versions."""
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+def check_schema():
+    """
+    Verifica che il database sia all'ultima revisione (usata con DB_AUTO_MIGRATE
+    disattivato): uno schema vecchio, ad esempio senza la colonna
+    answers.llm_answer_question_id e il suo indice univoco, farebbe fallire
+    ogni query sulle risposte invece di impedire l'avvio.
+    """
+    current, head = current_revision(), head_revision()
+    if current != head:
+        raise RuntimeError(
+            f"Database alla revisione {current}, attesa {head}: "
+            "eseguire python -m backend.services.migrations"
+        )
+
+def run_migrations(target: str = "head"):
+    """
+    Applica le migrazioni fino a `target`.
+    Su MySQL/MariaDB un lock con nome serializza i processi che partono insieme.
+    """
+    with engine.connect() as connection:
+        use_lock = connection.dialect.name == "mysql"
+        if use_lock:
+            acquired = connection.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {"name": MIGRATION_LOCK_NAME, "timeout": DB_MIGRATION_LOCK_TIMEOUT},
+            ).scalar()
+            if not acquired:
+                raise RuntimeError("Lock delle migrazioni non ottenuto: un altro processo le sta applicando")
+        try:
+            command.upgrade(alembic_config(connection), target)
+            connection.commit()
+        finally:
+            if use_lock:
+                connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+if __name__ == "__main__":
+    run_migrations()
+    print(f"Database alla revisione {current_revision()}")
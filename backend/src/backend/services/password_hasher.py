@@ -0,0 +1,136 @@
+# Hashing delle password fuori dall'event loop
+# bcrypt impiega 100-300 ms di CPU per ogni hash o verifica: eseguito
+# direttamente negli endpoint async bloccherebbe tutte le altre richieste
+# (ad es. durante i login all'inizio di una lezione). Le operazioni vengono
+# quindi eseguite su un pool di thread dedicato, limitato a
+# PASSWORD_HASH_WORKERS thread; bcrypt rilascia il GIL durante il calcolo,
+# quindi i thread lavorano in parallelo sui diversi core.
+# Le richieste oltre la capacità del pool attendono in coda senza occupare
+# l'event loop.
+#
+# Il costo (BCRYPT_ROUNDS) si può cambiare senza invalidare le password
+# esistenti: al login un hash con un costo diverso viene ricalcolato con il
+# costo corrente (verify_and_update di passlib).
+#
+# Microbenchmark (login al secondo al variare dei thread):
+#   python -m backend.services.password_hasher [--rounds 12] [--logins 64]
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Configurazione tramite variabili d'ambiente
+# - PASSWORD_HASH_WORKERS: thread dedicati a bcrypt (default: numero di core)
+# - BCRYPT_ROUNDS: fattore di costo di bcrypt (log2 delle iterazioni, 4-31)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+def make_context(rounds: int = BCRYPT_ROUNDS) -> CryptContext:
+    """Contesto passlib con il costo indicato; gli hash con un costo diverso vanno aggiornati."""
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+class PasswordHasher:
+    """Hash e verifica delle password bcrypt su un pool di thread limitato."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, rounds: int = BCRYPT_ROUNDS):
+        self.workers = max(1, workers)
+        self.rounds = rounds
+        self.context = make_context(rounds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {"hashes": 0, "verifications": 0, "failures": 0, "rehashes": 0}
+        self._busy_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._pending += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), self._timed, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash della password con il costo corrente."""
+        hashed = await self._run(self.context.hash, password)
+        self._counters["hashes"] += 1
+        return hashed
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifica la password.
+
+        Returns:
+            (valida, nuovo_hash): nuovo_hash non è None se la password è
+            valida ma l'hash salvato usa un costo diverso da BCRYPT_ROUNDS
+            e va sostituito
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        self._counters["verifications"] += 1
+        if not valid:
+            self._counters["failures"] += 1
+        elif new_hash is not None:
+            self._counters["rehashes"] += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        """Chiude il pool di thread (viene ricreato al primo uso successivo)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        operations = self._counters["hashes"] + self._counters["verifications"]
+        return {
+            **self._counters,
+            "pending": self._pending,
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "avg_ms": round(self._busy_seconds * 1000 / operations, 1) if operations else 0.0,
+        }
+
+# Istanza globale usata dal router di autenticazione
+password_hasher = PasswordHasher()
+
+async def _benchmark(workers: int, rounds: int, logins: int) -> float:
+    hasher = PasswordHasher(workers=workers, rounds=rounds)
+    hashed = make_context(rounds).hash("benchmark-password")
+    started = time.perf_counter()
+    await asyncio.gather(*(hasher.verify("benchmark-password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return logins / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login al secondo (verifica bcrypt) al variare dei thread")
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    counts = sorted({1, 2, 4, 8, 16, args.max_workers} & set(range(1, args.max_workers + 1)))
+    baseline = None
+    for workers in counts:
+        rate = asyncio.run(_benchmark(workers, args.rounds, args.logins))
+        baseline = baseline or rate
+        print(f"[password_hasher] workers={workers:<3} rounds={args.rounds} {rate:8.1f} login/s  x{rate / baseline:.2f}")
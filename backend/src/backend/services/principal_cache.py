@@ -0,0 +1,107 @@
+# Cache degli utenti autenticati (principal)
+# get_current_user verifica il JWT a ogni richiesta ma legge l'utente dal
+# database solo se non è in cache: le voci sono indicizzate per subject del
+# token (username), limitate in numero e con una scadenza breve.
+# Il principal contiene solo i dati stabili dell'utente (id, username, email,
+# stato): punteggio e badge cambiano spesso e vanno letti dal database
+# (get_current_user_fresh). Le modifiche a un utente fatte tramite l'ORM in
+# questo processo invalidano subito la sua voce; per gli altri processi vale
+# la scadenza PRINCIPAL_CACHE_TTL.
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, inspect
+
+from backend.models.schemas import User
+
+# Configurazione tramite variabili d'ambiente
+# - PRINCIPAL_CACHE_SIZE: numero massimo di utenti in cache (0 disattiva la cache)
+# - PRINCIPAL_CACHE_TTL: durata di una voce in secondi
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+@dataclass(frozen=True)
+class Principal:
+    """Utente autenticato, senza i campi che cambiano spesso (score, badges)."""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=bool(user.is_active),
+            created_at=user.created_at,
+        )
+
+class PrincipalCache:
+    """LRU con scadenza dei principal, indicizzata per username."""
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(username)
+                self._counters["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[username]
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, principal: Principal):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[principal.username] = (principal, time.monotonic())
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            if self._entries.pop(username, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_size,
+            "ttl_seconds": self.ttl,
+        }
+
+# Istanza globale della cache dei principal
+principal_cache = PrincipalCache()
+
+# Utente modificato (es. disattivato o rinominato) o eliminato tramite l'ORM:
+# la voce viene invalidata, anche con il vecchio username
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.invalidate(target.username)
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        principal_cache.invalidate(old_username)
@@ -0,0 +1,162 @@
+# Verifica dei piani di esecuzione delle query più frequenti
+# Esegue EXPLAIN (MySQL/MariaDB) o EXPLAIN QUERY PLAN (SQLite) su ogni query
+# e controlla che usi un indice invece di leggere tutta la tabella.
+#
+# Uso: python -m backend.services.query_plans   (exit code 1 se una query fa table scan)
+import sys
+from typing import List
+
+from sqlalchemy import desc, select, text
+from sqlalchemy.engine import Engine
+
+from backend.models.schemas import Answer, LLMValidation, Question, User, UserBadge, ValidatedTag, Validation
+from backend.services.database import engine
+
+# (nome, query, indice atteso)
+HOT_QUERIES = [
+    (
+        "risposta AI di una domanda",
+        select(Answer.id).where(Answer.question_id == 1, Answer.is_llm_answer == True),
+        "ix_answers_question_llm",
+    ),
+    (
+        "risposta di un utente a una domanda",
+        select(Answer.id).where(Answer.user_id == 1, Answer.question_id == 1),
+        "ix_answers_user_question",
+    ),
+    (
+        "risposte già validate da un utente",
+        select(Validation.answer_id).where(Validation.validator_id == 1),
+        "ix_validations_validator_answer",
+    ),
+    (
+        "validazioni di una risposta",
+        select(Validation.id).where(Validation.answer_id == 1).order_by(Validation.created_at, Validation.id).limit(21),
+        "ix_validations_answer_created",
+    ),
+    (
+        "validazioni LLM di una risposta",
+        select(LLMValidation.id).where(LLMValidation.answer_id == 1),
+        "ix_llm_validations_answer",
+    ),
+    (
+        "domande attive",
+        select(Question.id).where(Question.is_active == True).order_by(Question.created_at, Question.id).limit(11),
+        "ix_questions_active_created",
+    ),
+    (
+        "domande attive per tema",
+        select(Question.id).where(Question.is_active == True, Question.theme_id == 1)
+        .order_by(Question.created_at, Question.id).limit(11),
+        "ix_questions_active_theme_created",
+    ),
+    (
+        "risposte di una domanda",
+        select(Answer.id).where(Answer.question_id == 1).order_by(Answer.created_at, Answer.id).limit(21),
+        "ix_answers_question_created",
+    ),
+    (
+        "domande senza tag",
+        select(Question.id).where(Question.tag.is_(None)).order_by(Question.id).limit(8),
+        "ix_questions_tag",
+    ),
+    (
+        "tag validati di un utente",
+        select(ValidatedTag.id).where(ValidatedTag.user_id == 1, ValidatedTag.question_id == 1),
+        "_user_question_uc",
+    ),
+    (
+        "pagina dei tag validati di un utente",
+        select(ValidatedTag.id).where(ValidatedTag.user_id == 1).order_by(ValidatedTag.created_at, ValidatedTag.id).limit(21),
+        "ix_validated_tags_user_created",
+    ),
+    (
+        "utenti con un badge",
+        select(UserBadge.user_id).where(UserBadge.badge == "gold_validator"),
+        "ix_user_badges_badge_user",
+    ),
+    (
+        "risposte da validare in ordine di priorità",
+        select(Answer.id).where(Answer.validation_count < 3).order_by(Answer.validation_count, Answer.id).limit(10),
+        "ix_answers_validation_queue",
+    ),
+    (
+        "lease di un validatore",
+        select(Answer.id).where(Answer.leased_by == 1, Answer.lease_expires_at >= "2026-01-01"),
+        "ix_answers_leased_by",
+    ),
+    (
+        "domande da rispondere (meno risposte prima)",
+        select(Question.id).where(Question.is_active == True).order_by(Question.answer_count, Question.id).limit(10),
+        "ix_questions_active_answers",
+    ),
+    (
+        "domande da rispondere per tema",
+        select(Question.id).where(Question.is_active == True, Question.theme_id == 1)
+        .order_by(Question.answer_count, Question.id).limit(10),
+        "ix_questions_active_theme_answers",
+    ),
+    (
+        "classifica",
+        select(User.id).where(User.is_active == True).order_by(desc(User.score)).limit(10),
+        "ix_users_active_score",
+    ),
+]
+
+def explain(bind: Engine, statement) -> dict:
+    """
+    Esegue EXPLAIN su una query.
+
+    Returns:
+        {"index": indice usato o None, "scan": True se legge tutta la tabella,
+         "candidates": indici utilizzabili (solo MySQL), "plan": piano testuale}
+    """
+    sql = str(statement.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+    with bind.connect() as connection:
+        if bind.dialect.name == "sqlite":
+            details = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            main = details[0] if details else ""
+            index = main.split(" INDEX ", 1)[1].split(" ")[0] if " INDEX " in main else None
+            return {
+                "index": index,
+                "scan": main.startswith("SCAN") and index is None,
+                "candidates": [],
+                "plan": "; ".join(details),
+            }
+        rows = [dict(row._mapping) for row in connection.execute(text(f"EXPLAIN {sql}"))]
+        main = rows[0] if rows else {}
+        candidates = (main.get("possible_keys") or "").split(",")
+        return {
+            "index": main.get("key"),
+            "scan": main.get("type") == "ALL",
+            "candidates": [candidate for candidate in candidates if candidate],
+            "plan": f"type={main.get('type')} key={main.get('key')} rows={main.get('rows')}",
+        }
+
+def check_query_plans(bind: Engine = engine) -> List[dict]:
+    """
+    Controlla il piano di tutte le HOT_QUERIES.
+
+    Una query è "ok" se usa un indice. Su MySQL con tabelle quasi vuote
+    l'ottimizzatore può preferire la scansione anche se l'indice esiste:
+    in quel caso lo stato è "small_table" e non viene considerato un errore.
+    """
+    results = []
+    for name, statement, expected in HOT_QUERIES:
+        plan = explain(bind, statement)
+        if not plan["scan"]:
+            status = "ok"
+        elif expected in plan["candidates"]:
+            status = "small_table"
+        else:
+            status = "table_scan"
+        results.append({"query": name, "expected_index": expected, "status": status, **plan})
+    return results
+
+if __name__ == "__main__":
+    failures = 0
+    for result in check_query_plans():
+        failures += result["status"] == "table_scan"
+        print(f"[{result['status']:>11}] {result['query']}: indice {result['index']} "
+              f"(atteso {result['expected_index']}) - {result['plan']}")
+    sys.exit(1 if failures else 0)
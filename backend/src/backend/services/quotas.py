@@ -0,0 +1,311 @@
+# Quote di utilizzo del modello (token bucket)
+# Gli endpoint che chiamano Ollama consumano gettoni da tre bucket insieme:
+# - del chiamante: l'utente autenticato, oppure l'indirizzo IP per le richieste anonime
+# - dell'indirizzo IP, per tutte le richieste (più account dallo stesso
+#   indirizzo non moltiplicano la quota)
+# - dell'endpoint (somma di tutti i chiamanti)
+# Il costo di una richiesta è il numero di chiamate al modello che esegue
+# (ENDPOINT_COSTS, per elemento negli endpoint che valutano più risposte).
+# La richiesta è ammessa solo se tutti i bucket hanno gettoni sufficienti, e
+# in quel caso vengono scalati tutti insieme; altrimenti viene rifiutata con
+# QuotaExceeded (429 con Retry-After): nessun bucket scende sotto zero.
+# Una richiesta che costa più della capacità del bucket più piccolo non
+# potrebbe mai essere ammessa e viene rifiutata con QuotaCostTooHigh (400):
+# gli endpoint multipli accettano al massimo max_items(endpoint) elementi.
+#
+# Per ogni chiamante vengono inoltre contati le chiamate effettive al modello
+# (le risposte dalla cache non contano) e i token restituiti da Ollama
+# (prompt_eval_count, eval_count).
+#
+# Bucket e contatori sono nella memoria del processo; con più processi si può
+# usare Redis (QUOTA_REDIS_URL), dove i bucket sono aggiornati da uno script
+# Lua (atomico) e i contatori sono hash. Se Redis non risponde le richieste
+# vengono ammesse.
+import math
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis è opzionale
+    aioredis = None
+
+# Configurazione tramite variabili d'ambiente
+# - QUOTA_ENABLED: "false" per disattivare i limiti (i contatori restano attivi)
+# - QUOTA_USER_PER_MINUTE / QUOTA_USER_BURST: chiamate al modello al minuto e picco per
+#   chiamante (utente autenticato, o indirizzo IP per le richieste anonime)
+# - QUOTA_IP_PER_MINUTE / QUOTA_IP_BURST: come sopra, per indirizzo IP (tutte le richieste,
+#   anche di utenti diversi)
+# - QUOTA_ENDPOINT_PER_MINUTE / QUOTA_ENDPOINT_BURST: come sopra, per endpoint (tutti i chiamanti)
+# - QUOTA_TRUST_FORWARDED: usa X-Forwarded-For come IP del client (solo dietro un proxy fidato)
+# - QUOTA_REDIS_URL: se impostato bucket e contatori sono condivisi tramite Redis
+# - QUOTA_REDIS_PREFIX: prefisso delle chiavi su Redis
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "true").lower() in ("1", "true", "yes")
+QUOTA_USER_PER_MINUTE = float(os.getenv("QUOTA_USER_PER_MINUTE", "20"))
+QUOTA_USER_BURST = float(os.getenv("QUOTA_USER_BURST", "10"))
+QUOTA_IP_PER_MINUTE = float(os.getenv("QUOTA_IP_PER_MINUTE", "40"))
+QUOTA_IP_BURST = float(os.getenv("QUOTA_IP_BURST", "20"))
+QUOTA_ENDPOINT_PER_MINUTE = float(os.getenv("QUOTA_ENDPOINT_PER_MINUTE", "120"))
+QUOTA_ENDPOINT_BURST = float(os.getenv("QUOTA_ENDPOINT_BURST", "30"))
+QUOTA_TRUST_FORWARDED = os.getenv("QUOTA_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+QUOTA_REDIS_URL = os.getenv("QUOTA_REDIS_URL", "")
+QUOTA_REDIS_PREFIX = os.getenv("QUOTA_REDIS_PREFIX", "culturallm:quota")
+# Bucket in memoria oltre i quali vengono eliminati quelli già pieni
+QUOTA_MAX_BUCKETS = 10000
+
+# Chiamate al modello eseguite da ciascun endpoint
+ENDPOINT_COSTS = {
+    "questions.generate": 2,   # domanda + tag
+    "questions.tag": 1,
+    "validate.llm": 2,         # valutazione della risposta umana e di quella LLM
+    "validate.llm_text": 3,    # generazione della risposta LLM + due valutazioni
+    "validate.llm_bulk": 1,    # per risposta valutata
+    "validate.llm_jobs": 1,    # per risposta messa in coda
+}
+
+@dataclass(frozen=True)
+class BucketLimit:
+    per_minute: float
+    burst: float
+
+    @property
+    def rate(self) -> float:
+        """Gettoni ricaricati al secondo."""
+        return self.per_minute / 60
+
+LIMITS = {
+    "user": BucketLimit(QUOTA_USER_PER_MINUTE, QUOTA_USER_BURST),
+    "ip": BucketLimit(QUOTA_IP_PER_MINUTE, QUOTA_IP_BURST),
+    "endpoint": BucketLimit(QUOTA_ENDPOINT_PER_MINUTE, QUOTA_ENDPOINT_BURST),
+}
+
+class QuotaExceeded(Exception):
+    """Quota esaurita per `scope` ("user", "ip" o "endpoint"); `retry_after` in secondi."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Quota di chiamate al modello esaurita ({scope})")
+        self.detail = f"Quota di chiamate al modello esaurita ({scope}), riprova tra {math.ceil(retry_after)} s"
+        self.scope = scope
+        self.retry_after = retry_after
+
+class QuotaCostTooHigh(Exception):
+    """Richiesta che costa più della capacità di un bucket: al massimo `max_items` elementi."""
+
+    def __init__(self, endpoint: str, max_items: int):
+        super().__init__(f"Costo della richiesta superiore alla quota ({endpoint})")
+        self.detail = f"Massimo {max_items} elementi per richiesta con le quote attuali"
+        self.endpoint = endpoint
+        self.max_items = max_items
+
+# (chiave del bucket, limite, costo)
+Charge = Tuple[str, BucketLimit, float]
+
+class MemoryQuotaBackend:
+    """Bucket e contatori nella memoria del processo."""
+    name = "memory"
+
+    def __init__(self, max_buckets: int = QUOTA_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: Dict[str, Tuple[float, float, BucketLimit]] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def _level(self, key: str, limit: BucketLimit, now: float) -> float:
+        tokens, updated_at, _ = self._buckets.get(key, (limit.burst, now, limit))
+        return min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+    def _prune(self, now: float):
+        # Un bucket pieno equivale a uno assente
+        for key in [key for key, (_, _, limit) in self._buckets.items() if self._level(key, limit, now) >= limit.burst]:
+            del self._buckets[key]
+
+    async def acquire(self, charges: List[Charge]) -> Tuple[Optional[int], float]:
+        # Nessun await tra lettura e aggiornamento: l'operazione è atomica nell'event loop
+        now = time.monotonic()
+        levels = [self._level(key, limit, now) for key, limit, _ in charges]
+        blocked, wait = None, 0.0
+        for index, ((_, limit, cost), level) in enumerate(zip(charges, levels)):
+            if level < cost and (cost - level) / limit.rate > wait:
+                blocked, wait = index, (cost - level) / limit.rate
+        if blocked is not None:
+            return blocked, wait
+        for (key, limit, cost), level in zip(charges, levels):
+            self._buckets[key] = (level - cost, now, limit)
+        if len(self._buckets) > self.max_buckets:
+            self._prune(now)
+        return None, 0.0
+
+    async def record(self, subject: str, counts: Dict[str, int]):
+        usage = self._usage.setdefault(subject, {})
+        for field, value in counts.items():
+            usage[field] = usage.get(field, 0) + value
+
+    async def usage(self, subject: str) -> Dict[str, int]:
+        return dict(self._usage.get(subject, {}))
+
+    async def aclose(self):
+        pass
+
+# Script Lua: controlla tutti i bucket e li scala solo se bastano tutti
+# KEYS: bucket; ARGV: per ogni bucket gettoni/secondo, capacità e costo.
+# Restituisce {0, 0} se ammessa, altrimenti {indice del bucket (da 1), attesa in secondi}.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+local blocked, wait = 0, 0
+for i = 1, #KEYS do
+  local rate, capacity, cost = tonumber(ARGV[i*3-2]), tonumber(ARGV[i*3-1]), tonumber(ARGV[i*3])
+  local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  levels[i] = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+  if levels[i] < cost and (cost - levels[i]) / rate > wait then
+    blocked, wait = i, (cost - levels[i]) / rate
+  end
+end
+if blocked > 0 then
+  return {blocked, tostring(wait)}
+end
+for i = 1, #KEYS do
+  local rate, capacity, cost = tonumber(ARGV[i*3-2]), tonumber(ARGV[i*3-1]), tonumber(ARGV[i*3])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+  redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+end
+return {0, '0'}
+"""
+
+class RedisQuotaBackend:
+    """Bucket e contatori condivisi su Redis."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = QUOTA_REDIS_PREFIX):
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url)
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+
+    async def acquire(self, charges: List[Charge]) -> Tuple[Optional[int], float]:
+        keys = [f"{self.prefix}:bucket:{key}" for key, _, _ in charges]
+        args = [value for _, limit, cost in charges for value in (limit.rate, limit.burst, cost)]
+        blocked, wait = await self._acquire(keys=keys, args=args)
+        blocked = int(blocked)
+        return (blocked - 1, float(wait)) if blocked else (None, 0.0)
+
+    async def record(self, subject: str, counts: Dict[str, int]):
+        pipe = self._redis.pipeline(transaction=False)
+        for field, value in counts.items():
+            pipe.hincrby(f"{self.prefix}:usage:{subject}", field, value)
+        await pipe.execute()
+
+    async def usage(self, subject: str) -> Dict[str, int]:
+        raw = await self._redis.hgetall(f"{self.prefix}:usage:{subject}")
+        return {field.decode(): int(value) for field, value in raw.items()}
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+def make_backend():
+    if QUOTA_REDIS_URL:
+        if aioredis is not None:
+            return RedisQuotaBackend(QUOTA_REDIS_URL)
+        print("[quotas] QUOTA_REDIS_URL impostato ma il pacchetto redis non è installato: uso la memoria")
+    return MemoryQuotaBackend()
+
+# Chiamante della richiesta in corso ("user:<id>" o "ip:<indirizzo>"), a cui
+# vengono attribuiti i token restituiti da Ollama
+current_subject: ContextVar[Optional[str]] = ContextVar("quota_subject", default=None)
+
+class QuotaManager:
+    """Limiti per chiamante ed endpoint e contabilità dei token del modello."""
+
+    def __init__(self, backend=None, enabled: bool = QUOTA_ENABLED, limits: Dict[str, BucketLimit] = LIMITS):
+        self.backend = backend if backend is not None else make_backend()
+        self.enabled = enabled
+        self.limits = limits
+        self._counters = {"allowed": 0, "rejected_user": 0, "rejected_ip": 0, "rejected_endpoint": 0,
+                          "rejected_cost": 0, "backend_errors": 0}
+
+    def max_items(self, endpoint: str) -> Optional[int]:
+        """Elementi ammessi in una richiesta all'endpoint (None se i limiti sono disattivati)."""
+        if not self.enabled:
+            return None
+        capacity = min(limit.burst for limit in self.limits.values())
+        return int(capacity // max(ENDPOINT_COSTS.get(endpoint, 1), 1))
+
+    async def charge(self, endpoint: str, user_id: Optional[int] = None, ip: Optional[str] = None, items: int = 1):
+        """
+        Scala il costo dell'endpoint (per `items` elementi) dai bucket del
+        chiamante, dell'indirizzo IP e dell'endpoint e imposta il chiamante
+        corrente per la contabilità dei token.
+
+        Raises:
+            QuotaCostTooHigh: se il costo supera la capacità di uno dei bucket
+            QuotaExceeded: se uno dei bucket non ha gettoni sufficienti
+        """
+        ip = ip or "unknown"
+        subject = f"user:{user_id}" if user_id is not None else f"ip:{ip}"
+        current_subject.set(subject)
+        cost = ENDPOINT_COSTS.get(endpoint, 1) * items
+        if not self.enabled or cost <= 0:
+            return
+        max_items = self.max_items(endpoint)
+        if items > max_items:
+            self._counters["rejected_cost"] += 1
+            raise QuotaCostTooHigh(endpoint, max_items)
+
+        # Le chiavi dei bucket hanno il prefisso dell'ambito: il bucket del
+        # chiamante anonimo è distinto da quello del suo indirizzo
+        charges = [
+            (f"caller:{subject}", self.limits["user"], cost),
+            (f"ip:{ip}", self.limits["ip"], cost),
+            (f"endpoint:{endpoint}", self.limits["endpoint"], cost),
+        ]
+        try:
+            blocked, wait = await self.backend.acquire(charges)
+        except Exception as e:
+            self._counters["backend_errors"] += 1
+            print(f"[quotas] Backend {self.backend.name} non disponibile, richiesta ammessa: {e}")
+            return
+        if blocked is not None:
+            rejected_scope = ("user", "ip", "endpoint")[blocked]
+            self._counters[f"rejected_{rejected_scope}"] += 1
+            raise QuotaExceeded(rejected_scope, wait)
+        self._counters["allowed"] += 1
+
+    async def record_usage(self, result: dict):
+        """Conta una chiamata al modello e i suoi token per il chiamante corrente (se c'è)."""
+        subject = current_subject.get()
+        if subject is None:
+            return
+        counts = {
+            "llm_calls": 1,
+            "prompt_tokens": int(result.get("prompt_eval_count") or 0),
+            "eval_tokens": int(result.get("eval_count") or 0),
+        }
+        try:
+            await self.backend.record(subject, counts)
+        except Exception as e:
+            self._counters["backend_errors"] += 1
+            print(f"[quotas] Contabilità dei token non registrata per {subject}: {e}")
+
+    async def usage(self, subject: str) -> Dict[str, int]:
+        usage = {"llm_calls": 0, "prompt_tokens": 0, "eval_tokens": 0}
+        usage.update(await self.backend.usage(subject))
+        return usage
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "limits": {scope: {"per_minute": limit.per_minute, "burst": limit.burst} for scope, limit in self.limits.items()},
+            "endpoint_costs": ENDPOINT_COSTS,
+        }
+
+# Istanza globale delle quote
+quota_manager = QuotaManager()
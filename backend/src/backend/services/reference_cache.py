@@ -0,0 +1,118 @@
+# Cache in memoria dei dati di riferimento (temi culturali)
+# I temi cambiano raramente (sono inseriti da mariadb_init/init.sql), quindi
+# vengono caricati all'avvio e serviti dalla memoria. La cache è invalidata:
+# - subito, quando questo processo modifica un tema tramite l'ORM
+# - dopo THEMES_CACHE_TTL secondi, per le modifiche fatte da altri processi
+#   o direttamente nel database
+# - quando si chiede un tema sconosciuto (ad es. appena inserito), al più una
+#   volta ogni THEMES_MISS_RELOAD_INTERVAL secondi
+# Le voci sono modelli Pydantic (non oggetti ORM), quindi possono essere
+# condivise tra richieste e sessioni diverse.
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, select
+
+from backend.models.schemas import CulturalTheme, CulturalThemeResponse
+from backend.services.database import AsyncSessionLocal
+from backend.services.singleflight import SingleFlight
+
+# Configurazione tramite variabili d'ambiente
+# - THEMES_CACHE_TTL: secondi dopo i quali i temi vengono ricaricati dal database
+# - THEMES_MISS_RELOAD_INTERVAL: intervallo minimo tra due ricariche per un tema sconosciuto
+# - THEMES_HTTP_MAX_AGE: max-age dell'header Cache-Control di /api/questions/themes
+THEMES_CACHE_TTL = float(os.getenv("THEMES_CACHE_TTL", "300"))
+THEMES_MISS_RELOAD_INTERVAL = float(os.getenv("THEMES_MISS_RELOAD_INTERVAL", "5"))
+THEMES_HTTP_MAX_AGE = int(os.getenv("THEMES_HTTP_MAX_AGE", "60"))
+
+class ThemeCache:
+    """
+    Temi culturali in memoria con ETag per le risposte HTTP.
+    Le ricariche concorrenti sono unite in una sola query (single-flight).
+    """
+
+    def __init__(self, ttl: float = THEMES_CACHE_TTL, miss_reload_interval: float = THEMES_MISS_RELOAD_INTERVAL):
+        self.ttl = ttl
+        self.miss_reload_interval = miss_reload_interval
+        self._themes: List[CulturalThemeResponse] = []
+        self._by_id: Dict[int, CulturalThemeResponse] = {}
+        self._etag = ""
+        self._loaded_at: Optional[float] = None
+        self._flight = SingleFlight()
+        self._counters = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    @property
+    def fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def _load(self):
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(CulturalTheme).order_by(CulturalTheme.id))).scalars().all()
+        themes = [CulturalThemeResponse.model_validate(row) for row in rows]
+        raw = json.dumps([theme.model_dump() for theme in themes], sort_keys=True, ensure_ascii=False)
+        self._themes = themes
+        self._by_id = {theme.id: theme for theme in themes}
+        self._etag = '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16] + '"'
+        self._loaded_at = time.monotonic()
+        self._counters["loads"] += 1
+
+    async def load(self):
+        """Carica (o ricarica) i temi dal database."""
+        await self._flight.do("themes", self._load)
+
+    async def _ensure_fresh(self):
+        if self.fresh:
+            self._counters["hits"] += 1
+        else:
+            await self.load()
+
+    async def snapshot(self) -> Tuple[List[CulturalThemeResponse], str]:
+        """Tutti i temi e il relativo ETag."""
+        await self._ensure_fresh()
+        return self._themes, self._etag
+
+    async def all(self) -> List[CulturalThemeResponse]:
+        await self._ensure_fresh()
+        return self._themes
+
+    async def get(self, theme_id: int) -> Optional[CulturalThemeResponse]:
+        """Un tema per id (None se non esiste)."""
+        await self._ensure_fresh()
+        theme = self._by_id.get(theme_id)
+        # invalidate() può aver azzerato _loaded_at nel frattempo: cache da ricaricare
+        loaded_at = self._loaded_at
+        if theme is None and (loaded_at is None or time.monotonic() - loaded_at >= self.miss_reload_interval):
+            await self.load()
+            theme = self._by_id.get(theme_id)
+        return theme
+
+    def invalidate(self):
+        """Forza la ricarica alla prossima lettura."""
+        self._loaded_at = None
+        self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "themes": len(self._themes),
+            "etag": self._etag,
+            "fresh": self.fresh,
+            "ttl_seconds": self.ttl,
+        }
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Header HTTP per le risposte servite dalla cache dei temi."""
+    return {"ETag": etag, "Cache-Control": f"public, max-age={THEMES_HTTP_MAX_AGE}"}
+
+# Istanza globale della cache dei temi
+theme_cache = ThemeCache()
+
+# Le modifiche ai temi fatte tramite l'ORM in questo processo invalidano la cache
+@event.listens_for(CulturalTheme, "after_insert")
+@event.listens_for(CulturalTheme, "after_update")
+@event.listens_for(CulturalTheme, "after_delete")
+def _invalidate_themes(mapper, connection, target):
+    theme_cache.invalidate()
@@ -0,0 +1,42 @@
+# De-duplicazione delle operazioni concorrenti ("single-flight")
+# Se più richieste avviano la stessa operazione (stessa chiave) mentre è
+# già in corso, solo la prima la esegue e le altre ne attendono il risultato.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """
+    Esegue al massimo un'operazione per chiave alla volta, nel processo corrente.
+
+    Esempio:
+        flight = SingleFlight()
+        result = await flight.do(question_id, lambda: genera(question_id))
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Avvia `fn()` se non c'è già un'operazione in corso per `key`,
+        altrimenti si aggancia a quella esistente.
+
+        La cancellazione di un chiamante non interrompe l'operazione condivisa.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Indica se c'è un'operazione in corso per la chiave."""
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
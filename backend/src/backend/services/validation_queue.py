@@ -0,0 +1,131 @@
+# Coda delle risposte da validare
+# Ogni risposta viene data in lease a un solo validatore per volta, per
+# VALIDATION_LEASE_SECONDS: validatori diversi che chiedono risposte nello
+# stesso momento ricevono risposte diverse. Un lease scaduto (risposta non
+# validata in tempo) rende la risposta di nuovo disponibile.
+# Le risposte con meno validazioni vengono assegnate per prime; una risposta
+# esce dalla coda quando raggiunge VALIDATIONS_PER_ANSWER validazioni.
+#
+# Il prelievo è un compare-and-set come per la coda dei job: l'UPDATE del
+# lease è condizionato al fatto che la risposta sia ancora libera. Su
+# MariaDB i candidati sono letti con SELECT ... FOR UPDATE SKIP LOCKED, così
+# i validatori concorrenti saltano le righe che un altro sta prendendo
+# invece di attenderle.
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import and_, case, exists, func, null, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models.schemas import Answer, Validation
+
+# Configurazione tramite variabili d'ambiente
+# - VALIDATIONS_PER_ANSWER: validazioni necessarie prima che una risposta esca dalla coda
+# - VALIDATION_LEASE_SECONDS: durata del lease di una risposta assegnata a un validatore
+# - VALIDATION_CLAIM_ATTEMPTS: tentativi di prelievo quando altri validatori prendono gli stessi candidati
+VALIDATIONS_PER_ANSWER = int(os.getenv("VALIDATIONS_PER_ANSWER", "3"))
+VALIDATION_LEASE_SECONDS = float(os.getenv("VALIDATION_LEASE_SECONDS", "300"))
+VALIDATION_CLAIM_ATTEMPTS = int(os.getenv("VALIDATION_CLAIM_ATTEMPTS", "5"))
+
+def utcnow() -> datetime:
+    return datetime.utcnow()
+
+def _lease_free(now: datetime):
+    return or_(Answer.leased_by.is_(None), Answer.lease_expires_at < now)
+
+def _needs_validation():
+    return Answer.validation_count < VALIDATIONS_PER_ANSWER
+
+def _leased_to(validator_id: int, now: datetime):
+    return and_(Answer.leased_by == validator_id, Answer.lease_expires_at >= now)
+
+async def lease_answers(validator_id: int, count: int, db: AsyncSession) -> List[int]:
+    """
+    Assegna al validatore fino a `count` risposte e restituisce i loro id,
+    in ordine di priorità (meno validazioni, poi più vecchie).
+
+    I lease ancora validi del validatore vengono rinnovati e restituiti per
+    primi, così una richiesta ripetuta riceve le stesse risposte.
+    Sono escluse le risposte del validatore e quelle che ha già validato.
+    """
+    now = utcnow()
+    expires_at = now + timedelta(seconds=VALIDATION_LEASE_SECONDS)
+
+    # Rinnovo dei lease già assegnati al validatore
+    renewed = await db.execute(
+        update(Answer).where(_leased_to(validator_id, now), _needs_validation())
+        .values(lease_expires_at=expires_at).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    held = renewed.rowcount
+
+    already_validated = exists().where(
+        Validation.answer_id == Answer.id,
+        Validation.validator_id == validator_id,
+    )
+    skip_locked = db.bind.dialect.name == "mysql"
+    for _ in range(VALIDATION_CLAIM_ATTEMPTS):
+        needed = count - held
+        if needed <= 0:
+            break
+        candidates = select(Answer.id).where(
+            _needs_validation(),
+            _lease_free(now),
+            Answer.user_id != validator_id,  # Esclude le proprie risposte (e quelle AI)
+            ~already_validated,              # Esclude le risposte già validate
+        ).order_by(Answer.validation_count, Answer.id).limit(needed)
+        if skip_locked:
+            candidates = candidates.with_for_update(skip_locked=True)
+        candidate_ids = list((await db.execute(candidates)).scalars())
+        if not candidate_ids:
+            await db.commit()
+            break
+
+        # Compare-and-set: la risposta deve essere ancora libera
+        claimed = await db.execute(
+            update(Answer).where(Answer.id.in_(candidate_ids), _lease_free(now))
+            .values(leased_by=validator_id, lease_expires_at=expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        held += claimed.rowcount
+
+    return list((await db.execute(
+        select(Answer.id).where(_leased_to(validator_id, now), _needs_validation())
+        .order_by(Answer.validation_count, Answer.id).limit(count)
+    )).scalars())
+
+async def release_lease(answer_id: int, validator_id: int, db: AsyncSession) -> bool:
+    """Rilascia il lease di una risposta (es. il validatore la salta). Restituisce True se era suo."""
+    result = await db.execute(
+        update(Answer).where(Answer.id == answer_id, Answer.leased_by == validator_id)
+        .values(leased_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+async def record_validation(answer_id: int, validator_id: int, db: AsyncSession):
+    """
+    Conta una nuova validazione della risposta e chiude il lease se era del
+    validatore (senza commit: fa parte della transazione della validazione).
+    """
+    await db.execute(
+        update(Answer).where(Answer.id == answer_id).values(
+            validation_count=Answer.validation_count + 1,
+            leased_by=case((Answer.leased_by == validator_id, null()), else_=Answer.leased_by),
+        ).execution_options(synchronize_session=False)
+    )
+
+async def queue_stats(db: AsyncSession) -> dict:
+    """Risposte in attesa di validazione e lease attivi."""
+    now = utcnow()
+    waiting = (await db.execute(select(func.count(Answer.id)).where(_needs_validation(), Answer.user_id.isnot(None)))).scalar()
+    leased = (await db.execute(select(func.count(Answer.id)).where(Answer.lease_expires_at >= now))).scalar()
+    return {
+        "waiting": waiting,
+        "leased": leased,
+        "validations_per_answer": VALIDATIONS_PER_ANSWER,
+        "lease_seconds": VALIDATION_LEASE_SECONDS,
+    }
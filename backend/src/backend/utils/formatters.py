@@ -101,3 +101,19 @@ def calculate_user_level(score: int) -> Dict[str, any]:
         "next_level": next_level,
         "progress": progress
     }
+
+def format_sse(event: str, data) -> str:
+    """
+    Formatta un evento Server-Sent Events (SSE).
+
+    Args:
+        event: nome dell'evento (es. "token", "done", "error")
+        data: contenuto dell'evento, serializzato in JSON
+
+    Returns:
+        Stringa pronta da inviare al client, terminata da una riga vuota.
+
+    Esempio:
+        ("token", {"text": "Ciao"}) -> 'event: token\ndata: {"text": "Ciao"}\n\n'
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
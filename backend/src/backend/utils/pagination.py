@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import json
+import os
+
+from fastapi import HTTPException, Response
+from sqlalchemy import DateTime, and_, func, literal, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Paginazione a cursore (keyset) sulle colonne (created_at, id)
+# Ogni pagina riparte dall'ultima riga della precedente invece di usare OFFSET,
+# così il costo di una pagina non cresce con la profondità.
+# Il cursore della pagina successiva viene restituito nell'header X-Next-Cursor
+# (assente sull'ultima pagina) e va ripassato come parametro `cursor`.
+# Su SQLite le date sono testo: i valori di server_default=func.now() non hanno
+# frazioni di secondo ("2026-10-17 12:00:00"), mentre il cursore viene scritto
+# con i microsecondi ("2026-10-17 12:00:00.000000"). Filtro e ordinamento usano
+# quindi sortable_datetime, che su SQLite porta entrambi allo stesso formato.
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class sortable_datetime(FunctionElement):
+    """
+    Data confrontabile e ordinabile: su SQLite strftime('%Y-%m-%d %H:%M:%f', ...)
+    (millisecondi, stesso formato per ogni valore), sugli altri database la
+    colonna o il parametro così com'è (così restano usati gli indici).
+    """
+    type = DateTime()
+    name = "sortable_datetime"
+    inherit_cache = True
+
+@compiles(sortable_datetime)
+def _compile_sortable_datetime(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+@compiles(sortable_datetime, "sqlite")
+def _compile_sortable_datetime_sqlite(element, compiler, **kw):
+    return compiler.process(func.strftime("%Y-%m-%d %H:%M:%f", *element.clauses.clauses), **kw)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Codifica la posizione (created_at, id) in un token opaco."""
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    Decodifica un cursore prodotto da encode_cursor.
+
+    Raises:
+        HTTPException: 400 se il cursore non è valido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def clamp_page_size(limit: int) -> int:
+    """Limita la dimensione della pagina a 1..MAX_PAGE_SIZE."""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def keyset_page(query, model, cursor: Optional[str], limit: int):
+    """
+    Applica a una select ordinamento, posizione del cursore e limite.
+    Viene letta una riga in più per sapere se esiste una pagina successiva.
+    """
+    row_created_at = sortable_datetime(model.created_at)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        cursor_created_at = sortable_datetime(literal(created_at, DateTime()))
+        query = query.where(or_(
+            row_created_at > cursor_created_at,
+            and_(row_created_at == cursor_created_at, model.id > row_id),
+        ))
+    return query.order_by(row_created_at, model.id).limit(limit + 1)
+
+def split_page(rows: List, limit: int) -> Tuple[List, Optional[str]]:
+    """Separa le righe della pagina e calcola il cursore della successiva (None se finita)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
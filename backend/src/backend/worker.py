@@ -0,0 +1,31 @@
+# Processo worker dedicato alla coda dei job LLM
+# Permette di scalare la generazione (risposte AI, tag, validazioni)
+# indipendentemente dai worker dell'API.
+#
+# Uso: python -m backend.worker
+# Il numero di worker concorrenti si imposta con JOB_WORKERS.
+import asyncio
+import signal
+
+# Importare l'applicazione registra gli handler dei job e crea le tabelle
+from backend.main import app  # noqa: F401
+from backend.services.jobs import job_queue, JOB_WORKERS
+from backend.services.llm_service import llm_service
+from backend.services.database import async_engine
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    job_queue.start(max(JOB_WORKERS, 1))
+    print(f"[worker] Avviati {job_queue.local_workers} worker")
+    await stop.wait()
+    await job_queue.stop()
+    await llm_service.aclose()
+    await async_engine.dispose()
+    print("[worker] Arresto completato")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+# Server Ollama finto per i benchmark
+# Implementa le API usate da LLMService (/api/generate, anche in streaming e
+# con output strutturato, e /api/tags) con risposte plausibili e tempi
+# configurabili, così il carico sul backend è realistico senza un modello vero.
+# Le risposte riportano i campi *_duration e *_count come Ollama.
+#
+# Configurazione tramite variabili d'ambiente
+# - FAKE_OLLAMA_LATENCY: secondi fissi per ogni chiamata (rete, scheduling)
+# - FAKE_OLLAMA_TOKEN_RATE: token generati al secondo
+# - FAKE_OLLAMA_PROMPT_RATE: token del prompt elaborati al secondo
+# - FAKE_OLLAMA_TOKENS: token generati per una risposta libera (tag e valutazioni sono più corti)
+# - FAKE_OLLAMA_PARALLEL: richieste elaborate in parallelo (come OLLAMA_NUM_PARALLEL), le altre attendono
+# - FAKE_OLLAMA_LOAD_TIME: secondi di caricamento del modello alla prima richiesta
+#
+# Uso: python -m benchmarks.fake_ollama [--port 11500]   (da backend/src)
+import argparse
+import asyncio
+import json
+import os
+import re
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FAKE_OLLAMA_LATENCY = float(os.getenv("FAKE_OLLAMA_LATENCY", "0.05"))
+FAKE_OLLAMA_TOKEN_RATE = float(os.getenv("FAKE_OLLAMA_TOKEN_RATE", "50"))
+FAKE_OLLAMA_PROMPT_RATE = float(os.getenv("FAKE_OLLAMA_PROMPT_RATE", "500"))
+FAKE_OLLAMA_TOKENS = int(os.getenv("FAKE_OLLAMA_TOKENS", "40"))
+FAKE_OLLAMA_PARALLEL = int(os.getenv("FAKE_OLLAMA_PARALLEL", "4"))
+FAKE_OLLAMA_LOAD_TIME = float(os.getenv("FAKE_OLLAMA_LOAD_TIME", "0"))
+
+ANSWER_WORDS = (
+    "La pizza margherita nasce a Napoli nel 1889 in onore della regina Margherita di Savoia "
+    "con i colori della bandiera italiana dati da pomodoro mozzarella e basilico"
+).split()
+
+app = FastAPI(title="Fake Ollama")
+_slots = asyncio.Semaphore(FAKE_OLLAMA_PARALLEL)
+_state = {"loaded": False, "calls": 0}
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+def _response_text(prompt: str, format) -> str:
+    """Testo plausibile per ciascun tipo di prompt del backend."""
+    if isinstance(format, dict) and "tags" in format.get("properties", {}):
+        ids = re.findall(r"^\s*(\d+)\. ", prompt, re.M)
+        return json.dumps({"tags": [{"id": int(i), "tag": f"Tema {i}"} for i in ids]})
+    if format:
+        return json.dumps({
+            "correttezza": 8, "rilevanza": 9, "dettaglio": 7, "chiarezza": 8,
+            "punteggio_complessivo": 8, "feedback": "Risposta corretta e pertinente.",
+        })
+    if "Punteggio complessivo" in prompt:
+        return ("Correttezza: 8\nRilevanza: 9\nDettaglio: 7\nChiarezza: 8\n"
+                "Punteggio complessivo: 8\nFeedback: Risposta corretta e pertinente.")
+    if "tag" in prompt.lower():
+        return "Cucina napoletana"
+    return " ".join(ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(FAKE_OLLAMA_TOKENS))
+
+def _durations(prompt_tokens: int, eval_tokens: int, load: float) -> dict:
+    prompt_eval = prompt_tokens / FAKE_OLLAMA_PROMPT_RATE
+    eval_time = eval_tokens / FAKE_OLLAMA_TOKEN_RATE
+    return {
+        "total_duration": int((load + prompt_eval + eval_time) * 1e9),
+        "load_duration": int(load * 1e9),
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int(prompt_eval * 1e9),
+        "eval_count": eval_tokens,
+        "eval_duration": int(eval_time * 1e9),
+    }
+
+def _load_time() -> float:
+    if _state["loaded"]:
+        return 0.0
+    _state["loaded"] = True
+    return FAKE_OLLAMA_LOAD_TIME
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": os.getenv("OLLAMA_MODEL", "gemma2:2b")}]}
+
+@app.get("/stats")
+async def stats():
+    return _state
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    _state["calls"] += 1
+    model = body.get("model", "")
+    prompt = body.get("prompt", "")
+    if not prompt:
+        # Richiesta di caricamento del modello (warm-up)
+        load = _load_time()
+        await asyncio.sleep(load)
+        return {"model": model, "response": "", "done": True, "load_duration": int(load * 1e9)}
+
+    text = _response_text(prompt, body.get("format"))
+    words = text.split(" ")
+    prompt_tokens = _count_tokens(prompt)
+
+    if body.get("stream"):
+        async def stream():
+            async with _slots:
+                load = _load_time()
+                await asyncio.sleep(FAKE_OLLAMA_LATENCY + load + prompt_tokens / FAKE_OLLAMA_PROMPT_RATE)
+                for word in words:
+                    await asyncio.sleep(1 / FAKE_OLLAMA_TOKEN_RATE)
+                    yield json.dumps({"model": model, "response": word + " ", "done": False}) + "\n"
+                yield json.dumps({"model": model, "response": "", "done": True, **_durations(prompt_tokens, len(words), load)}) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    async with _slots:
+        load = _load_time()
+        durations = _durations(prompt_tokens, len(words), load)
+        await asyncio.sleep(FAKE_OLLAMA_LATENCY + durations["total_duration"] / 1e9)
+    return {"model": model, "response": text, "done": True, **durations}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Server Ollama finto per i benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,408 @@
+# Benchmark di carico del backend
+# Avvia l'applicazione FastAPI (uvicorn) su un database locale (SQLite di
+# default) e un server Ollama finto (benchmarks/fake_ollama.py), poi simula
+# utenti virtuali che eseguono un mix di operazioni reali: registrazione e
+# login, creazione di domande, risposte, validazioni, feed delle attività in
+# attesa e classifica. Per ogni livello di concorrenza riporta throughput e
+# latenze p50/p95/p99 per route; con --baseline confronta i risultati con
+# un'esecuzione precedente ed esce con codice 1 in caso di regressione.
+#
+# Ogni livello di concorrenza usa un database nuovo, e le scelte degli utenti
+# virtuali dipendono solo da --seed, così due esecuzioni sono confrontabili.
+#
+# Uso (da backend/src):
+#   python -m benchmarks.run --concurrency 1,10,50 --duration 30
+#   python -m benchmarks.run --mix llm --ollama-token-rate 20 --json results.json
+#   python -m benchmarks.run --baseline results.json --tolerance 0.2
+#   python -m benchmarks.run --base-url http://localhost:5001   (backend già avviato)
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import create_engine, text
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+INIT_SQL = SRC_DIR.parent.parent / "mariadb_init" / "init.sql"
+
+# Pesi delle operazioni di un utente virtuale per ciascun mix
+MIXES = {
+    "default": {"login": 5, "create_question": 10, "answer": 25, "validate": 20, "feeds": 25, "leaderboard": 15},
+    "read": {"login": 10, "feeds": 50, "leaderboard": 40},
+    "write": {"create_question": 30, "answer": 40, "validate": 30},
+    "llm": {"create_question": 10, "answer": 20, "validate": 15, "feeds": 20, "leaderboard": 10,
+            "generate_question": 10, "tag": 10, "llm_validate_text": 5},
+}
+
+# Temi inseriti nel database se init.sql non è disponibile
+FALLBACK_THEMES = [("Cucina Italiana", "Piatti tipici"), ("Sport", "Calcio e altri sport"), ("Musica e Arte", "Artisti italiani")]
+
+PASSWORD = "benchmark-password"
+
+# --- Processi (backend e Ollama finto) ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def load_themes() -> List[tuple]:
+    """Temi da mariadb_init/init.sql, come nel database di produzione."""
+    try:
+        sql = INIT_SQL.read_text(encoding="utf-8")
+    except OSError:
+        return FALLBACK_THEMES
+    block = sql.split("INSERT INTO cultural_themes", 1)[-1].split(";", 1)[0]
+    themes = [(name.replace("''", "'"), description.replace("''", "'"))
+              for name, description in re.findall(r"\('((?:[^']|'')*)',\s*'((?:[^']|'')*)'\)", block)]
+    return themes or FALLBACK_THEMES
+
+def prepare_database(database_url: str, env: dict):
+    """Porta lo schema all'ultima revisione e inserisce i temi (se mancano)."""
+    subprocess.run([sys.executable, "-m", "backend.services.migrations"], cwd=SRC_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        if not connection.execute(text("SELECT COUNT(*) FROM cultural_themes")).scalar():
+            connection.execute(
+                text("INSERT INTO cultural_themes (name, description) VALUES (:name, :description)"),
+                [{"name": name, "description": description} for name, description in load_themes()],
+            )
+    engine.dispose()
+
+def start_process(args: List[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "ab")
+    return subprocess.Popen(args, cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+async def wait_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Il processo per {url} è terminato (codice {process.returncode})")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} non risponde dopo {timeout} s")
+
+# --- Misure ---
+
+class RouteStats:
+    """Latenze ed errori per route (metodo + template del percorso)."""
+
+    def __init__(self, warmup_until: float):
+        self.warmup_until = warmup_until
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route: str, started: float, seconds: float, status: str, ok: bool):
+        if started < self.warmup_until:
+            return
+        self.latencies.setdefault(route, []).append(seconds)
+        self.statuses.setdefault(route, {}).setdefault(status, 0)
+        self.statuses[route][status] += 1
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentile con il metodo nearest-rank (values ordinati)."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(stats: RouteStats, elapsed: float) -> Dict[str, dict]:
+    summary = {}
+    for route, latencies in sorted(stats.latencies.items()):
+        latencies = sorted(latencies)
+        summary[route] = {
+            "count": len(latencies),
+            "errors": stats.errors.get(route, 0),
+            "statuses": stats.statuses[route],
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return summary
+
+# --- Utente virtuale ---
+
+class VirtualUser:
+    def __init__(self, index: int, run_id: str, client: httpx.AsyncClient, stats: RouteStats, rng: random.Random, theme_ids: List[int]):
+        self.username = f"bench_{run_id}_{index}"
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.theme_ids = theme_ids
+        self.headers: Dict[str, str] = {}
+        self.created = 0
+
+    async def request(self, route: str, method: str, url: str, stream: bool = False, **kwargs) -> Optional[httpx.Response]:
+        """Esegue una richiesta e ne registra la durata (per gli stream fino all'ultimo byte)."""
+        started = time.perf_counter()
+        try:
+            if stream:
+                async with self.client.stream(method, url, headers=self.headers, **kwargs) as response:
+                    await response.aread()
+            else:
+                response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(route, started, time.perf_counter() - started, type(e).__name__, ok=False)
+            return None
+        self.stats.record(route, started, time.perf_counter() - started, str(response.status_code), ok=response.status_code < 400)
+        return response
+
+    async def register(self):
+        response = await self.request("POST /api/auth/register", "POST", "/api/auth/register", json={
+            "username": self.username, "email": f"{self.username}@culturallm.it", "password": PASSWORD,
+        })
+        if response is None or response.status_code != 200:
+            detail = "nessuna risposta" if response is None else f"{response.status_code} {response.text[:200]}"
+            raise RuntimeError(f"Registrazione di {self.username} non riuscita: {detail}")
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def login(self):
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                                      json={"username": self.username, "password": PASSWORD})
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def create_question(self):
+        self.created += 1
+        await self.request("POST /api/questions/", "POST", "/api/questions/", json={
+            "text": f"Domanda {self.created} di {self.username} sulla cultura italiana?",
+            "theme_id": self.rng.choice(self.theme_ids),
+        })
+
+    async def answer(self):
+        response = await self.request("GET /api/questions/pending/answer", "GET", "/api/questions/pending/answer",
+                                      params={"limit": 5})
+        if response is None or response.status_code != 200 or not response.json():
+            return
+        question = self.rng.choice(response.json())
+        await self.request("POST /api/answers/", "POST", "/api/answers/", json={
+            "text": f"Risposta di {self.username}: la tradizione nasce nel sud Italia.",
+            "question_id": question["id"],
+        })
+
+    async def validate(self):
+        response = await self.request("GET /api/validate/pending", "GET", "/api/validate/pending", params={"page_size": 3})
+        if response is None or response.status_code != 200 or not response.json():
+            return
+        item = response.json()[0]
+        score = self.rng.randint(0, 10)
+        await self.request("POST /api/validate/", "POST", "/api/validate/", json={
+            "answer_id": item["answer"]["id"], "score": score, "is_correct": score >= 6, "feedback": "ok",
+        })
+
+    async def feeds(self):
+        await self.request("GET /api/questions/", "GET", "/api/questions/", params={"limit": 20})
+        await self.request("GET /api/questions/themes", "GET", "/api/questions/themes")
+        await self.request("GET /api/questions/pending/answer", "GET", "/api/questions/pending/answer", params={"limit": 10})
+
+    async def leaderboard(self):
+        await self.request("GET /api/leaderboard/", "GET", "/api/leaderboard/")
+        await self.request("GET /api/leaderboard/me", "GET", "/api/leaderboard/me")
+
+    async def generate_question(self):
+        await self.request("POST /api/questions/generate/{theme_id}", "POST",
+                           f"/api/questions/generate/{self.rng.choice(self.theme_ids)}")
+
+    async def tag(self):
+        await self.request("POST /api/questions/tag", "POST", "/api/questions/tag",
+                           json={"question": f"Qual è il piatto tipico numero {self.rng.randint(1, 10**6)}?"})
+
+    async def llm_validate_text(self):
+        await self.request("POST /api/validate/llm-validate-text/stream", "POST", "/api/validate/llm-validate-text/stream",
+                           stream=True, json={"answer_text": "La pizza nasce a Napoli.", "question_text": "Dove nasce la pizza?"})
+
+    async def run(self, mix: Dict[str, int], deadline: float):
+        actions, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+
+# --- Esecuzione ---
+
+async def run_level(base_url: str, concurrency: int, duration: float, warmup: float, mix: Dict[str, int], seed: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        themes = (await client.get("/api/questions/themes")).json()
+        theme_ids = [theme["id"] for theme in themes]
+        if not theme_ids:
+            raise RuntimeError("Nessun tema nel database: le domande non possono essere create")
+
+        stats = RouteStats(warmup_until=0)
+        run_id = f"{seed}_{concurrency}_{int(time.time())}"
+        users = [VirtualUser(i, run_id, client, stats, random.Random(f"{seed}:{i}"), theme_ids) for i in range(concurrency)]
+        # Registrazioni concorrenti (sempre misurate): è il picco di inizio lezione
+        await asyncio.gather(*(user.register() for user in users))
+
+        measured_from = time.perf_counter() + warmup
+        stats.warmup_until = measured_from
+        deadline = measured_from + duration
+        await asyncio.gather(*(user.run(mix, deadline) for user in users))
+        elapsed = time.perf_counter() - measured_from
+
+    routes = summarize(stats, elapsed)
+    total = sum(route["count"] for route in routes.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_seconds": elapsed,
+        "requests": total,
+        "errors": sum(route["errors"] for route in routes.values()),
+        "throughput": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+
+def print_level(level: dict):
+    print(f"\nconcurrency={level['concurrency']}  elapsed={level['elapsed_seconds']:.1f}s  "
+          f"requests={level['requests']}  throughput={level['throughput']:.1f} req/s  errors={level['errors']}")
+    print(f"{'route':<46} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in level["routes"].items():
+        print(f"{route:<46} {stats['count']:>7} {stats['errors']:>5} {stats['throughput']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressioni rispetto a una esecuzione precedente (p95 più alto o throughput più basso oltre la tolleranza)."""
+    regressions = []
+    previous_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        previous = previous_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        for route, stats in level["routes"].items():
+            before = previous["routes"].get(route)
+            if before is None or before["count"] < 20 or stats["count"] < 20:
+                continue  # troppo pochi campioni per un confronto
+            if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"c={level['concurrency']} {route}: p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+            if stats["throughput"] < before["throughput"] * (1 - tolerance):
+                regressions.append(f"c={level['concurrency']} {route}: {before['throughput']:.1f} -> {stats['throughput']:.1f} req/s")
+        if level["errors"] > previous["errors"] and level["errors"] > level["requests"] * 0.01:
+            regressions.append(f"c={level['concurrency']}: errori {previous['errors']} -> {level['errors']}")
+    return regressions
+
+async def main(args) -> int:
+    mix = MIXES[args.mix]
+    concurrency_levels = [int(value) for value in args.concurrency.split(",")]
+    workdir = Path(tempfile.mkdtemp(prefix="culturallm-bench-"))
+    results = {"config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")}, "levels": []}
+
+    fake_ollama = None
+    if args.base_url is None and args.ollama_host is None:
+        ollama_port = free_port()
+        ollama_env = {
+            **os.environ,
+            "FAKE_OLLAMA_LATENCY": str(args.ollama_latency),
+            "FAKE_OLLAMA_TOKEN_RATE": str(args.ollama_token_rate),
+            "FAKE_OLLAMA_TOKENS": str(args.ollama_tokens),
+            "FAKE_OLLAMA_PARALLEL": str(args.ollama_parallel),
+        }
+        fake_ollama = start_process(
+            [sys.executable, "-m", "uvicorn", "benchmarks.fake_ollama:app", "--port", str(ollama_port), "--log-level", "warning"],
+            ollama_env, workdir / "fake_ollama.log",
+        )
+        ollama_host = f"http://127.0.0.1:{ollama_port}"
+        await wait_ready(f"{ollama_host}/api/tags", fake_ollama)
+    else:
+        ollama_host = args.ollama_host
+
+    try:
+        for concurrency in concurrency_levels:
+            app = None
+            base_url = args.base_url
+            if base_url is None:
+                database_url = args.database_url or f"sqlite:///{workdir / f'bench_{concurrency}.db'}"
+                app_port = free_port()
+                app_env = {
+                    **os.environ,
+                    "DATABASE_URL": database_url,
+                    "OLLAMA_HOST": ollama_host,
+                    # Il benchmark misura il backend, non i limiti per utente
+                    "QUOTA_ENABLED": "false",
+                    **dict(item.split("=", 1) for item in args.env),
+                }
+                if args.bcrypt_rounds is not None:
+                    app_env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+                prepare_database(database_url, app_env)
+                app = start_process(
+                    [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(app_port),
+                     "--workers", str(args.app_workers), "--log-level", "warning"],
+                    app_env, workdir / f"app_{concurrency}.log",
+                )
+                base_url = f"http://127.0.0.1:{app_port}"
+                await wait_ready(f"{base_url}/health", app)
+            try:
+                level = await run_level(base_url, concurrency, args.duration, args.warmup, mix, args.seed)
+            finally:
+                stop_process(app)
+            results["levels"].append(level)
+            print_level(level)
+    finally:
+        stop_process(fake_ollama)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\nRisultati salvati in {args.json}")
+    print(f"Log dei processi in {workdir}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            print(f"\nRegressioni rispetto a {args.baseline} (tolleranza {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNessuna regressione rispetto a {args.baseline}")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di carico del backend CulturaLLM")
+    parser.add_argument("--concurrency", default="1,10,50", help="livelli di concorrenza (utenti virtuali), separati da virgola")
+    parser.add_argument("--duration", type=float, default=30, help="secondi di carico per livello")
+    parser.add_argument("--warmup", type=float, default=2, help="secondi iniziali esclusi dalle statistiche")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default", help="mix di operazioni degli utenti virtuali")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="database da usare (default: un file SQLite nuovo per livello)")
+    parser.add_argument("--base-url", help="backend già avviato (non vengono avviati backend e Ollama finto)")
+    parser.add_argument("--ollama-host", help="Ollama da usare invece di quello finto")
+    parser.add_argument("--ollama-latency", type=float, default=0.05, help="secondi fissi per chiamata del finto Ollama")
+    parser.add_argument("--ollama-token-rate", type=float, default=50, help="token al secondo del finto Ollama")
+    parser.add_argument("--ollama-tokens", type=int, default=40, help="token per risposta del finto Ollama")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="richieste elaborate in parallelo dal finto Ollama")
+    parser.add_argument("--app-workers", type=int, default=1, help="processi uvicorn del backend")
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS del backend (default: quello dell'applicazione)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="variabile d'ambiente aggiuntiva per il backend")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    parser.add_argument("--baseline", help="risultati di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="peggioramento ammesso rispetto alla baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,56 @@
+# Configurazione dei test
+# I test usano un database SQLite temporaneo portato all'ultima revisione
+# con le migrazioni e svuotato prima di ogni test (restano solo i temi).
+# Le variabili d'ambiente vanno impostate prima di importare backend:
+# gli engine vengono creati all'importazione di services/database.py.
+#
+# Uso (da backend/src): python -m pytest tests
+import asyncio
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="culturallm-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import pytest
+
+from backend.models.schemas import Base, CulturalTheme
+from backend.services.database import async_engine, engine
+from backend.services.migrations import run_migrations
+
+run_migrations()
+
+THEMES = [
+    {"name": "Cucina Italiana", "description": "Tradizioni culinarie, piatti tipici, ingredienti regionali"},
+    {"name": "Sport", "description": "Calcio, altri sport, squadre e atleti italiani"},
+]
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+        connection.execute(CulturalTheme.__table__.insert(), THEMES)
+    yield
+
+@pytest.fixture
+def run():
+    """
+    Esegue una coroutine in un event loop nuovo. Alla fine chiude le
+    connessioni asincrone del pool, legate all'event loop che le ha aperte.
+    """
+    def run(coroutine):
+        async def main():
+            try:
+                # La prima connessione di un pool (ricreato da dispose) esegue
+                # gli eventi di connessione sotto un lock tra thread: aperta
+                # prima della coroutine, così connessioni concorrenti non vi
+                # restano bloccate
+                async with async_engine.connect():
+                    pass
+                return await coroutine
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,35 @@
+# Creazione dei dati dei test con l'engine sincrono (stesso database degli endpoint)
+from backend.models.schemas import Answer, CulturalTheme, Question, User
+from backend.services.database import SessionLocal
+from backend.services.principal_cache import Principal
+
+def _save(obj):
+    with SessionLocal() as db:
+        db.add(obj)
+        db.commit()
+        db.refresh(obj)
+        db.expunge(obj)
+    return obj
+
+def theme_id(name: str = "Cucina Italiana") -> int:
+    with SessionLocal() as db:
+        return db.query(CulturalTheme.id).filter(CulturalTheme.name == name).scalar()
+
+def create_user(username: str, score: int = 0) -> User:
+    return _save(User(
+        username=username,
+        email=f"{username}@culturallm.it",
+        hashed_password="not-a-real-hash",
+        score=score,
+        is_active=True,
+    ))
+
+def create_question(creator: User, text: str = "Qual è il piatto tipico di Napoli?", tag: str = None) -> Question:
+    return _save(Question(text=text, creator_id=creator.id, theme_id=theme_id(), is_active=True, tag=tag))
+
+def create_answer(question: Question, user: User = None, text: str = "La pizza margherita") -> Answer:
+    """Risposta di `user`, oppure la risposta AI della domanda se `user` è None."""
+    return _save(Answer(text=text, question_id=question.id, user_id=user.id if user else None, is_llm_answer=user is None))
+
+def principal(user: User) -> Principal:
+    return Principal.from_user(user)
@@ -0,0 +1,39 @@
+# Autenticazione: un utente disattivato viene rifiutato anche se il suo
+# principal è già nella cache
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from backend.models.schemas import User
+from backend.routers.auth import create_access_token, get_current_user, get_optional_user
+from backend.services.database import AsyncSessionLocal
+from backend.services.principal_cache import principal_cache
+
+from tests.factories import create_user
+
+def credentials(username: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": username}))
+
+def test_deactivated_user_is_refused(run):
+    user = create_user("mario")
+    principal_cache.clear()
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            # La prima richiesta mette il principal in cache
+            principal = await get_current_user(credentials("mario"), db)
+            assert principal.id == user.id and principal.is_active
+
+            db_user = await db.get(User, user.id)
+            db_user.is_active = False
+            await db.commit()
+
+            with pytest.raises(HTTPException) as refused:
+                await get_current_user(credentials("mario"), db)
+            with pytest.raises(HTTPException) as refused_optional:
+                await get_optional_user(credentials("mario"), db)
+            return refused.value, refused_optional.value
+
+    refused, refused_optional = run(scenario())
+    assert refused.status_code == 403
+    assert refused_optional.status_code == 403
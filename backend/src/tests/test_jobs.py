@@ -0,0 +1,52 @@
+# Coda dei job: un Ollama non disponibile (LLMAdmissionError) rinvia il job
+# senza consumarne i tentativi, gli altri errori li consumano
+from sqlalchemy import select
+
+from backend.models.schemas import Job
+from backend.services.database import AsyncSessionLocal
+from backend.services.jobs import FAILED, PENDING, JobQueue
+from backend.services.llm_admission import LLMUnavailableError
+
+def make_queue(error: Exception) -> JobQueue:
+    queue = JobQueue()
+
+    @queue.handler("test_job")
+    async def failing_job(payload: dict, db) -> dict:
+        raise error
+
+    return queue
+
+async def enqueue_and_run(queue: JobQueue, runs: int) -> Job:
+    async with AsyncSessionLocal() as db:
+        job = await queue.enqueue(db, "test_job", {}, dedup_key="test_job:1", max_attempts=2)
+    for _ in range(runs):
+        assert await queue.run_once()
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Job).where(Job.id == job.id))).scalars().one()
+
+def test_admission_errors_do_not_use_up_attempts(run):
+    # retry_after=0: il job è subito di nuovo eseguibile
+    queue = make_queue(LLMUnavailableError("Circuito aperto", retry_after=0))
+    job = run(enqueue_and_run(queue, runs=5))
+
+    assert job.status == PENDING
+    assert job.attempts == 0
+    assert job.last_error == "Circuito aperto"
+
+def test_other_errors_use_up_attempts(run):
+    queue = make_queue(RuntimeError("risposta non valida"))
+
+    async def scenario():
+        job = await enqueue_and_run(queue, runs=1)
+        # Salta il backoff
+        async with AsyncSessionLocal() as db:
+            stored = await db.get(Job, job.id)
+            stored.run_after = stored.created_at
+            await db.commit()
+        assert await queue.run_once()
+        async with AsyncSessionLocal() as db:
+            return await db.get(Job, job.id)
+
+    job = run(scenario())
+    assert job.status == FAILED
+    assert job.attempts == 2
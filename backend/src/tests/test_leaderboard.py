@@ -0,0 +1,22 @@
+# Classifica: il numero di posizioni restituite è limitato a MAX_PAGE_SIZE
+from backend.models.schemas import User
+from backend.routers.leaderboard import get_leaderboard
+from backend.services.database import AsyncSessionLocal, SessionLocal
+from backend.utils.pagination import MAX_PAGE_SIZE
+
+def test_leaderboard_limit_is_clamped(run):
+    with SessionLocal() as db:
+        db.add_all(
+            User(username=f"utente{index}", email=f"utente{index}@culturallm.it",
+                 hashed_password="not-a-real-hash", score=index, is_active=True)
+            for index in range(MAX_PAGE_SIZE + 5)
+        )
+        db.commit()
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            return await get_leaderboard(limit=10 ** 6, db=db)
+
+    leaderboard = run(scenario())
+    assert len(leaderboard) == MAX_PAGE_SIZE
+    assert leaderboard[0].score == MAX_PAGE_SIZE + 4
@@ -0,0 +1,55 @@
+# Indice della classifica: i punti arrivano come incrementi, quindi l'ordine
+# degli aggiornamenti non conta; gli utenti aggiornati durante una
+# ricostruzione vengono riletti dal database
+import asyncio
+import random
+
+from sqlalchemy import update
+
+from backend.models.schemas import User
+from backend.services.database import engine
+from backend.services.leaderboard_index import LeaderboardIndex, MemoryLeaderboard
+
+from tests.factories import create_user
+
+def test_points_arriving_out_of_order_give_the_final_score(run):
+    alice, bruno = create_user("alice", score=50), create_user("bruno", score=60)
+    index = LeaderboardIndex(backend=MemoryLeaderboard(), resync_interval=0)
+    awards = [(alice.id, 10), (alice.id, 5), (bruno.id, 3), (alice.id, 14), (bruno.id, 10)]
+    random.Random(7).shuffle(awards)
+
+    async def scenario():
+        await index.rebuild()
+        await asyncio.gather(*(index.add_points(user_id, points) for user_id, points in awards))
+        return await index.top(10)
+
+    assert run(scenario()) == [(1, alice.id, 79), (2, bruno.id, 73)]
+
+class SlowReplace(MemoryLeaderboard):
+    """Backend che, durante la ricostruzione, esegue `during_replace` prima di sostituire l'indice."""
+
+    def __init__(self, during_replace):
+        super().__init__()
+        self.during_replace = during_replace
+
+    async def replace(self, entries):
+        entries = list(entries)
+        await self.during_replace()
+        await super().replace(entries)
+
+def test_points_awarded_during_a_rebuild_are_not_lost(run):
+    user = create_user("alice", score=10)
+
+    async def award_points():
+        # Validazione committata dopo la lettura della ricostruzione
+        with engine.begin() as connection:
+            connection.execute(update(User).where(User.id == user.id).values(score=User.score + 5))
+        await index.add_points(user.id, 5)
+
+    index = LeaderboardIndex(backend=SlowReplace(award_points), resync_interval=0)
+
+    async def scenario():
+        await index.rebuild()
+        return await index.top(10)
+
+    assert run(scenario()) == [(1, user.id, 15)]
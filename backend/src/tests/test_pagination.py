@@ -0,0 +1,48 @@
+# Paginazione a cursore: scorrendo le pagine si ottengono tutte le righe,
+# anche quelle create nello stesso secondo (created_at uguale)
+from datetime import datetime
+
+from fastapi import Response
+from sqlalchemy import text
+
+from backend.routers.question import get_questions
+from backend.services.database import AsyncSessionLocal, engine
+from backend.utils.pagination import NEXT_CURSOR_HEADER
+
+from tests.factories import create_question, create_user
+
+def all_pages(run, limit: int):
+    """Scorre le pagine di GET /api/questions seguendo X-Next-Cursor; restituisce gli id letti."""
+    async def fetch():
+        ids, cursor = [], None
+        async with AsyncSessionLocal() as db:
+            while True:
+                response = Response()
+                page = await get_questions(response, limit=limit, theme_id=None, cursor=cursor, skip=0, db=db)
+                ids.extend(question.id for question in page)
+                cursor = response.headers.get(NEXT_CURSOR_HEADER)
+                if not cursor:
+                    return ids
+    return run(fetch())
+
+def test_pages_include_rows_created_in_the_same_second(run):
+    creator = create_user("autore")
+    created = [create_question(creator, text=f"Domanda {index}?").id for index in range(10)]
+    # Come li scrive server_default=func.now(): stesso secondo, senza frazioni
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE questions SET created_at = '2026-10-17 12:00:00'"))
+
+    assert all_pages(run, limit=3) == created
+
+def test_pages_follow_created_at_then_id_with_mixed_precision(run):
+    creator = create_user("autore")
+    created = [create_question(creator, text=f"Domanda {index}?").id for index in range(7)]
+    timestamps = ["2026-10-17 12:00:01", "2026-10-17 12:00:00", "2026-10-17 12:00:00.250000",
+                  "2026-10-17 12:00:00", "2026-10-17 12:00:02", "2026-10-17 12:00:01", "2026-10-17 12:00:00"]
+    with engine.begin() as connection:
+        for question_id, created_at in zip(created, timestamps):
+            connection.execute(text("UPDATE questions SET created_at = :created_at WHERE id = :id"),
+                               {"created_at": created_at, "id": question_id})
+
+    expected = [question_id for _, question_id in sorted((datetime.fromisoformat(ts), qid) for ts, qid in zip(timestamps, created))]
+    assert all_pages(run, limit=2) == expected
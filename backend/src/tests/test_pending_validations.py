@@ -0,0 +1,67 @@
+# Il feed delle validazioni pendenti esegue un numero fisso di query,
+# qualunque sia il numero di risposte restituite (niente N+1)
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from backend.routers.validate import PENDING_MAX_PAGE_SIZE, get_pending_validations
+from backend.services.database import AsyncSessionLocal, async_engine
+
+from tests.factories import create_answer, create_question, create_user, principal
+
+# Lease: rinnovo, candidati e prelievo, una seconda ricerca di candidati (vuota
+# se la coda ha meno risposte della pagina), lettura degli id; poi una sola
+# query per risposte, domande, temi e risposte AI
+MAX_QUERIES = 6
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+def pending_feed(validator, answer_count: int, run, prefix: str = "autore"):
+    """Crea `answer_count` risposte (ciascuna con la risposta AI) e legge il feed del validatore."""
+    for index in range(answer_count):
+        author = create_user(f"{prefix}{index}")
+        question = create_question(author, text=f"Domanda {index}?")
+        create_answer(question)
+        create_answer(question, author, text=f"Risposta {index}")
+
+    async def fetch():
+        async with AsyncSessionLocal() as db:
+            with count_queries() as statements:
+                feed = await get_pending_validations(
+                    page_size=PENDING_MAX_PAGE_SIZE, current_user=principal(validator), db=db
+                )
+                serialized = [item.model_dump() for item in feed]
+        return serialized, statements
+
+    return run(fetch())
+
+def test_pending_feed_query_count_does_not_grow_with_answers(run):
+    validator = create_user("validatore")
+    few, few_statements = pending_feed(validator, 2, run, prefix="primo")
+    # Il secondo feed contiene anche le 2 risposte già in lease al validatore
+    many, many_statements = pending_feed(validator, 30, run, prefix="secondo")
+
+    assert len(few) == 2
+    assert len(many) == 32
+    assert len(few_statements) <= MAX_QUERIES
+    assert len(many_statements) == len(few_statements)
+
+def test_pending_feed_includes_question_theme_and_llm_answer(run):
+    validator = create_user("validatore")
+    feed, _ = pending_feed(validator, 3, run)
+
+    for item in feed:
+        assert item["question"]["theme"]["name"] == "Cucina Italiana"
+        assert item["llm_answer"]["is_llm_answer"]
+        assert item["llm_answer"]["question_id"] == item["answer"]["question_id"]
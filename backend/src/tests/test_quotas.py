@@ -0,0 +1,81 @@
+# Quote delle chiamate al modello: bucket di chiamante, indirizzo IP ed
+# endpoint scalati insieme, costo per elemento negli endpoint multipli
+import pytest
+
+from backend.services.quotas import BucketLimit, MemoryQuotaBackend, QuotaCostTooHigh, QuotaExceeded, QuotaManager
+
+LIMITS = {
+    "user": BucketLimit(per_minute=60, burst=5),
+    "ip": BucketLimit(per_minute=60, burst=8),
+    "endpoint": BucketLimit(per_minute=600, burst=100),
+}
+
+def quota_manager() -> QuotaManager:
+    return QuotaManager(backend=MemoryQuotaBackend(), enabled=True, limits=LIMITS)
+
+def test_accounts_from_the_same_ip_share_the_ip_bucket(run):
+    quotas = quota_manager()
+
+    async def scenario():
+        # Due account dallo stesso indirizzo: 4 + 4 chiamate esauriscono il bucket dell'IP (8)
+        for user_id in (1, 2):
+            for _ in range(4):
+                await quotas.charge("questions.tag", user_id=user_id, ip="10.0.0.1")
+        with pytest.raises(QuotaExceeded) as exceeded:
+            await quotas.charge("questions.tag", user_id=3, ip="10.0.0.1")
+        # Un altro indirizzo non è limitato
+        await quotas.charge("questions.tag", user_id=3, ip="10.0.0.2")
+        return exceeded.value
+
+    exceeded = run(scenario())
+    assert exceeded.scope == "ip"
+
+def test_user_bucket_applies_across_ips(run):
+    quotas = quota_manager()
+
+    async def scenario():
+        for index in range(5):
+            await quotas.charge("questions.tag", user_id=1, ip=f"10.0.0.{index}")
+        with pytest.raises(QuotaExceeded) as exceeded:
+            await quotas.charge("questions.tag", user_id=1, ip="10.0.0.99")
+        return exceeded.value
+
+    assert run(scenario()).scope == "user"
+
+def test_multi_item_requests_are_charged_per_item(run):
+    quotas = quota_manager()
+
+    async def scenario():
+        # 3 + 3 risposte superano la capacità del bucket del chiamante (5)
+        await quotas.charge("validate.llm_bulk", user_id=1, ip="10.0.0.1", items=3)
+        with pytest.raises(QuotaExceeded) as exceeded:
+            await quotas.charge("validate.llm_bulk", user_id=1, ip="10.0.0.2", items=3)
+        return exceeded.value
+
+    exceeded = run(scenario())
+    assert exceeded.scope == "user"
+    # Da 2 gettoni a 3 a un gettone al secondo
+    assert 0.9 < exceeded.retry_after <= 1
+
+def test_oversized_requests_do_not_overdraw_buckets(run):
+    # Il bucket del chiamante è ampio: il limite viene dal bucket dell'IP (8)
+    limits = {**LIMITS, "user": BucketLimit(per_minute=60, burst=1000)}
+    backend = MemoryQuotaBackend()
+    quotas = QuotaManager(backend=backend, enabled=True, limits=limits)
+
+    async def scenario():
+        with pytest.raises(QuotaCostTooHigh) as too_high:
+            await quotas.charge("validate.llm_bulk", user_id=1, ip="10.0.0.1", items=1000)
+        # La richiesta rifiutata non ha scalato nulla: un altro utente dallo
+        # stesso indirizzo usa l'intera quota dell'IP
+        await quotas.charge("validate.llm_bulk", user_id=2, ip="10.0.0.1", items=8)
+        with pytest.raises(QuotaExceeded):
+            await quotas.charge("validate.llm_bulk", user_id=1, ip="10.0.0.1", items=8)
+        return too_high.value
+
+    too_high = run(scenario())
+    assert too_high.max_items == quotas.max_items("validate.llm_bulk") == 8
+    levels = {key: tokens for key, (tokens, _, _) in backend._buckets.items()}
+    assert levels["ip:10.0.0.1"] >= 0
+    assert levels["endpoint:validate.llm_bulk"] >= 0
+    assert min(levels.values()) >= 0
@@ -0,0 +1,31 @@
+# Cache dei temi: una invalidate() concorrente con get() non deve far fallire
+# la lettura, che ricarica i temi dal database
+from sqlalchemy import insert
+
+from backend.models.schemas import CulturalTheme
+from backend.services.database import engine
+from backend.services.reference_cache import ThemeCache
+
+UNKNOWN_THEME_ID = 10 ** 6
+
+def test_get_after_concurrent_invalidate_reloads(run):
+    cache = ThemeCache(ttl=300, miss_reload_interval=300)
+    ensure_fresh = cache._ensure_fresh
+
+    async def ensure_fresh_then_invalidate():
+        await ensure_fresh()
+        # Tema inserito (e cache invalidata) da un'altra richiesta mentre get() attendeva
+        with engine.begin() as connection:
+            connection.execute(insert(CulturalTheme).values(name="Gestualità", description="Gesti tipici"))
+        cache.invalidate()
+
+    async def scenario():
+        await cache.load()
+        cache._ensure_fresh = ensure_fresh_then_invalidate
+        missing = await cache.get(UNKNOWN_THEME_ID)
+        return missing, [theme.name for theme in cache._themes]
+
+    missing, names = run(scenario())
+    assert missing is None
+    assert "Gestualità" in names
+    assert cache.stats()["loads"] == 2
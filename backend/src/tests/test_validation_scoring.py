@@ -0,0 +1,49 @@
+# Punteggi assegnati dalle validazioni: con molte validazioni concorrenti
+# (anche sulla stessa risposta e per lo stesso autore) nessun punto va perso
+import asyncio
+
+from sqlalchemy import select
+
+from backend.models.schemas import User, Validation, ValidationCreate
+from backend.routers.validate import create_validation
+from backend.services.database import AsyncSessionLocal, SessionLocal
+
+from tests.factories import create_answer, create_question, create_user, principal
+
+def test_concurrent_validations_award_every_point(run):
+    author = create_user("autore", score=0)
+    questions = [create_question(author, text=f"Domanda {index}?") for index in range(3)]
+    answers = [create_answer(question, author, text=f"Risposta {index}") for index, question in enumerate(questions)]
+    validators = [create_user(f"validatore{index}", score=0) for index in range(12)]
+
+    # Ogni validatore valuta tutte le risposte, con esiti e punteggi diversi
+    requests = [
+        (validator, ValidationCreate(
+            answer_id=answer.id,
+            score=float(5 + (v_index + a_index) % 6),
+            is_correct=(v_index + a_index) % 4 != 0,
+            feedback=None,
+        ))
+        for v_index, validator in enumerate(validators)
+        for a_index, answer in enumerate(answers)
+    ]
+    expected = {user.id: 0 for user in [author, *validators]}
+    for validator, request in requests:
+        expected[validator.id] += 10 if request.is_correct else 5
+        if request.is_correct and request.score >= 7:
+            expected[author.id] += int(request.score * 2)
+
+    async def validate(validator, request):
+        async with AsyncSessionLocal() as db:
+            await create_validation(request, current_user=principal(validator), db=db)
+
+    async def scenario():
+        await asyncio.gather(*(validate(validator, request) for validator, request in requests))
+
+    run(scenario())
+
+    with SessionLocal() as db:
+        scores = dict(db.execute(select(User.id, User.score)).all())
+        validations = db.execute(select(Validation)).scalars().all()
+    assert len(validations) == len(requests)
+    assert scores == expected